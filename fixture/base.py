@@ -4,7 +4,7 @@
 The more useful bits are in :mod:`fixture.loadable`
 
 """
-import sys, traceback
+import sys, traceback, atexit
 try:
     from functools import wraps
 except ImportError:
@@ -33,12 +33,17 @@ class FixtureData(object):
     data.
     
     Typically this is attached to a concrete Fixture class and constructed by ``data = fixture.data(...)``
+    
+    ``self.worker`` is the name of the worker process the data is loaded 
+    in when tests run in parallel, or None.  See :func:`fixture.parallel.current_worker`.
     """
     def __init__(self, datasets, dataclass, loader):
         self.datasets = datasets
         self.dataclass = dataclass
         self.loader = loader
         self.data = None # instance of dataclass
+        from fixture.parallel import current_worker
+        self.worker = current_worker()
 
     def __enter__(self):
         """enter a with statement block.
@@ -65,6 +70,9 @@ class FixtureData(object):
 
     def setup(self):
         """load all datasets, populating self.data."""
+        prepare_load = getattr(self.loader, 'prepare_load', None)
+        if prepare_load is not None:
+            prepare_load(self.datasets)
         self.data = self.dataclass(*[
                     ds.shared_instance( default_refclass=self.dataclass ) \
                         for ds in iter(self.datasets)])
@@ -73,6 +81,19 @@ class FixtureData(object):
     def teardown(self):
         """unload all datasets."""
         self.loader.unload()
+    
+    def savepoint(self):
+        """begin a savepoint in the loader's transaction.
+        
+        Returns an object whose ``rollback()`` undoes anything written since, 
+        or None if the loader does not support savepoints.
+        """
+        savepoint = getattr(self.loader, 'savepoint', None)
+        if savepoint is None:
+            return None
+        return savepoint()
+
+SCOPES = ('class', 'module')
 
 class Fixture(object):
     """An environment for loading data.
@@ -92,6 +113,9 @@ class Fixture(object):
     dataclass = SuperSet
     loader = None
     Data = FixtureData
+    # (scope, key, datasets, FixtureData) of what scoped_data() loaded :
+    _scoped = None
+    _scoped_teardown_registered = False
                 
     def __init__(self, dataclass=None, loader=None):
         if dataclass:
@@ -117,12 +141,23 @@ class Fixture(object):
             optional callable to be executed before test
         teardown
             optional callable to be executed (finally) after test
+        scope
+            None (the default) to load and unload data around each test.  
+            ``'module'`` to load data once for all tests of the module (or 
+            ``'class'`` for all test methods of the class) that are decorated 
+            with the same datasets; see :meth:`scoped_data`.  Each test then 
+            runs inside a savepoint that is rolled back afterwards, if the 
+            loader supports it.
 
         """
         from nose.tools import with_setup
 
         setup = cfg.get('setup', None)
         teardown = cfg.get('teardown', None)
+        scope = cfg.get('scope', None)
+        if scope is not None and scope not in SCOPES:
+            raise ValueError(
+                "scope must be one of %s, not %r" % (SCOPES, scope))
 
         def decorate_with_data(routine):
             # passthrough an already decorated routine:
@@ -140,16 +175,33 @@ class Fixture(object):
             else:
                 passthru_teardown = teardown
             
-            def setup_data():
-                data = self.data(*datasets)
-                data.setup()
+            savepoints = []
+            def setup_data(*a):
+                if scope is None:
+                    data = self.data(*datasets)
+                    data.setup()
+                    return data
+                if scope == 'class':
+                    if not a:
+                        raise ValueError(
+                            "scope='class' can only be used on test methods")
+                    key = a[0].__class__
+                else:
+                    key = routine.__module__
+                data = self.scoped_data(datasets, scope, key)
+                savepoints.append(data.savepoint())
                 return data
             def teardown_data(data):
-                data.teardown()
+                if scope is None:
+                    data.teardown()
+                    return
+                savepoint = savepoints.pop()
+                if savepoint is not None:
+                    savepoint.rollback()
         
             @wraps(routine)
             def call_routine(*a,**kw):
-                data = setup_data()
+                data = setup_data(*a)
                 try:
                     routine(data, *a, **kw)
                 except KeyboardInterrupt:
@@ -219,4 +271,63 @@ class Fixture(object):
     def data(self, *datasets):
         """returns a :class:`FixtureData` object for datasets."""
         return self.Data(datasets, self.dataclass, self.loader)
+    
+    def scoped_data(self, datasets, scope, key):
+        """returns a :class:`FixtureData` object for datasets that is loaded 
+        once and shared by all tests of a scope.
+        
+        scope is ``'class'`` or ``'module'`` and key identifies the class or 
+        module, i.e. the test class itself or its module name.  The data is 
+        loaded the first time it is asked for and stays loaded until 
+        :meth:`teardown_scoped_data` is called for it, or until the 
+        interpreter exits.  Since a loader keeps track of one load at a time, 
+        asking for data of any other scope, key or datasets tears down the 
+        data loaded before.
+        
+        Tests share the data, so they should not change it unless they run in 
+        a :meth:`savepoint <FixtureData.savepoint>`.
+        """
+        if scope not in SCOPES:
+            raise ValueError(
+                "scope must be one of %s, not %r" % (SCOPES, scope))
+        datasets = tuple(datasets)
+        if (self._scoped is not None 
+                and self._scoped[:3] == (scope, key, datasets)):
+            return self._scoped[3]
+        self.teardown_scoped_data()
+        data = self.data(*datasets)
+        data.setup()
+        self._scoped = (scope, key, datasets, data)
+        if not self._scoped_teardown_registered:
+            # the last data loaded is not replaced by anything :
+            atexit.register(self._teardown_scoped_data_at_exit)
+            self._scoped_teardown_registered = True
+        return data
+    
+    def teardown_scoped_data(self, scope=None, key=None):
+        """tears down data loaded by :meth:`scoped_data`.
+        
+        By default, all data of this fixture is torn down.  Otherwise only 
+        data of scope (and key) is.  Whatever is still loaded when the 
+        interpreter exits is torn down then.
+        """
+        if self._scoped is None:
+            return
+        loaded_scope, loaded_for, datasets, data = self._scoped
+        if scope is not None and loaded_scope != scope:
+            return
+        if key is not None and loaded_for != key:
+            return
+        self._scoped = None
+        data.teardown()
+    
+    def _teardown_scoped_data_at_exit(self):
+        try:
+            self.teardown_scoped_data()
+        except:
+            t_ident = ("-----[exception in teardown %s]-----" % 
+                        hex(id(self.teardown_scoped_data)))
+            sys.stderr.write("\n\n%s\n" % t_ident)
+            traceback.print_exc()
+            sys.stderr.write("%s\n\n" % t_ident)
         
\ No newline at end of file
@@ -6,8 +6,9 @@ See :ref:`Using the fixture command <using-fixture-command>` for examples.
 
 """
 
-import sys, os, optparse, inspect, pkg_resources
+import sys, os, optparse, inspect, pkg_resources, threading, Queue
 from warnings import warn
+from StringIO import StringIO
 from fixture.command.generate.template import templates, is_template
 handler_registry = []
 
@@ -29,6 +30,50 @@ def register_handler(handler):
 def clear_handlers():
     handler_registry[:] = []
 
+class OrderedSet(object):
+    """a set of keys that remembers the order they were pushed in.
+    
+    pushing a key that is already in the set moves it to the end.  
+    Keys are kept in a dict of doubly linked [key, prev, next] nodes so 
+    that push() and remove() take constant time.
+    """
+    def __init__(self, keys=()):
+        self.end = end = []
+        end.extend([None, end, end])
+        self.map = {}
+        for key in keys:
+            self.push(key)
+    
+    def __contains__(self, key):
+        return key in self.map
+    
+    def __iter__(self):
+        end = self.end
+        curr = end[2]
+        while curr is not end:
+            yield curr[0]
+            curr = curr[2]
+    
+    def __len__(self):
+        return len(self.map)
+    
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+    
+    def push(self, key):
+        """adds key to the end, moving it there if it exists."""
+        if key in self.map:
+            self.remove(key)
+        end = self.end
+        last = end[1]
+        last[2] = end[1] = self.map[key] = [key, last, end]
+    
+    def remove(self, key):
+        """removes key, raising KeyError if it does not exist."""
+        key, prev, next = self.map.pop(key)
+        prev[2] = next
+        next[1] = prev
+
 class FixtureCache(object):
     """cache of Fixture objects and their data sets to be generatred.
     
@@ -39,14 +84,21 @@ class FixtureCache(object):
     and an offer set that requires category foo, the second one loaded 
     needs to acknowledge that foo is already loaded and needs to obtain 
     the key to that fixture too, to generate the right link.
+    
+    Once a set is added it is released (see FixtureSet.release()); only 
+    its data_dict and the key used to link to it are kept until the 
+    DataSet class of its fxtid is written and pop() drops them.
     """
     def __init__(self):
         self.registry = {}
-        self.order_of_appearence = []
+        self.order_of_appearence = OrderedSet()
     
     def add(self, set):
         fxtid = set.obj_id()        
         self.push_fxtid(fxtid)
+        if set.data is None:
+            # released, so it has been added already
+            return
         if not self.registry.has_key(fxtid):
             self.registry[fxtid] = {}
         
@@ -56,15 +108,16 @@ class FixtureCache(object):
         # the same id will always be identical 
         # (which should be true for db fixtures)
         self.registry[fxtid][set.set_id()] = set
+        set.release()
     
     def push_fxtid(self, fxtid):
-        o = self.order_of_appearence
-        # keep pushing names, but keep the list unique...
-        try:
-            o.remove(fxtid)
-        except ValueError:
-            pass
-        o.append(fxtid)
+        # keep pushing names, but keep the order unique...
+        self.order_of_appearence.push(fxtid)
+    
+    def pop(self, fxtid):
+        """removes fxtid and returns its sets, keyed by set id."""
+        self.order_of_appearence.remove(fxtid)
+        return self.registry.pop(fxtid)
 
 class DataSetGenerator(object):
     """produces a callable object that can generate DataSet code.
@@ -74,17 +127,23 @@ class DataSetGenerator(object):
         
     def __init__(self, options, template=None):
         self.handler = None
+        self.handlers = {}
         self.options = options
         self.cache = FixtureCache()
+        self._lock = threading.Lock()
+        self.stream = None
+        # handlers still extracting sets :
+        self.running = []
+        # fxtids whose DataSet class has been written :
+        self.written = set()
+        self.imports_written = None
         if template:
             self.template = template
     
-    def get_handler(self, object_path, obj=None, importable=True, **kw):
-        """find and return a handler for object_path.
-        
-        any additional keywords will be passed into the handler's constructor
-        """            
-        handler = None
+    def find_handler_class(self, object_path, obj=None):
+        """returns the first registered handler that recognizes object_path 
+        or None.
+        """
         for h in handler_registry:
             try:
                 recognizes_obj = h.recognizes(object_path, obj=obj)
@@ -92,9 +151,18 @@ class DataSetGenerator(object):
                 warn("%s is unsupported (%s)" % (h, e))
                 continue
             if recognizes_obj:
-                handler = h(object_path, self.options, 
-                            obj=obj, template=self.template, **kw)
-                break
+                return h
+    
+    def get_handler(self, object_path, obj=None, importable=True, **kw):
+        """find and return a handler for object_path.
+        
+        any additional keywords will be passed into the handler's constructor
+        """            
+        handler = None
+        h = self.find_handler_class(object_path, obj=obj)
+        if h is not None:
+            handler = h(object_path, self.options, 
+                        obj=obj, template=self.template, **kw)
         if handler is None:
             raise UnrecognizedObject, (
                     "no handler recognizes object %s at %s (importable? %s); "
@@ -125,69 +193,277 @@ class DataSetGenerator(object):
             obj = None
         return importable, obj
     
-    def code(self):
-        """builds and returns code string.
+    def resolve_env(self, env):
+        """resolves all objects in env modules that a handler recognizes.
+        
+        returns a list of (object_path, importable, <object>) tuples.  
+        Only objects declared in the module itself are considered.
         """
-        tpl = {'fxt_type': self.handler.fxt_type()}
-        
-        code = [self.template.header(self.handler)]
-        o = [k for k in self.cache.order_of_appearence]
-        o.reverse()
-        for kls in o:
-            datadef = self.template.DataDef()
-            tpl['data'] = []
-            tpl['fxt_class'] = self.handler.mk_class_name(kls)
-            
-            val_dict = self.cache.registry[kls]
-            for k,fset in val_dict.items():
-                key = fset.mk_key()
-                data = self.handler.resolve_data_dict(datadef, fset)
-                tpl['data'].append((key, self.template.dict(data)))
-                
-            tpl['meta'] = "\n        ".join(datadef.meta(kls))
-            tpl['data_header'] = "\n        ".join(datadef.data_header) + "\n"
-            tpl['data'] = self.template.data(tpl['data'])
-            code.append(self.template.render(tpl))
+        resolved = []
+        for modpath in env:
+            importable, mod = self.resolve_object_path(modpath)
+            if not importable:
+                raise UnrecognizedObject(
+                                "could not import --env=%s" % modpath)
+            for name in dir(mod):
+                obj = getattr(mod, name)
+                if getattr(obj, '__module__', None) != mod.__name__:
+                    continue
+                object_path = "%s.%s" % (modpath, name)
+                try:
+                    h = self.find_handler_class(object_path, obj=obj)
+                except NotImplementedError:
+                    continue
+                if h is not None:
+                    resolved.append((object_path, True, obj))
+        return resolved
+    
+    def code(self, stream=None):
+        """writes the DataSet classes of all sets left in the cache to 
+        stream.
+        
+        If stream is None, returns the code string.
+        """
+        if stream is None:
+            stream = StringIO()
+            self.code(stream)
+            return stream.getvalue()
+        self.write_complete(stream, running=[])
+    
+    def links_of(self, kls):
+        """returns the fxtids that sets of kls link to, other than kls."""
+        links = set()
+        for fset in self.cache.registry[kls].values():
+            for v in fset.data_dict.values():
+                if isinstance(v, FixtureSet):
+                    links.add(v.obj_id())
+        links.discard(kls)
+        return links
+    
+    def write_complete(self, stream, running):
+        """writes the DataSet class of every fxtid in the cache that none 
+        of the handlers in running can add sets to.
+        
+        a class is written after the classes it links to, so a class 
+        linking to one that is not complete yet waits for it.  Once 
+        nothing is running, classes that link to each other are written 
+        in the order they appeared.
+        """
+        linked = set()
+        for handler in running:
+            obj_ids = handler.linked_obj_ids()
+            if obj_ids is None:
+                # any class could still get sets
+                return
+            linked.update(obj_ids)
+        pending = [k for k in self.cache.order_of_appearence 
+                                                    if k not in linked]
+        pending.reverse()
+        while pending:
+            ready = [k for k in pending if not (
+                            self.links_of(k) - self.written)]
+            if not ready:
+                if running:
+                    break
+                ready = pending
+            for kls in ready:
+                self.write_class(stream, kls)
+            pending = [k for k in pending if k not in self.written]
+    
+    def write_class(self, stream, kls):
+        """renders the DataSet class for the sets of kls and writes it to 
+        stream, after the import lines it needs.
+        
+        the sets of kls are then dropped from the cache.
+        """
+        handler = self.handlers.get(kls, self.handler)
+        header = None
+        if self.imports_written is None:
+            # the first class, some templates get ready to render in header()
+            header = self.template.header(self.handler)
+        tpl = {'fxt_type': handler.fxt_type()}
+        datadef = self.template.DataDef()
+        tpl['data'] = []
+        tpl['fxt_class'] = handler.mk_class_name(kls)
+        
+        val_dict = self.cache.pop(kls)
+        for k,fset in val_dict.items():
+            key = fset.mk_key()
+            # also adds the imports of fset and the sets it links to :
+            data = handler.resolve_data_dict(datadef, fset)
+            tpl['data'].append((key, self.template.dict(data)))
             
-        code = "\n".join(self.template.import_header + code)
-        return code
+        tpl['meta'] = "\n        ".join(datadef.meta(kls))
+        tpl['data_header'] = "\n        ".join(datadef.data_header) + "\n"
+        tpl['data'] = self.template.data(tpl['data'])
+        self.template.write_data(tpl)
+        code = self.template.render(tpl)
+        
+        import_header = self.template.import_header
+        if header is not None:
+            stream.write("\n".join(import_header + [header]))
+        elif len(import_header) > self.imports_written:
+            stream.write("\n" + "\n".join(
+                                    import_header[self.imports_written:]))
+        self.imports_written = len(import_header)
+        stream.write("\n" + code)
+        self.written.add(kls)
+    
+    def cache_set(self, s, handler):
+        """adds set s and all sets linked to it to the cache."""
+        if s.obj_id() in self.written:
+            raise HandlerException(
+                "the DataSet class of %s was written before all of its sets "
+                "were found; %s.linked_obj_ids() should include it" % (
+                                                    s.obj_id(), handler))
+        self.cache.add(s)
+        self.handlers.setdefault(s.obj_id(), handler)
+        for (k,v) in s.data_dict.items():
+            if isinstance(v, FixtureSet):
+                f_set = v
+                self.cache_set(f_set, handler)
     
-    def __call__(self, object_path, setup_callbacks=None):
-        """uses data obj to generate code for a fixture.
+    def extract(self, handler):
+        """queries handler for its sets.
+        
+        each set is added to the cache as soon as the handler yields it.  
+        Once the handler is done, the DataSet classes that no other 
+        running handler can add sets to are written to the stream, if 
+        there is one.  Returns None or the exc_info of a failed query.
+        """
+        try:
+            try:
+                handler.findall(self.options.where)
+                for s in handler.sets():
+                    self._lock.acquire()
+                    try:
+                        self.cache_set(s, handler)
+                    finally:
+                        self._lock.release()
+            except:
+                handler.rollback()
+                raise
+            else:
+                handler.commit()
+        except:
+            self.finish(handler)
+            return sys.exc_info()
+        self.finish(handler, write=True)
     
-        returns code string.
+    def finish(self, handler, write=False):
+        """marks handler as done, writing what became complete if write."""
+        self._lock.acquire()
+        try:
+            if handler in self.running:
+                self.running.remove(handler)
+            if write and self.stream is not None:
+                self.write_complete(self.stream, self.running)
+        finally:
+            self._lock.release()
+    
+    def extract_all(self, handlers):
+        """extracts sets from all handlers using a pool of worker threads.
+        
+        returns a list of extract() results in the order of handlers.
+        """
+        results = [None] * len(handlers)
+        self.running = list(handlers)
+        workers = min(getattr(self.options, 'workers', 1), len(handlers))
+        if workers <= 1:
+            for i, handler in enumerate(handlers):
+                results[i] = self.extract(handler)
+            return results
+        
+        queue = Queue.Queue()
+        for i, handler in enumerate(handlers):
+            queue.put((i, handler))
+        def work():
+            while True:
+                try:
+                    i, handler = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                results[i] = self.extract(handler)
+        threads = [threading.Thread(target=work) for w in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+    
+    def __call__(self, object_path, setup_callbacks=None, stream=None):
+        """uses data obj to generate code for a fixture.
+        
+        object_path can also be a list of paths, all of which are generated 
+        into the same module.  An empty list means all objects found in the 
+        --env modules.
+    
+        writes code to stream or, if stream is None, returns code string.  
+        The DataSet class of an object is written, after the import lines 
+        it needs, as soon as no handler still querying can link to it (see 
+        DataHandler.linked_obj_ids()); its sets are then dropped.
         """
-        importable, obj = self.resolve_object_path(object_path)
+        if isinstance(object_path, basestring):
+            object_paths = [object_path]
+        else:
+            object_paths = object_path
+        resolved = []
+        for path in object_paths:
+            importable, obj = self.resolve_object_path(path)
+            resolved.append((path, importable, obj))
         # perform setup callbacks here after the object has been imported (above)
         # this is mainly designed for elixir
         if setup_callbacks:
             for setup in setup_callbacks:
                 setup()
-        self.handler = self.get_handler(object_path, obj=obj, importable=importable)
-        self.handler.begin()
-        try:
-            self.handler.findall(self.options.where)
-            def cache_set(s):        
-                self.cache.add(s)
-                for (k,v) in s.data_dict.items():
-                    if isinstance(v, FixtureSet):
-                        f_set = v
-                        cache_set(f_set)
-                        
-            # need to loop through all sets,
-            # then through all set items and add all sets of all 
-            # foreign keys and their foreign keys.
-            # got it???
-            
-            for s in self.handler.sets():
-                cache_set(s)
-        except:
-            self.handler.rollback()
-            raise
+        if not resolved:
+            resolved = self.resolve_env(self.options.env)
+            if not resolved:
+                raise UnrecognizedObject(
+                    "no handler recognizes any object in --env=%s" % (
+                                            ", ".join(self.options.env)))
+        
+        handlers = []
+        for path, importable, obj in resolved:
+            handler = self.get_handler(path, obj=obj, importable=importable)
+            handlers.append(handler)
+        # the module has one header, for one type of fixture class :
+        for handler in handlers[1:]:
+            if handler.fxt_type() != handlers[0].fxt_type():
+                raise HandlerException(
+                    "cannot generate %s (%s) and %s (%s) into the same "
+                    "module; generate them separately" % (
+                        handlers[0].obj_path, handlers[0].fxt_type(), 
+                        handler.obj_path, handler.fxt_type()))
+        for handler in handlers:
+            handler.begin()
+        self.handler = handlers[0]
+        
+        # need to loop through all sets,
+        # then through all set items and add all sets of all 
+        # foreign keys and their foreign keys.
+        # got it???
+        
+        if stream is None:
+            self.stream = StringIO()
         else:
-            self.handler.commit()
+            self.stream = stream
+        no_data = None
+        for exc_info in self.extract_all(handlers):
+            if exc_info is not None:
+                etype, val, tb = exc_info
+                if issubclass(etype, NoData) and len(handlers) > 1:
+                    # other objects may still have data :
+                    no_data = no_data or exc_info
+                    continue
+                raise etype, val, tb
+        if not self.cache.registry and not self.written and no_data:
+            etype, val, tb = no_data
+            raise etype, val, tb
         
-        return self.code()
+        self.code(self.stream)
+        if stream is None:
+            return self.stream.getvalue()
 
 class FixtureSet(object):
     """a key, data_dict pair for a set in a fixture.
@@ -198,6 +474,7 @@ class FixtureSet(object):
     def __init__(self, data):
         self.data = data
         self.data_dict = {}
+        self.key = None
     
     def __repr__(self):
         return "<%s at %s for data %s>" % (
@@ -223,14 +500,26 @@ class FixtureSet(object):
         
         i.e. <dataclass>_<primarykey>
         """
-        return "_".join(str(s) for s in (
-                        self.mk_var_name(), self.set_id()))
+        if self.key is None:
+            self.key = "_".join(str(s) for s in (
+                                self.mk_var_name(), self.set_id()))
+        return self.key
     
     def mk_var_name(self):
         """returns a variable name for the instance of the fixture class.
         """
         return self.obj_id()
     
+    def release(self):
+        """drops the data object this set was built from.
+        
+        the key is computed first so that other sets can still link to 
+        this one.  Subclasses should also drop anything else that holds 
+        on to source data.
+        """
+        self.mk_key()
+        self.data = None
+    
     def obj_id(self):
         """returns a unique value that identifies the object used
         to generate this fixture.
@@ -284,6 +573,16 @@ class DataHandler(object):
     def fxt_type(self):
         """returns name of the type of Fixture class for this data object."""
     
+    def linked_obj_ids(self):
+        """returns the obj_id() of every set that sets() can yield or link 
+        to, or None if that is not known before querying.
+        
+        The DataSet class of an obj_id is written as soon as no handler 
+        still querying can link to it.  With None, nothing is written 
+        until this handler is done.
+        """
+        return None
+    
     def mk_class_name(self, name_or_fset):
         """returns a fixture class for the fixture set.
         """
@@ -334,11 +633,14 @@ class DataHandler(object):
         raise NotImplementedError
 
 def dataset_generator(argv):
-    """%prog [options] OBJECT_PATH
+    """%prog [options] OBJECT_PATH [OBJECT_PATH ...]
     
     Using the object specified in the path, generate DataSet classes (code) to 
     reproduce its data.  An OBJECT_PATH can be a python path or a file path
-    or anything else that a handler can recognize.
+    or anything else that a handler can recognize.  Several objects are 
+    written to the same module and can be queried concurrently with 
+    --workers.  Without any OBJECT_PATH, all recognizable objects in the 
+    --env modules are used.
     
     When targetting Python objects the OBJECT_PATH is dot separated.  
     For example, targetting the Employee class in models.py would look like:
@@ -352,6 +654,12 @@ def dataset_generator(argv):
                 help="Sets db connection for a handler that uses a db")
     parser.add_option('-w','--where',
                 help="SQL where clause, i.e. \"id = 1705\" ")
+    parser.add_option('-o','--output', metavar="FILE",
+                help="Write code to FILE instead of stdout")
+    parser.add_option('--workers', type='int', default=1,
+                help=(
+                    "Number of objects to query concurrently, each with its "
+                    "own connection (default: %default)"))
         
     d = "Data"
     parser.add_option('--suffix',
@@ -407,9 +715,8 @@ def dataset_generator(argv):
     #             help="orderBy=ORDER_BY")
     
     (options, args) = parser.parse_args(argv)
-    try:
-        object_path = args[0]
-    except IndexError:
+    object_paths = args
+    if not object_paths and not options.env:
         parser.error('incorrect arguments')
     
     curr_opt, curr_path, setup_callbacks = None, None, None
@@ -428,8 +735,16 @@ def dataset_generator(argv):
         etype, val, tb = sys.exc_info()
         parser.error("%s=%s %s: %s" % (curr_opt, curr_path, etype.__name__, val))
         
+    stream = None
+    if options.output:
+        stream = open(options.output, 'w')
     try:
-        return get_object_data(object_path, options, setup_callbacks=setup_callbacks)   
+        try:
+            return get_object_data(object_paths, options, 
+                            setup_callbacks=setup_callbacks, stream=stream)
+        finally:
+            if stream is not None:
+                stream.close()
     except (MisconfiguredHandler, NoData, UnrecognizedObject):
         etype, val, tb = sys.exc_info()
         parser.error("%s: %s" % (etype.__name__, val))
@@ -450,9 +765,12 @@ def resolve_function_path(path):
         fn = last_attr
     return fn
 
-def get_object_data(object_path, options, setup_callbacks=None):
+def get_object_data(object_path, options, setup_callbacks=None, stream=None):
     """query object at object_path and return generated code 
     representing its data
+    
+    object_path can be a list of paths.  If stream is given, the code is 
+    written to it instead.
     """
     for egg in options.required_eggs:
         pkg_resources.require(egg)
@@ -462,7 +780,8 @@ def get_object_data(object_path, options, setup_callbacks=None):
         generate.template = options.template
     else:
         generate.template = templates.find(options.template)
-    return generate(object_path, setup_callbacks=setup_callbacks)
+    return generate(object_path, setup_callbacks=setup_callbacks, 
+                    stream=stream)
 
 def main(argv=sys.argv[1:]):
     if '__testmod__' in argv:
@@ -475,7 +794,9 @@ def main(argv=sys.argv[1:]):
         finally:
             teardown_examples()
         return
-    print( dataset_generator(argv))
+    code = dataset_generator(argv)
+    if code is not None:
+        print(code)
     return 0
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 
 import sys, inspect
+from itertools import islice
 from fixture.command.generate import (
         DataHandler, register_handler, FixtureSet, NoData, UnsupportedHandler)
 from fixture import SQLAlchemyFixture
@@ -168,12 +169,56 @@ class SQLAlchemyHandler(DataHandler):
             return False
         return True
     
+    def linked_obj_ids(self):
+        """returns the names of this handler's table and of the tables its 
+        foreign keys lead to, or None if one is not in the env.
+        """
+        table = getattr(self, 'table', None)
+        if table is None:
+            return None
+        obj_ids = set()
+        tables = [table]
+        seen = set()
+        while tables:
+            table = tables.pop()
+            if table in seen:
+                continue
+            seen.add(table)
+            try:
+                obj_ids.add(self.env[table]['name'])
+            except LookupError:
+                return None
+            for col in table.columns:
+                for fk in col.foreign_keys:
+                    tables.append(fk.column.table)
+        return obj_ids
+    
     def sets(self):
-        """yields FixtureSet for each row in SQLObject."""
+        """yields FixtureSet for each row in SQLObject.
         
-        for row in self.rs:
-            yield SQLAlchemyFixtureSet(row, self.obj, self.connection, self.env,
-                                            adapter=self.RecordSetAdapter)
+        rows are read in chunks of ForeignKeyLoader.chunk_size.  Before 
+        the sets of a chunk are yielded, the rows its foreign keys refer 
+        to are fetched, one query per referenced table.  Once the sets of 
+        a chunk have been consumed, the loader forgets those rows.
+        """
+        fk_loader = ForeignKeyLoader(self.connection, self.env)
+        columns = self.RecordSetAdapter(self.obj).columns
+        rs = iter(self.rs)
+        while True:
+            rows = list(islice(rs, fk_loader.chunk_size))
+            if not rows:
+                break
+            for row in rows:
+                fk_loader.add(row, columns)
+            fk_loader.fetch()
+            for row in rows:
+                yield SQLAlchemyFixtureSet(row, self.obj, self.connection, 
+                                            self.env, 
+                                            adapter=self.RecordSetAdapter,
+                                            fk_loader=fk_loader)
+            # the consumer has cached the sets of this chunk, the next 
+            # chunk fetches the rows it links to again :
+            fk_loader.clear()
 
 class SQLAlchemyMappedClassBase(SQLAlchemyHandler):
     class RecordSetAdapter(SQLAlchemyHandler.RecordSetAdapter):
@@ -271,6 +316,10 @@ class SQLAlchemySessionMapperHandler(SQLAlchemyMappedClassBase):
 register_handler(SQLAlchemySessionMapperHandler)
 
 class SQLAlchemyTableHandler(SQLAlchemyHandler):        
+    def __init__(self, *args, **kw):
+        super(SQLAlchemyTableHandler, self).__init__(*args, **kw)
+        self.table = self.obj
+    
     class RecordSetAdapter(SQLAlchemyHandler.RecordSetAdapter):
         def __init__(self, obj):
             self.table = obj
@@ -324,14 +373,88 @@ class SQLAlchemyMappedClassHandler(SQLAlchemyMappedClassBase):
 register_handler(SQLAlchemyMappedClassHandler)
 
 
+class ForeignKeyLoader(object):
+    """fetches rows referenced by foreign keys in batches.
+    
+    add() collects the foreign key values of a row, fetch() selects 
+    all pending values of each referenced table with WHERE key IN (...) 
+    and follows the foreign keys of those rows until none are left.  
+    Child fixture sets are built once per referenced row and shared 
+    between all rows that link to it.
+    """
+    chunk_size = 500
+    
+    def __init__(self, connection, env):
+        self.connection = connection
+        self.env = env
+        self.rows = {}
+        self.pending = {}
+        self.fixture_sets = {}
+    
+    def clear(self):
+        """forgets the fetched rows and the fixture sets built from them."""
+        self.rows.clear()
+        self.fixture_sets.clear()
+    
+    def add(self, row, columns):
+        """queue the foreign key values of row for fetching."""
+        for col in columns:
+            for fk in col.foreign_keys:
+                value = getattr(row, col.name)
+                if value is None:
+                    continue
+                key = (fk.column.table, fk.column.key)
+                if value in self.rows.get(key, {}):
+                    continue
+                self.pending.setdefault(key, set()).add(value)
+    
+    def fetch(self):
+        """fetch all queued rows, level by level."""
+        while self.pending:
+            pending, self.pending = self.pending, {}
+            for (table, colkey), values in pending.items():
+                self._select(table, colkey, list(values))
+    
+    def _select(self, table, colkey, values):
+        found = self.rows.setdefault((table, colkey), {})
+        col = getattr(table.c, colkey)
+        for i in range(0, len(values), self.chunk_size):
+            stmt = table.select(col.in_(values[i:i+self.chunk_size]))
+            for row in self.connection.execute(stmt).fetchall():
+                found[getattr(row, col.name)] = row
+                self.add(row, table.columns)
+    
+    def get_set(self, foreign_key, value):
+        """returns the fixture set for the row foreign_key points to."""
+        table = foreign_key.column.table
+        key = (table, foreign_key.column.key)
+        if (key, value) in self.fixture_sets:
+            return self.fixture_sets[(key, value)]
+        found = self.rows.get(key, {})
+        if value not in found:
+            # not added before fetch(), look it up on its own :
+            self._select(table, foreign_key.column.key, [value])
+            self.fetch()
+            found = self.rows[key]
+        # adapter is always table adapter here, since that's
+        # how we obtain foreign keys...
+        fset = SQLAlchemyFixtureSet(
+                    found.get(value), table, self.connection, self.env,
+                    adapter=SQLAlchemyTableHandler.RecordSetAdapter, 
+                    fk_loader=self)
+        self.fixture_sets[(key, value)] = fset
+        return fset
+
 class SQLAlchemyFixtureSet(FixtureSet):
     """a fixture set for a sqlalchemy record set."""
     
-    def __init__(self, data, obj, connection, env, adapter=None):
+    def __init__(self, data, obj, connection, env, adapter=None, 
+                        fk_loader=None):
         # print data, model
         FixtureSet.__init__(self, data)
         self.env = env
         self.connection = connection
+        self.fk_loader = fk_loader
         if adapter:
             self.obj = adapter(obj)
         else:
@@ -353,6 +476,11 @@ class SQLAlchemyFixtureSet(FixtureSet):
     def attr_to_db_col(self, col):
         return col.name
     
+    def release(self):
+        """drops the row and the loader that fetched linked rows."""
+        FixtureSet.release(self)
+        self.fk_loader = None
+    
     def get_col_value(self, colname, foreign_key=None):
         """transform column name into a value or a
         new set if it's a foreign key (recursion).
@@ -364,9 +492,9 @@ class SQLAlchemyFixtureSet(FixtureSet):
             return None
             
         if foreign_key:
-            from sqlalchemy.ext.assignmapper import assign_mapper
-            from sqlalchemy.ext.sqlsoup import class_for_table
-                
+            if self.fk_loader is not None:
+                return self.fk_loader.get_set(foreign_key, value)
+            
             table = foreign_key.column.table
             stmt = table.select(getattr(table.c, foreign_key.column.key)==value)
             rs = self.connection.execute(stmt)
@@ -2,6 +2,8 @@
 """templates that generate fixture modules."""
 
 from fixture.command.generate import code_str
+from fixture.dataset.datafile import RowRef, write_rows
+import os
 import pprint
 
 def _addto(val, list_):
@@ -101,6 +103,15 @@ class metabase:
         if self.fixture is None:
             raise NotImplementedError
         return self.fixture % tpl
+    
+    def write_data(self, tpl):
+        """writes the data of a rendered class that is not kept in the 
+        module itself.
+        
+        Called by the generate command for each class, before render(tpl).  
+        By default it does nothing.
+        """
+        pass
 
 def is_template(obj):
     return isinstance(obj, Template)
@@ -156,6 +167,72 @@ class %(fxt_class)s(DataSet):
 
 templates.register(fixture(), default=True)
 
+class datafile(fixture):
+    """renders DataFileSet stubs whose rows are written to data files.
+    
+    each DataSet gets its own pickled data file, in the directory of the 
+    --output module, that is streamed when the DataSet is loaded.  The 
+    file is written by write_data(), not by render().
+    """
+    class DataDef(fixture.DataDef):
+        def fset_to_attr(self, fset, fxt_class):
+            return RowRef(fxt_class, fset.mk_key(), fset.get_id_attr())
+            
+        def meta(self, fxt_class):
+            if len(self.requires):
+                return ["references = (%s,)" % ", ".join(self.requires)]
+            else:
+                return []
+    
+    fixture = """
+class %(fxt_class)s(DataFileSet):
+    class Meta:
+        datafile = %(datafile)r
+%(meta)s"""
+    
+    class data(object):
+        def __init__(self, elements):
+            self.elements = elements
+    
+    def __init__(self):
+        fixture.__init__(self)
+        self.datadir = os.curdir
+        self.file_prefix = ""
+    
+    def begin(self):
+        self.add_import("from fixture.dataset.datafile import DataFileSet")
+    
+    def header(self, handler):
+        output = getattr(handler.options, 'output', None)
+        if output:
+            self.datadir = os.path.dirname(output) or os.curdir
+            self.file_prefix = os.path.splitext(
+                                    os.path.basename(output))[0] + "_"
+        else:
+            self.datadir = os.curdir
+            self.file_prefix = ""
+        return fixture.header(self, handler)
+    
+    def datafile(self, tpl):
+        """returns the name of the data file of the class in tpl"""
+        return "%s%s.pkl" % (self.file_prefix, tpl['fxt_class'])
+    
+    def render(self, tpl):
+        tpl = dict(tpl)
+        tpl['datafile'] = self.datafile(tpl)
+        if tpl['meta']:
+            tpl['meta'] = "        %s\n" % tpl['meta']
+        return self.fixture % tpl
+    
+    def write_data(self, tpl):
+        fp = open(os.path.join(self.datadir, self.datafile(tpl)), 'wb')
+        try:
+            write_rows(fp, tpl['data'].elements)
+        finally:
+            fp.close()
+
+templates.register(datafile())
+
 class testtools(Template):
     """renders Fixture objects for the legacy testtools interface.
     """
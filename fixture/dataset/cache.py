@@ -0,0 +1,270 @@
+"""A cache of built DataSets that persists between processes.
+
+Every process that instantiates a DataSet walks its row classes with
+``dir()`` to find columns and references.  When a cache directory is
+configured, the rows found are saved there as plain data (references are
+saved by name) and every following process builds its DataSets from the
+cache instead.  To enable it, call :func:`enable_cache` or set the
+``FIXTURE_DATASET_CACHE`` environment variable to a directory::
+
+    >>> from fixture.dataset.cache import enable_cache, disable_cache
+    >>> from fixture import TempIO
+    >>> tmp = TempIO()
+    >>> cache = enable_cache(tmp.join('datasets'))
+    >>> cache.directory == tmp.join('datasets')
+    True
+    >>> disable_cache()
+
+Only DataSets declared at module level with class-style rows are cached.  A
+cached DataSet is rebuilt from its class whenever the source of its module
+(or of any module declaring one of its DataSet base classes) changes.
+Several processes can share a cache directory since each file is replaced
+atomically.
+
+The cache keeps the values rows had when their module was imported, so a
+value computed at import time is frozen with it.  A row declaring
+``created = datetime.now()`` gets the time the DataSet was first cached,
+not the time of the current run, until its module changes.  Leave the
+cache disabled for DataSets whose values must be computed on every run.
+
+"""
+
+import os
+import sys
+import types
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from hashlib import md5
+except ImportError:
+    # python 2.4
+    from md5 import new as md5
+from fixture.util import atomic_write
+import logging
+
+log = logging.getLogger('fixture.dataset.cache')
+
+__all__ = ['DataSetCache', 'enable_cache', 'disable_cache', 'active_cache']
+
+_cache = None
+_from_environ = False
+
+def enable_cache(directory):
+    """cache DataSets in directory from now on and return the
+    :class:`DataSetCache`
+    """
+    global _cache
+    _cache = DataSetCache(directory)
+    return _cache
+
+def disable_cache():
+    """stop caching DataSets (the ``FIXTURE_DATASET_CACHE`` environment
+    variable is ignored from now on)
+    """
+    global _cache, _from_environ
+    _cache = None
+    _from_environ = True
+
+def active_cache():
+    """returns the :class:`DataSetCache` in use or None"""
+    global _from_environ
+    if _cache is None and not _from_environ:
+        _from_environ = True
+        directory = os.environ.get('FIXTURE_DATASET_CACHE')
+        if directory:
+            enable_cache(directory)
+    return _cache
+
+class CachedRef(object):
+    """a reference to a row (or one of its columns) of a module level
+    DataSet class, as saved in the cache.
+    """
+    def __init__(self, module, dataset_name, key, attr_name=None):
+        self.module = module
+        self.dataset_name = dataset_name
+        self.key = key
+        self.attr_name = attr_name
+
+    def __repr__(self):
+        return "<%s to %s>" % (self.__class__.__name__, ".".join(
+            [n for n in (self.module, self.dataset_name, self.key,
+                                            self.attr_name) if n]))
+
+    def resolve(self):
+        """returns the row class or a Ref.Value to one of its columns.
+
+        Raises LookupError if the row no longer exists.
+        """
+        row = getattr(_module_level_class(self.module, self.dataset_name),
+                      self.key, None)
+        if row is None:
+            raise LookupError("%r no longer exists" % self)
+        if self.attr_name is None:
+            return row
+        return row.ref(self.attr_name)
+
+def _module_level_class(module, name):
+    cls = getattr(sys.modules.get(module), name, None)
+    if cls is None:
+        raise LookupError("cannot find %s.%s" % (module, name))
+    return cls
+
+def _is_module_level(cls):
+    return getattr(sys.modules.get(cls.__module__), cls.__name__, None) is cls
+
+def _source_file(module):
+    filename = getattr(sys.modules.get(module), '__file__', None)
+    if not filename:
+        return None
+    if filename[-4:] in ('.pyc', '.pyo'):
+        filename = filename[:-1]
+    if not os.path.exists(filename):
+        return None
+    return filename
+
+def source_files(dataset_class):
+    """returns the source files of the modules declaring dataset_class and
+    each of its DataSet base classes, or None if one of them has no source
+    """
+    from fixture.dataset import DataSet
+    files = []
+    for cls in dataset_class.__mro__:
+        if not issubclass(cls, DataSet) or cls is DataSet:
+            continue
+        filename = _source_file(cls.__module__)
+        if filename is None:
+            return None
+        files.append(filename)
+    return files
+
+class DataSetCache(object):
+    """Saves the rows of built DataSets in a directory.
+
+    Each DataSet class gets one file, named after the class and a digest of
+    the path, modification time and content of its source files.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        # (path, mtime) -> digest of the file
+        self._digests = {}
+
+    def __repr__(self):
+        return "<%s at %s>" % (self.__class__.__name__, self.directory)
+
+    def source_digest(self, filename):
+        """returns a digest of filename's path, mtime and content"""
+        mtime = os.stat(filename).st_mtime
+        try:
+            return self._digests[(filename, mtime)]
+        except KeyError:
+            pass
+        fp = open(filename, 'rb')
+        try:
+            source = fp.read()
+        finally:
+            fp.close()
+        digest = md5("%s:%r:" % (filename, mtime))
+        digest.update(source)
+        self._digests[(filename, mtime)] = digest.hexdigest()
+        return self._digests[(filename, mtime)]
+
+    def path_for(self, dataset_class):
+        """returns the cache file for dataset_class or None if it cannot be
+        cached
+        """
+        if not _is_module_level(dataset_class):
+            return None
+        files = source_files(dataset_class)
+        if files is None:
+            return None
+        digest = md5()
+        for filename in files:
+            digest.update(self.source_digest(filename))
+        return os.path.join(self.directory, "%s.%s-%s.pkl" % (
+            dataset_class.__module__, dataset_class.__name__,
+            digest.hexdigest()))
+
+    def load(self, dataset_class):
+        """returns (references, rows) saved for dataset_class or None.
+
+        references is a list of DataSet classes, rows is a list of
+        (key, dict of column values) pairs.
+        """
+        path = self.path_for(dataset_class)
+        if path is None or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            fp = open(path, 'rb')
+            try:
+                references, rows = pickle.load(fp)
+            finally:
+                fp.close()
+            references = [_module_level_class(m, n) for m, n in references]
+            rows = [(key, self._decoded(values)) for key, values in rows]
+        except (LookupError, EnvironmentError, pickle.UnpicklingError), e:
+            # i.e. a referenced DataSet changed, rebuild it
+            log.info("ignoring cache %s: %s", path, e)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return references, rows
+
+    def save(self, dataset_class, references, rows):
+        """saves references (DataSet classes) and rows ((key, dict) pairs)
+        of dataset_class.
+
+        Returns False if they cannot be saved, i.e. when a value cannot be
+        pickled or refers to a DataSet not declared at module level.
+        """
+        path = self.path_for(dataset_class)
+        if path is None:
+            return False
+        try:
+            data = pickle.dumps((
+                [self._encoded_class(c) for c in references],
+                [(key, self._encoded(values)) for key, values in rows]), 2)
+        except (ValueError, TypeError, AttributeError, pickle.PicklingError), e:
+            log.info("not caching %s: %s", dataset_class, e)
+            return False
+        if not os.path.exists(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # another process created it
+                if not os.path.isdir(self.directory):
+                    raise
+        atomic_write(path, data)
+        return True
+
+    def _encoded_class(self, cls):
+        if not _is_module_level(cls):
+            raise ValueError("%s is not declared at module level" % cls)
+        return (cls.__module__, cls.__name__)
+
+    def _encoded(self, values):
+        from fixture.dataset import Ref, is_rowlike
+        def encode(val):
+            if isinstance(val, Ref.Value):
+                module, name = self._encoded_class(val.ref.dataset_class)
+                return CachedRef(module, name, val.ref.key, val.attr_name)
+            elif is_rowlike(val):
+                module, name = self._encoded_class(val._dataset)
+                return CachedRef(module, name, val.__name__)
+            elif type(val) in (types.ListType, types.TupleType):
+                return type(val)([encode(v) for v in val])
+            return val
+        return dict([(col, encode(val)) for col, val in values.items()])
+
+    def _decoded(self, values):
+        def decode(val):
+            if isinstance(val, CachedRef):
+                return val.resolve()
+            elif type(val) in (types.ListType, types.TupleType):
+                return type(val)([decode(v) for v in val])
+            return val
+        return dict([(col, decode(val)) for col, val in values.items()])
@@ -1,10 +1,15 @@
 
 """Utilities for converting datasets."""
 
+import os, sys
+import csv
 import datetime
 import decimal
 import types
-from fixture.dataset import DataSet, DataRow
+from itertools import islice
+from fixture.dataset import (
+    DataSet, DataRow, DataType, Ref, is_rowlike, DataSetContainer)
+from fixture.dataset.datafile import DataFileSet, RowRef
 json = None
 try:
     # 2.6
@@ -105,6 +110,509 @@ def dataset_to_json(dataset, fp=None, default=default_json_converter, wrap=None)
     else:
         return json.dumps(objects, default=default)
 
+def _json_value(val):
+    # references to other rows are written as keys
+    if isinstance(val, Ref.Value):
+        return {'__ref__': [val.ref.dataset_class.__name__, val.ref.key, 
+                            val.attr_name]}
+    elif is_rowlike(val):
+        return {'__ref__': [val._dataset.__name__, val.__name__]}
+    elif type(val) in (types.ListType, types.TupleType):
+        return [_json_value(v) for v in val]
+    return val
+
+def _python_value(val):
+    if isinstance(val, dict) and val.keys() == ['__ref__']:
+        return RowRef(*[str(v) for v in val['__ref__']])
+    elif isinstance(val, list):
+        return [_python_value(v) for v in val]
+    return val
+
+def dataset_to_json_lines(dataset, fp=None, default=default_json_converter):
+    """Converts a :class:`DataSet <fixture.dataset.DataSet>` class or 
+    instance to `JSON Lines`_, one row at a time.
+    
+    Each line is an object like ``{"key": "joan_jett", "data": {...}}``.  A 
+    column that references another row, i.e. ``ArtistData.joan_jett`` or 
+    ``ArtistData.joan_jett.ref('id')``, is written as 
+    ``{"__ref__": ["ArtistData", "joan_jett"]}`` or 
+    ``{"__ref__": ["ArtistData", "joan_jett", "id"]}``.  Use 
+    :func:`json_to_dataset` to read it back.
+    
+    Keyword Arguments
+    
+    **fp**  
+      An optional file-like object (must implement ``fp.write()``).  When 
+      this is not None, each line is written to the fp object as soon as 
+      its row is converted, otherwise an iterator of lines is returned
+    
+    **default**
+      A callable that converts objects that cannot be serialized, like 
+      :func:`dataset_to_json`
+    
+    .. _JSON Lines: http://jsonlines.org/
+    
+    """
+    assert json, (
+        "You must have the simplejson or json module installed.  "
+        "Neither could be imported")
+    if isinstance(dataset, type):
+        dataset = dataset()
+    if not isinstance(dataset, DataSet):
+        raise TypeError("First argument must be a class or instance of a DataSet")
+    def lines():
+        for obj in _json_rows(dataset):
+            yield json.dumps(obj, default=default, sort_keys=True) + "\n"
+    if fp:
+        for line in lines():
+            fp.write(line)
+    else:
+        return lines()
+
+def _json_rows(dataset):
+    # yields the object written on each line by dataset_to_json_lines
+    for key, row in dataset:
+        row_dict = {}
+        for col in row.columns():
+            val = getattr(row, col)
+            if callable(val) and not is_rowlike(val):
+                continue
+            row_dict[col] = _json_value(val)
+        yield {'key': key, 'data': row_dict}
+
+def read_json_lines(fp):
+    """yields (key, dict of column values) pairs from a file written by 
+    :func:`dataset_to_json_lines`
+    """
+    assert json, (
+        "You must have the simplejson or json module installed.  "
+        "Neither could be imported")
+    for line in fp:
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        values = {}
+        for col, val in obj['data'].items():
+            values[str(col)] = _python_value(val)
+        yield str(obj['key']), values
+
+class JSONLinesDataSet(DataFileSet):
+    """a :class:`DataFileSet <fixture.dataset.datafile.DataFileSet>` that 
+    streams its rows from a file written by :func:`dataset_to_json_lines`
+    """
+    _read_datafile = staticmethod(read_json_lines)
+
+def json_to_dataset(path, name=None, references=()):
+    """Returns a :class:`DataSet <fixture.dataset.DataSet>` class that 
+    reads its rows from a file written by :func:`dataset_to_json_lines`.
+    
+    The file is not read until the DataSet is loaded and rows are then 
+    streamed one at a time.  The class is named after the file unless 
+    **name** is given.  Any DataSet classes whose rows are referenced must 
+    be passed in **references**.
+    """
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    meta = types.ClassType('Meta', (), {
+                    'datafile': os.path.abspath(path), 
+                    'references': tuple(references)})
+    return type(name, (JSONLinesDataSet,), {'Meta': meta})
+
+def datasets_in_order(datasets):
+    """Returns :class:`DataSet <fixture.dataset.DataSet>` instances for 
+    datasets and every DataSet they reference, referenced DataSets first.
+    
+    datasets can be a :class:`SuperSet <fixture.dataset.SuperSet>`, a 
+    DataSet class or instance or a list of DataSet classes or instances.
+    """
+    if isinstance(datasets, DataSetContainer):
+        datasets = [d for d in datasets]
+    elif isinstance(datasets, (type, DataSet)):
+        datasets = [datasets]
+    ordered = []
+    seen = {}
+    def visit(dataset):
+        if isinstance(dataset, DataSet):
+            dataset_class = type(dataset)
+        else:
+            dataset_class, dataset = dataset, None
+        if dataset_class in seen:
+            return
+        seen[dataset_class] = True
+        if dataset is None:
+            dataset = dataset_class()
+        for ref in dataset.meta.references:
+            visit(ref)
+        ordered.append(dataset)
+    for dataset in datasets:
+        visit(dataset)
+    return ordered
+
+def datasets_to_json_lines(datasets, fp=None, default=default_json_converter):
+    """Converts datasets and all DataSets they reference to `JSON Lines`_, 
+    referenced DataSets first.
+    
+    Works like :func:`dataset_to_json_lines` but each line also names 
+    its DataSet, i.e. ``{"data": {...}, "dataset": "ArtistData", "key": 
+    "ramones"}``.  
+    See :func:`datasets_in_order` for what datasets can be.
+    
+    .. _JSON Lines: http://jsonlines.org/
+    
+    """
+    assert json, (
+        "You must have the simplejson or json module installed.  "
+        "Neither could be imported")
+    def lines():
+        for dataset in datasets_in_order(datasets):
+            name = dataset.__class__.__name__
+            for obj in _json_rows(dataset):
+                obj['dataset'] = name
+                yield json.dumps(obj, default=default, sort_keys=True) + "\n"
+    if fp:
+        for line in lines():
+            fp.write(line)
+    else:
+        return lines()
+
+def _table_name(dataset, style=None):
+    if dataset.meta.storable_name:
+        return dataset.meta.storable_name
+    name = dataset.__class__.__name__
+    if style is not None:
+        return style.guess_storable_name(name)
+    return name
+
+def exported_rows(dataset):
+    """yields (key, dict of column values) pairs for each row of dataset.
+    
+    Refs and referenced rows are replaced with the values they point to 
+    (the primary key, for a row) so the values can be stored outside of 
+    Python.  A ValueError is raised for a value that isn't known until the 
+    data is loaded.
+    """
+    for key, row in dataset:
+        values = {}
+        for col in row.columns():
+            val = getattr(row, col)
+            if callable(val) and not is_rowlike(val):
+                continue
+            values[col] = _resolved_value(dataset, key, col, val)
+        yield key, values
+
+def _resolved_value(dataset, key, col, val):
+    try:
+        if isinstance(val, Ref.Value):
+            return getattr(val.ref.row, val.attr_name)
+        elif is_rowlike(val):
+            primary_key = getattr(val._dataset.Meta, 'primary_key', 
+                                  DataType.default_primary_key)
+            return getattr(val, primary_key[0])
+    except AttributeError:
+        raise ValueError(
+            "%s.%s.%s references %r which has no value yet; only "
+            "explicitly declared values can be exported" % (
+                        dataset.__class__.__name__, key, col, val))
+    if type(val) in (types.ListType, types.TupleType):
+        raise ValueError(
+            "%s.%s.%s is a multi-value column which cannot be exported" % (
+                        dataset.__class__.__name__, key, col))
+    return val
+
+def sql_literal(value, dialect=None):
+    """Returns value as a unicode SQL literal.
+    
+    dialect is the name of the database, i.e. ``'postgresql'``, ``'mysql'`` 
+    or ``'sqlite'``.  Booleans are written as true or false for PostgreSQL 
+    and as 1 or 0 otherwise.  Backslashes are escaped for MySQL.
+    """
+    if value is None:
+        return u"NULL"
+    if isinstance(value, bool):
+        if dialect in ('postgres', 'postgresql'):
+            return value and u"true" or u"false"
+        return value and u"1" or u"0"
+    if isinstance(value, float):
+        return unicode(repr(value))
+    if isinstance(value, (int, long, decimal.Decimal)):
+        return unicode(value)
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    elif not isinstance(value, unicode):
+        # i.e. dates, when the DB-API module would adapt them
+        value = unicode(value)
+    value = value.replace(u"'", u"''")
+    if dialect == 'mysql':
+        value = value.replace(u"\\", u"\\\\")
+    return u"'%s'" % value
+
+def quote_identifier(name, dialect=None):
+    """Returns name quoted as a table or column name for dialect (see 
+    :func:`sql_literal`)."""
+    if dialect == 'mysql':
+        return u"`%s`" % name.replace("`", "``")
+    return u'"%s"' % name.replace('"', '""')
+
+def render_insert(table, values, dialect=None, quote=None):
+    """Returns an INSERT statement into table for a dict of column values.
+    
+    Values are written with :func:`sql_literal` and the table and column 
+    names with quote, a function that defaults to :func:`quote_identifier` 
+    for dialect.
+    """
+    return render_insert_rows(table, [values], dialect=dialect, quote=quote)
+
+# databases that insert several rows with INSERT ... VALUES (...), (...)
+MULTI_ROW_DIALECTS = ('postgres', 'postgresql', 'mysql')
+# rows per INSERT (or per executemany() call when loading CSV files)
+BATCH_SIZE = 500
+
+def render_insert_rows(table, rows, dialect=None, quote=None):
+    """Returns an INSERT statement of all rows (dicts of column values 
+    with the same columns) into table, like :func:`render_insert`.
+    """
+    if quote is None:
+        quote = lambda name: quote_identifier(name, dialect)
+    cols = rows[0].keys()
+    cols.sort()
+    return u"INSERT INTO %s (%s) VALUES %s" % (
+                quote(table), u", ".join([quote(c) for c in cols]), 
+                u", ".join([u"(%s)" % u", ".join(
+                        [sql_literal(values[c], dialect) for c in cols])
+                    for values in rows]))
+
+def datasets_to_sql(datasets, fp=None, style=None, dialect=None):
+    """Converts datasets and all DataSets they reference to a script of 
+    SQL INSERT statements, referenced DataSets first.
+    
+    See :func:`datasets_in_order` for what datasets can be.  Each DataSet 
+    is inserted into the table named by ``Meta.storable_name`` or, if 
+    not set, the name guessed by **style** (a 
+    :class:`Style <fixture.style.Style>`) or the DataSet class name.  
+    References to other rows are replaced by the values they reference 
+    so those values must be declared in the DataSet, i.e. explicit 
+    primary keys.  Statements are written by :func:`render_insert` for 
+    **dialect**, the name of the database.  For PostgreSQL and MySQL, 
+    consecutive rows of a DataSet that have the same columns are inserted 
+    by one statement, up to ``BATCH_SIZE`` rows at a time (see 
+    :func:`render_insert_rows`).  The script can be loaded with 
+    :func:`load_sql`.
+    
+    Returns the script (encoded as UTF-8) unless **fp** is given
+    """
+    lines = []
+    if fp is None:
+        write = lines.append
+    else:
+        write = fp.write
+    if dialect in MULTI_ROW_DIALECTS:
+        batch_size = BATCH_SIZE
+    else:
+        batch_size = 1
+    for dataset in datasets_in_order(datasets):
+        table = _table_name(dataset, style=style)
+        batch = []
+        for key, values in exported_rows(dataset):
+            if batch and (len(batch) == batch_size or 
+                            sorted(values.keys()) != sorted(batch[0].keys())):
+                stmt = render_insert_rows(table, batch, dialect=dialect)
+                write((u"%s;\n" % stmt).encode('utf-8'))
+                batch = []
+            batch.append(values)
+        if batch:
+            stmt = render_insert_rows(table, batch, dialect=dialect)
+            write((u"%s;\n" % stmt).encode('utf-8'))
+    if fp is None:
+        return "".join(lines)
+
+CSV_NULL = r"\N"
+
+def datasets_to_csv(datasets, dirname, style=None):
+    """Converts datasets and all DataSets they reference to one CSV file 
+    per DataSet in dirname.
+    
+    Files are named like ``1_artists.csv`` where the number is the order 
+    to load them in (padded with zeros to the width of the number of 
+    DataSets, i.e. ``01_artists.csv`` with ten or more) and the rest is 
+    the table name, like :func:`datasets_to_sql`.  The first line names the columns and None 
+    is written as ``\\N``, True as 1 and False as 0.  The files can be 
+    loaded with :func:`load_csv`.
+    
+    Returns a list of paths to files that were written
+    """
+    paths = []
+    ordered = datasets_in_order(datasets)
+    for i, dataset in enumerate(ordered):
+        rows = [values for key, values in exported_rows(dataset)]
+        cols = {}
+        for values in rows:
+            cols.update(dict.fromkeys(values.keys()))
+        cols = cols.keys()
+        cols.sort()
+        
+        path = os.path.join(dirname, "%0*d_%s.csv" % (
+                    len(str(len(ordered))), i+1, 
+                    _table_name(dataset, style=style)))
+        fp = open(path, 'wb')
+        try:
+            writer = csv.writer(fp)
+            writer.writerow(cols)
+            for values in rows:
+                line = []
+                for c in cols:
+                    val = values.get(c)
+                    if val is None:
+                        val = CSV_NULL
+                    elif isinstance(val, bool):
+                        val = val and 1 or 0
+                    elif isinstance(val, unicode):
+                        val = val.encode('utf-8')
+                    line.append(val)
+                writer.writerow(line)
+        finally:
+            fp.close()
+        paths.append(path)
+    return paths
+
+def split_sql(script, dialect=None):
+    """yields each statement in an SQL script, without the semi-colon.
+    
+    Semi-colons in quoted strings and names do not end a statement.  For 
+    MySQL (see :func:`sql_literal` for dialect), a backslash escapes the 
+    next character of a string.
+    """
+    start, quote, escaped = 0, None, False
+    for i, char in enumerate(script):
+        if escaped:
+            escaped = False
+        elif quote is not None:
+            if char == quote:
+                # a doubled quote closes then opens again
+                quote = None
+            elif char == '\\' and quote == "'" and dialect == 'mysql':
+                escaped = True
+        elif char in ('\'', '"', '`'):
+            quote = char
+        elif char == ';':
+            stmt = script[start:i].strip()
+            if stmt:
+                yield stmt
+            start = i+1
+    stmt = script[start:].strip()
+    if stmt:
+        yield stmt
+
+def _execute_all(connection, statements):
+    if hasattr(connection, 'cursor'):
+        # a DB-API connection
+        cursor = connection.cursor()
+        for stmt in statements:
+            cursor.execute(stmt)
+        cursor.close()
+    else:
+        # i.e. a sqlalchemy connection or engine
+        for stmt in statements:
+            connection.execute(stmt)
+
+def _paramstyle(connection):
+    # the paramstyle of the DB-API module (or its package) that 
+    # defines the type of connection
+    module = type(connection).__module__
+    while module:
+        paramstyle = getattr(sys.modules.get(module), 'paramstyle', None)
+        if paramstyle is not None:
+            return paramstyle
+        module = module[:max(module.rfind('.'), 0)]
+    raise ValueError(
+        "cannot tell the paramstyle of DB-API connection %r" % connection)
+
+def _insert_many(connection, table, cols, rows, dialect=None):
+    """inserts rows (sequences of values for cols) into table with one 
+    executemany() call and bound parameters.
+    """
+    names = u", ".join([quote_identifier(c, dialect) for c in cols])
+    if hasattr(connection, 'cursor'):
+        # a DB-API connection
+        paramstyle = _paramstyle(connection)
+        if paramstyle == 'qmark':
+            binds = ['?' for c in cols]
+        elif paramstyle == 'numeric':
+            binds = [':%d' % (i+1) for i in range(len(cols))]
+        elif paramstyle == 'named':
+            binds = [':p%d' % i for i in range(len(cols))]
+        elif paramstyle == 'format':
+            binds = ['%s' for c in cols]
+        else:
+            binds = ['%%(p%d)s' % i for i in range(len(cols))]
+        if paramstyle in ('named', 'pyformat'):
+            rows = [dict([('p%d' % i, v) for i, v in enumerate(row)]) 
+                                                            for row in rows]
+        stmt = u"INSERT INTO %s (%s) VALUES (%s)" % (
+                    quote_identifier(table, dialect), names, u", ".join(binds))
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(stmt, rows)
+        finally:
+            cursor.close()
+    else:
+        # i.e. a sqlalchemy connection or engine
+        from sqlalchemy.sql import text
+        stmt = u"INSERT INTO %s (%s) VALUES (%s)" % (
+                    quote_identifier(table, dialect), names, 
+                    u", ".join([':p%d' % i for i in range(len(cols))]))
+        connection.execute(text(stmt), 
+            [dict([('p%d' % i, v) for i, v in enumerate(row)]) 
+                                                        for row in rows])
+
+def load_sql(connection, script):
+    """Executes each statement of an SQL script (a string or file-like 
+    object), i.e. one written by :func:`datasets_to_sql`.
+    
+    connection can be a DB-API connection or anything with an 
+    ``execute()`` method, like a sqlalchemy connection.  The caller is 
+    responsible for committing the transaction.
+    """
+    if hasattr(script, 'read'):
+        script = script.read()
+    _execute_all(connection, split_sql(script))
+
+def load_csv(connection, dirname, dialect=None):
+    """Inserts rows from each CSV file written by :func:`datasets_to_csv` 
+    in dirname, in the order of their file names.
+    
+    The rows of a file are inserted with bound parameters by one 
+    ``executemany()`` call per ``BATCH_SIZE`` rows.  Every value is bound 
+    as a string and left for the database to convert to the type of its 
+    column.  connection can be a DB-API connection (the ``paramstyle`` of 
+    its module is used) or a sqlalchemy connection.  Table and column names 
+    are quoted for dialect (see :func:`quote_identifier`).  The caller is 
+    responsible for committing the transaction.
+    """
+    names = [n for n in os.listdir(dirname) if n.endswith('.csv')]
+    names.sort()
+    for name in names:
+        table = os.path.splitext(name)[0].split('_', 1)[1]
+        fp = open(os.path.join(dirname, name), 'rb')
+        try:
+            reader = csv.reader(fp)
+            cols = reader.next()
+            while True:
+                rows = []
+                for line in islice(reader, BATCH_SIZE):
+                    row = []
+                    for val in line:
+                        if val == CSV_NULL:
+                            val = None
+                        else:
+                            val = val.decode('utf-8')
+                        row.append(val)
+                    rows.append(row)
+                if not rows:
+                    break
+                _insert_many(connection, table, cols, rows, dialect=dialect)
+        finally:
+            fp.close()
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""DataSets that read their rows from a data file.
+
+A generated module full of row classes is slow to import once it holds tens
+of thousands of rows.  The ``datafile`` template of the fixture command
+instead writes each DataSet's rows to a pickled data file and generates a
+small :class:`DataFileSet` stub that streams those rows when it is loaded.
+
+"""
+
+import os
+import sys
+import types
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from fixture.dataset import DataSet, Ref
+
+__all__ = ['DataFileSet', 'RowRef', 'write_rows', 'read_rows']
+
+class RowRef(object):
+    """a reference to a column of a row in another DataSet, as stored in a
+    data file.
+
+    When the row is read it becomes a :class:`Ref.Value <fixture.dataset.RefValue>`,
+    just like ``OtherData.some_row.ref('id')`` in a DataSet class.  If 
+    attr_name is None it becomes a stand-in for the row itself, just like 
+    ``OtherData.some_row``.
+    """
+    def __init__(self, dataset_name, key, attr_name=None):
+        self.dataset_name = dataset_name
+        self.key = key
+        self.attr_name = attr_name
+
+    def __repr__(self):
+        return "<%s to %s>" % (self.__class__.__name__, ".".join(
+            [n for n in (self.dataset_name, self.key, self.attr_name) if n]))
+
+    def __eq__(self, other):
+        return (isinstance(other, RowRef) and
+                (self.dataset_name, self.key, self.attr_name) ==
+                (other.dataset_name, other.key, other.attr_name))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def resolve(self, dataset_class):
+        """returns a Ref.Value (or a row) for this row of dataset_class."""
+        if self.attr_name is None:
+            # rowlike, which is all a loader needs to find the stored object
+            return types.ClassType(self.key, (), {'_dataset': dataset_class})
+        return Ref(dataset_class, _RowName(self.key))(self.attr_name)
+
+class _RowName(object):
+    # Ref only needs the name of the row
+    def __init__(self, name):
+        self.__name__ = name
+
+def write_rows(fp, rows):
+    """writes (key, dict of column values) pairs to fp, one pickle per row."""
+    pickler = pickle.Pickler(fp, 2)
+    for key, values in rows:
+        pickler.dump((key, dict(values)))
+        # don't let the pickler keep every row in its memo :
+        pickler.clear_memo()
+
+def read_rows(fp):
+    """yields (key, dict of column values) pairs written by write_rows()"""
+    unpickler = pickle.Unpickler(fp)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+class DataFileSet(DataSet):
+    """a DataSet whose rows are streamed from a data file when it is loaded.
+
+    The file is named by the ``datafile`` attribute of the ``Meta`` class.  A
+    relative path is relative to the module the DataSet is declared in.  Any
+    DataSet whose rows are referenced must be listed in ``Meta.references``::
+
+        class ProductData(DataFileSet):
+            class Meta:
+                datafile = 'ProductData.pkl'
+                references = (CategoryData,)
+
+    Rows are not read until the DataSet is iterated, i.e. by a loader.  Once
+    loaded, rows are accessible by attribute like in any other DataSet.
+    """
+    _reserved_attr = DataSet._reserved_attr + ('datafile_path', 'read_rows')
+    # reads (key, dict of column values) pairs from an open file :
+    _read_datafile = staticmethod(read_rows)
+
+    def data(self):
+        # rows are read from the data file by __iter__ when loading
+        return []
+
+    def __iter__(self):
+        if self.meta.keys:
+            return DataSet.__iter__(self)
+        return self.read_rows()
+
+    def datafile_path(self):
+        """returns the absolute path to Meta.datafile"""
+        path = self.meta.datafile
+        if not os.path.isabs(path):
+            mod = sys.modules.get(self.__class__.__module__)
+            if getattr(mod, '__file__', None):
+                path = os.path.join(os.path.dirname(mod.__file__), path)
+        return path
+
+    def read_rows(self):
+        """yields (key, row class) pairs read from the data file."""
+        references = {}
+        for ds in self.meta.references:
+            references[ds.__name__] = ds
+        def resolve(val):
+            if isinstance(val, RowRef):
+                return val.resolve(references[val.dataset_name])
+            elif type(val) in (types.ListType, types.TupleType):
+                return type(val)([resolve(v) for v in val])
+            return val
+        fp = open(self.datafile_path(), 'rb')
+        try:
+            for key, values in self._read_datafile(fp):
+                for col, val in values.items():
+                    values[col] = resolve(val)
+                yield key, type(key, (self.meta.row,), values)
+        finally:
+            fp.close()
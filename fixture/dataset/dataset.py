@@ -472,11 +472,29 @@ class DataSet(DataContainer):
                     for ds in iter(self.meta.references)
             ])
         
+        rows = None
+        cache = None
+        if getattr(type(self).data, 'im_func', None) is DataSet.data.im_func:
+            # only class-style rows can be cached
+            from fixture.dataset.cache import active_cache
+            cache = active_cache()
+        if cache is not None:
+            cached = cache.load(type(self))
+            if cached is not None:
+                self.meta.references, rows = cached
+                self.meta._built = True
+        
         # data def style classes, so they have refs before data is walked
         if len(self.meta.references) > 0:
             self.ref = mkref()
+        
+        if rows is None:
+            rows = self.data()
+            if cache is not None:
+                rows = list(rows)
+                cache.save(type(self), self.meta.references, rows)
             
-        for key, data in self.data():
+        for key, data in rows:
             if key in self:
                 raise ValueError(
                     "data() cannot redeclare key '%s' "
@@ -13,9 +13,31 @@ from os.path import exists as path_exists
 
 from tempfile import mkdtemp
 import atexit
+import itertools
 _tmpdirs = set()
+# mkdtemp keywords -> empty directories that pooled TempIOs can reuse
+_pool = {}
+# directories renamed aside, to be deleted by a background thread :
+_trash = None
+_trash_thread = None
+_trash_names = itertools.count()
+# pooled directory -> number of the TempIO currently using it
+_leases = {}
+_lease_numbers = itertools.count()
 
-def TempIO(deferred=False, **kw):
+# template specs -> directories they were put in, once per process
+_templates = {}
+# templates whose files could not be reflinked
+_no_reflink = set()
+# the Linux ioctl that clones a file, sharing its blocks until written :
+FICLONE = 0x40049409
+# RAM-backed directories (tmpfs) that ram=True looks for :
+RAM_ROOTS = ('/dev/shm', '/run/shm')
+# bytes a RAM-backed TempIO must have free unless given a size_hint :
+DEFAULT_SIZE_HINT = 64 * 1024 * 1024
+
+def TempIO(deferred=False, pooled=False, template=None, ram=False, 
+           size_hint=DEFAULT_SIZE_HINT, **kw):
     """self-destructing, temporary directory.
     
     Takes the same keyword args as tempfile.mkdtemp with these additional 
@@ -25,6 +47,29 @@ def TempIO(deferred=False, **kw):
         If True, destruction will be put off until atexit.  Otherwise, 
         it will be destructed when it falls out of scope
     
+    ``pooled``
+        If True, the directory is taken from a pool of directories left by 
+        earlier pooled TempIOs created with the same keywords, if any.  When 
+        destructed, its contents are renamed aside and deleted in a 
+        background thread and the emptied directory goes back to the pool.
+    
+    ``template``
+        a directory, or a dict of names to contents like the one 
+        :meth:`DirPath.put_tree` takes (put in a directory once per process), 
+        to copy into the new directory.  Files are cloned copy-on-write where 
+        the filesystem supports it (i.e. btrfs or xfs), otherwise they are 
+        copied.
+    
+    ``ram``
+        If True and no ``dir`` was given, the directory is made in RAM (see 
+        :func:`ram_root`) when there is at least ``size_hint`` bytes free 
+        there, plus the size of the template.  Otherwise it is made on disk 
+        as usual.
+    
+    ``size_hint``
+        the most a RAM-backed directory is expected to hold, in bytes 
+        (defaults to 64MB)
+    
     Returns an instance of :class:`DeletableDirPath`
     
     """
@@ -34,25 +79,209 @@ def TempIO(deferred=False, **kw):
         # a breadcrumb ...
         kw['prefix'] = 'tmp_fixture_'
     
-    tmp_path = path.realpath(mkdtemp(**kw))
+    if template is not None:
+        template = _template_path(template)
+    if ram and 'dir' not in kw:
+        if template is not None:
+            size_hint += _tree_size(template)
+        root = ram_root()
+        if root is not None and free_space(root) >= size_hint:
+            kw['dir'] = root
+    
+    pool_key = tmp_path = None
+    if pooled:
+        pool_key = _pool_key(kw)
+        pool = _pool.get(pool_key, [])
+        while pool and tmp_path is None:
+            tmp_path = pool.pop()
+            if not path_exists(tmp_path):
+                # i.e. its parent was removed
+                _tmpdirs.discard(tmp_path)
+                tmp_path = None
+    if tmp_path is None:
+        tmp_path = path.realpath(mkdtemp(**kw))
     root = DeletableDirPath(tmp_path)
     root._deferred = deferred
+    root._pool_key = pool_key
+    if pooled:
+        root._lease = _leases[tmp_path] = _lease_numbers.next()
     _tmpdirs.add(tmp_path)
+    if template is not None:
+        clonetree(template, tmp_path)
     return root
 
+def ram_root():
+    """returns a RAM-backed directory to make temp dirs in, or None.
+    
+    This is the directory named by the ``FIXTURE_TEMPIO_RAM_ROOT`` 
+    environment variable if set, otherwise the first writable directory of 
+    RAM_ROOTS (i.e. ``/dev/shm`` on Linux).
+    """
+    configured = os.environ.get('FIXTURE_TEMPIO_RAM_ROOT')
+    for root in configured and [configured] or RAM_ROOTS:
+        if path.isdir(root) and os.access(root, os.W_OK):
+            return root
+    return None
+
+def free_space(directory):
+    """returns the bytes available in the filesystem of directory (0 if it 
+    cannot be found out)
+    """
+    try:
+        st = os.statvfs(directory)
+    except (AttributeError, OSError):
+        # i.e. windows
+        return 0
+    return st.f_bavail * st.f_frsize
+
+def _tree_size(directory):
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            size += os.lstat(join(dirpath, name)).st_size
+    return size
+
+def _template_key(tree):
+    items = []
+    for name, contents in tree.items():
+        if isinstance(contents, dict):
+            contents = _template_key(contents)
+        else:
+            try:
+                hash(contents)
+            except TypeError:
+                # i.e. an mmap
+                contents = id(contents)
+        items.append((name, contents))
+    items.sort()
+    return tuple(items)
+
+def _template_path(template):
+    """returns the directory of template, putting it first if it's a dict"""
+    if not isinstance(template, dict):
+        return path.realpath(template)
+    key = _template_key(template)
+    if key not in _templates:
+        tmp = TempIO(deferred=True, prefix='tmp_fixture_template_')
+        tmp.put_tree(template)
+        _templates[key] = tmp
+    return _templates[key]
+
+def reflink(source, dest):
+    """clones file source to dest so that they share their data until 
+    either is written.
+    
+    Raises EnvironmentError (or ImportError, where there is no fcntl) when 
+    the filesystem cannot clone files.
+    """
+    import fcntl
+    src = open(source, 'rb')
+    try:
+        dst = open(dest, 'wb')
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+def clonetree(source, dest):
+    """copies everything in directory source to the existing directory 
+    dest.
+    
+    Files are cloned with :func:`reflink` if possible, otherwise copied.  
+    Symbolic links are copied as links.
+    """
+    import shutil
+    use_reflink = source not in _no_reflink
+    for dirpath, dirnames, filenames in os.walk(source):
+        target = join(dest, dirpath[len(source):].lstrip(os.path.sep))
+        for name in dirnames + filenames:
+            src = join(dirpath, name)
+            dst = join(target, name)
+            if path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            elif name in dirnames:
+                os.mkdir(dst)
+            else:
+                if use_reflink:
+                    try:
+                        reflink(src, dst)
+                        continue
+                    except (EnvironmentError, ImportError):
+                        use_reflink = False
+                        _no_reflink.add(source)
+                shutil.copyfile(src, dst)
+
+def _pool_key(kw):
+    items = kw.items()
+    items.sort()
+    return tuple(items)
+
 def _expunge(tmpdir):
     """called internally to remove a tmp dir."""
     if path_exists(tmpdir):
         import shutil
         shutil.rmtree(tmpdir)
+    _tmpdirs.discard(tmpdir)
+
+def _recycle(tmpdir, pool_key):
+    """called internally to empty a pooled tmp dir and put it back in the 
+    pool.
+    """
+    if not path_exists(tmpdir):
+        _tmpdirs.discard(tmpdir)
+        return
+    trash = "%s.trash%s" % (tmpdir, _trash_names.next())
+    try:
+        os.rename(tmpdir, trash)
+    except OSError:
+        # i.e. a file is still open on windows
+        _expunge(tmpdir)
+    else:
+        _delete_later(trash)
+    os.mkdir(tmpdir, 0700)
+    _tmpdirs.add(tmpdir)
+    _pool.setdefault(pool_key, []).append(tmpdir)
+
+def _delete_later(trash):
+    """deletes the directory trash in a background thread."""
+    global _trash, _trash_thread
+    if _trash_thread is None:
+        import threading, Queue
+        _trash = Queue.Queue()
+        _trash_thread = threading.Thread(target=_empty_trash, args=(_trash,))
+        _trash_thread.setDaemon(True)
+        _trash_thread.start()
+    _trash.put(trash)
+
+def _empty_trash(trash):
+    import shutil
+    while True:
+        tmpdir = trash.get()
+        if tmpdir is None:
+            return
+        shutil.rmtree(tmpdir, True)
+
+def _join_trash():
+    """waits until all directories renamed aside have been deleted."""
+    global _trash, _trash_thread
+    if _trash_thread is None:
+        return
+    _trash.put(None)
+    _trash_thread.join()
+    _trash = _trash_thread = None
         
 def _expunge_all():
     """exit function to remove all registered tmp dirs."""
     if _tmpdirs is None:
         return
-
-    for d in _tmpdirs:
+    
+    _join_trash()
+    for d in list(_tmpdirs):
         _expunge(d)
+    _pool.clear()
+    _templates.clear()
     
 # this seems to be a safer way to clean up since __del__ can
 # be called in an unpredictable environment :
@@ -99,6 +328,36 @@ def putfile(filename, contents, filelike=None, mode=None):
     filelike.write(contents)
     filelike.close()
     
+def copyfile(source, dest):
+    """copies the open file source to the open file dest from where source 
+    is.
+    
+    A real file is mapped into memory and written from there, a mmap object 
+    is written as is and anything else with a read() method is copied in 
+    chunks.
+    """
+    import mmap
+    if isinstance(source, mmap.mmap):
+        dest.write(source)
+        return
+    fileno = getattr(source, 'fileno', None)
+    if fileno is not None:
+        try:
+            size = os.fstat(fileno()).st_size
+            offset = source.tell()
+            if size and not offset:
+                mapped = mmap.mmap(fileno(), size, access=mmap.ACCESS_READ)
+                try:
+                    dest.write(mapped)
+                finally:
+                    mapped.close()
+                return
+        except (EnvironmentError, ValueError, AttributeError):
+            # not a regular file, i.e. a pipe
+            pass
+    import shutil
+    shutil.copyfileobj(source, dest)
+
 class DirPath(str):
     """
     A directory path.
@@ -188,6 +447,64 @@ class DirPath(str):
         putfile(f, contents, mode=mode)
         return f
     
+    def put_tree(self, tree, mode=None):
+        """puts a tree of files and directories relative to this path, in one 
+        pass.
+        
+        tree is a dict of names to contents.  A name can be a relative path.  
+        Contents can be a string (the contents of a file, written in mode 
+        which defaults to ``'w'``), a dict (a sub-directory and its own tree) 
+        or an open file or mmap object (copied in binary mode, see 
+        :func:`copyfile`)::
+        
+            >>> tmp = TempIO()
+            >>> files = tmp.put_tree({
+            ...     'README': 'read me',
+            ...     'src': {'app.py': 'print 1', 'lib/util.py': ''},
+            ...     'empty': {}})
+            >>> len(files)
+            3
+            >>> sorted(os.listdir(tmp.join('src')))
+            ['app.py', 'lib']
+        
+        Each directory is only made (and checked for) once.  Returns the 
+        absolute filename of every file.
+        """
+        if mode is None:
+            mode = 'w'
+        made = set()
+        def mkdirs(dirname):
+            if not dirname or dirname in made:
+                return
+            if not path_exists(dirname):
+                mkdirs(split(dirname)[0])
+                os.mkdir(dirname)
+            made.add(dirname)
+        filenames = []
+        def put(parent, tree):
+            for name, contents in tree.items():
+                if name.startswith(os.path.sep):
+                    raise TypeError(
+                        "names in a tree must be relative paths, not '%s'" % 
+                                                                        name)
+                target = join(parent, name)
+                if isinstance(contents, dict):
+                    mkdirs(target)
+                    put(target, contents)
+                    continue
+                mkdirs(split(target)[0])
+                if hasattr(contents, 'read'):
+                    dest = open(target, 'wb')
+                    try:
+                        copyfile(contents, dest)
+                    finally:
+                        dest.close()
+                else:
+                    putfile(target, contents, filelike=open(target, mode))
+                filenames.append(target)
+        put(str(self), tree)
+        return [self._wrap(f) for f in filenames]
+    
     def realpath(self):
         """``os.path.realpath(self)``"""
         return self._wrap(path.realpath(self))
@@ -218,7 +535,7 @@ class DeletableDirPath(DirPath):
             # atexit will handle it ...
             return
         try:
-            _expunge(self)
+            self.rmtree()
         except:
             # means atexit didn't get it and there was some other exception
             # due to the unpredictable state of python's destructors; there is
@@ -230,8 +547,16 @@ class DeletableDirPath(DirPath):
         
         This can be trusted more than :meth:`del self <fixture.io.DeletableDirPath.__del__>` because it is guaranteed to 
         remove the directory tree.
+        
+        A pooled directory is emptied and goes back to the pool instead.
         """
-        _expunge(self)
+        if getattr(self, '_pool_key', None) is not None:
+            if _leases.get(str(self)) == self._lease:
+                # once only, another TempIO may be using it next
+                del _leases[str(self)]
+                _recycle(str(self), self._pool_key)
+        else:
+            _expunge(str(self))
 
 if __name__ == '__main__':
     import doctest
@@ -2,7 +2,7 @@
 """Loadable fixture components"""
 
 __all__ = ['SQLAlchemyFixture', 'SQLObjectFixture', 'GoogleDatastoreFixture',
-           'DjangoFixture', 'StormFixture']
+           'DjangoFixture', 'StormFixture', 'EnvIndex']
 import loadable
 __doc__ = loadable.__doc__
 from loadable import *
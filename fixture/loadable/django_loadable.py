@@ -235,8 +235,8 @@ class DjangoFixture(DBLoadableFixture):
     
     def _attach_storage_medium_from_app_label(self, django_app_label, ds):
         if not ds.meta.storable_name:
-            ds.meta.storable_name = self.style.guess_storable_name(
-                                                        ds.__class__.__name__)
+            ds.meta.storable_name = self.style.translator(
+                            'guess_storable_name')(ds.__class__.__name__)
         from django.db.models.loading import get_model
         model = get_model(django_app_label, ds.meta.storable_name)
         if not model:
@@ -5,8 +5,10 @@ See :ref:`Using LoadableFixture<using-loadable-fixture>` for examples.
 
 """
 # from __future__ import with_statement
-__all__ = ['LoadableFixture', 'EnvLoadableFixture', 'DBLoadableFixture', 'DeferredStoredObject']
+__all__ = ['LoadableFixture', 'EnvLoadableFixture', 'DBLoadableFixture', 'DeferredStoredObject',
+           'EnvIndex']
 import sys, types
+from warnings import warn
 from fixture.base import Fixture
 from fixture.util import ObjRegistry, _mklog
 from fixture.style import OriginalStyle
@@ -62,6 +64,24 @@ class StorageMediumAdapter(object):
         By default it does nothing.
         """
         pass
+    
+    def version(self):
+        """Returns a value that changes whenever the stored objects change.
+        
+        Used in sticky mode to tell whether stored objects were changed 
+        since they were loaded, so it must be cheap to read; i.e. not 
+        depend on how many objects are stored.  By default it returns None, 
+        meaning it cannot tell, so the DataSet is always reloaded.
+        """
+        return None
+    
+    def flush(self):
+        """Called after save() has been called for every row in the DataSet.
+        
+        Adapters that buffer rows (i.e. for a multi-row INSERT) must 
+        store anything still pending here.  By default it does nothing.
+        """
+        pass
 
 class LoadQueue(ObjRegistry):
     """Keeps track of what class instances were loaded.
@@ -113,6 +133,14 @@ class LoadQueue(ObjRegistry):
         self._pushid(id, level)
         return id
     
+    def remove(self, obj):
+        """forget that this object was loaded"""
+        id = ObjRegistry.remove(self, obj)
+        if id in self.limit:
+            self.tree[self.limit[id]].remove(id)
+            del self.limit[id]
+        return id
+    
     def referenced(self, obj, level):
         """tell the queue that this object was referenced again at level.
         """
@@ -154,18 +182,35 @@ class LoadableFixture(Fixture):
     medium
         optional LoadableFixture.StorageMediumAdapter to store DataSet 
         objects with
+    sticky
+        if True, :meth:`unload` keeps the data loaded so that the next load 
+        of the same DataSets can reuse it (see :meth:`prepare_load`).  Only 
+        DataSets whose storage medium has a 
+        :meth:`StorageMediumAdapter.version` are kept; the others are 
+        reloaded every time, with a warning.
     
     """
     style = OriginalStyle()
     dataclass = Fixture.dataclass
     
-    def __init__(self, style=None, medium=None, **kw):
+    def __init__(self, style=None, medium=None, sticky=False, **kw):
         Fixture.__init__(self, loader=self, **kw)
         if style:
             self.style = style
         if medium:
             self.Medium = medium
         self.loaded = None
+        self.sticky = sticky
+        # in sticky mode, True when unload() kept the data loaded :
+        self.parked = False
+        # datasets of the last load and versions of their media, by class id
+        self.parked_graph = {}
+        self.versions = {}
+        # names of media that sticky mode warned about :
+        self.unversioned = set()
+        # True when loading on top of datasets that were kept loaded :
+        self.reusing = False
+        self.skip_load = False
     
     StorageMediumAdapter = StorageMediumAdapter
     Medium = StorageMediumAdapter
@@ -178,19 +223,60 @@ class LoadableFixture(Fixture):
     
     def begin(self, unloading=False):
         """begin loading"""
-        if not unloading:
+        if not unloading and not self.reusing:
             self.loaded = self.LoadQueue()
     
     def commit(self):
         """commit load transaction"""
         raise NotImplementedError
     
+    def dataset_graph(self, datasets):
+        """returns datasets and every DataSet they reference, as a dict of 
+        shared instances by class id.
+        
+        datasets can be DataSet classes or instances.
+        """
+        graph = {}
+        def visit(ds):
+            if isinstance(ds, type):
+                ds = ds.shared_instance(default_refclass=self.dataclass)
+            if dataset_registry.id(ds) in graph:
+                return
+            graph[dataset_registry.id(ds)] = ds
+            for ref_ds in ds.meta.references:
+                visit(ref_ds)
+        for ds in datasets:
+            visit(ds)
+        return graph
+    
     def load(self, data):
         """load data"""
+        if self.skip_load:
+            log.info("REUSING datasets kept loaded: %s", data)
+            self.reusing = self.skip_load = False
+            return
         def loader():
-            for ds in data:
-                self.load_dataset(ds)
-        self.wrap_in_transaction(loader, unloading=False)
+            self.load_datasets(data)
+        try:
+            self.wrap_in_transaction(loader, unloading=False)
+        finally:
+            self.reusing = False
+        if self.sticky:
+            self.parked_graph = self.dataset_graph(data)
+            def remember_versions():
+                versions = {}
+                self.versions = {}
+                for id, ds in self.loaded.registry.items():
+                    version = self.version(ds, versions)
+                    if version is None:
+                        self.warn_unversioned(ds)
+                    self.versions[id] = version
+            self.wrap_in_transaction(remember_versions, unloading=True)
+    
+    def load_datasets(self, data):
+        """load each dataset in data, within the load transaction"""
+        for ds in data:
+            self.load_dataset(ds)
         
     def load_dataset(self, ds, level=1):
         """load this dataset and all its dependent datasets.
@@ -243,6 +329,11 @@ class LoadableFixture(Fixture):
             except Exception, e:
                 etype, val, tb = sys.exc_info()
                 raise LoadError(etype, val, ds, key=key, row=row), None, tb
+        try:
+            ds.meta.storage_medium.flush()
+        except Exception, e:
+            etype, val, tb = sys.exc_info()
+            raise LoadError(etype, val, ds), None, tb
     
     def resolve_row_references(self, current_dataset, row):        
         """resolve this DataRow object's referenced values.
@@ -277,20 +368,106 @@ class LoadableFixture(Fixture):
                 # when __get__ is invoked
                 ref.dataset_obj = self.loaded[ref.dataset_class]
     
+    def prepare_load(self, datasets):
+        """prepare to load datasets (DataSet classes).
+        
+        In sticky mode, the data kept loaded by :meth:`unload` is compared 
+        with datasets first.  Loaded DataSets that are no longer needed or 
+        whose storage medium changed since they were loaded (according to 
+        :meth:`StorageMediumAdapter.version`) are unloaded, along with those 
+        referencing them.  The others stay loaded and the next load only 
+        loads what is missing, or does nothing at all.
+        """
+        self.reusing = self.skip_load = False
+        if not self.parked:
+            return
+        self.parked = False
+        graph = self.dataset_graph(datasets)
+        def sweep():
+            stale = self.stale_datasets(graph)
+            for ds in self.loaded.to_unload():
+                if self.loaded.id(ds) in stale:
+                    self.unload_dataset(ds)
+            if len(stale) == len(self.loaded.registry):
+                self.loaded.clear()
+                dataset_registry.clear()
+                self.versions = {}
+                return
+            log.info("KEEPING datasets loaded, unloaded %s", stale.values())
+            for id, ds in stale.items():
+                self.loaded.remove(ds)
+                if ds in dataset_registry:
+                    # the next load builds a fresh instance
+                    dataset_registry.remove(ds)
+                del self.versions[id]
+            self.reusing = True
+            missing = [id for id in graph if id not in self.parked_graph]
+            self.skip_load = not stale and not missing
+        self.wrap_in_transaction(sweep, unloading=True)
+    
+    def stale_datasets(self, graph):
+        """returns the loaded datasets that cannot be kept to load graph 
+        (see :meth:`dataset_graph`), as a dict by class id.
+        
+        These are the datasets not in graph, those whose storage medium 
+        changed since they were loaded and those that reference any of them.
+        """
+        loaded = dict(self.loaded.registry)
+        stale = {}
+        versions = {}
+        for id, ds in loaded.items():
+            if id not in graph:
+                stale[id] = ds
+                continue
+            version = self.version(ds, versions)
+            if version is None or version != self.versions.get(id):
+                stale[id] = ds
+        changed = True
+        while changed:
+            changed = False
+            for id, ds in loaded.items():
+                if id in stale:
+                    continue
+                for ref_ds in ds.meta.references:
+                    if self.loaded.id(ref_ds) in stale:
+                        stale[id] = ds
+                        changed = True
+                        break
+        return stale
+    
     def rollback(self):
         """rollback load transaction"""
         raise NotImplementedError
     
+    def savepoint(self):
+        """begin a savepoint after data was loaded.
+        
+        Returns an object with a ``rollback()`` method or None if savepoints 
+        are not supported (the default).
+        """
+        return None
+    
     def then_finally(self, unloading=False):
         """called in a finally block after load transaction has begun"""
         pass
     
-    def unload(self):
-        """unload data"""
+    def unload(self, force=False):
+        """unload data
+        
+        In sticky mode the data stays loaded for the next load to reuse, 
+        unless force is True.
+        """
         if self.loaded is None:
             raise UninitializedError(
                 "Cannot unload data because it has not yet been loaded in this "
                 "process.  Call data.setup() before data.teardown()")
+        if self.sticky and not force:
+            log.info("KEEPING data loaded for the next load")
+            self.parked = True
+            return
+        self.parked = False
+        self.parked_graph = {}
+        self.versions = {}
         def unloader():
             for dataset in self.loaded.to_unload():
                 self.unload_dataset(dataset)
@@ -302,6 +479,28 @@ class LoadableFixture(Fixture):
         """unload data stored for this dataset"""
         dataset.meta.storage_medium.clearall()
     
+    def version(self, ds, versions):
+        """returns the :meth:`StorageMediumAdapter.version` of dataset's 
+        storage medium.
+        
+        versions is a dict of those already read, since several DataSets 
+        may be stored in the same medium.
+        """
+        medium = ds.meta.storage_medium
+        if id(medium.medium) not in versions:
+            versions[id(medium.medium)] = medium.version()
+        return versions[id(medium.medium)]
+    
+    def warn_unversioned(self, ds):
+        """warns once per storage medium that sticky mode cannot keep 
+        dataset loaded."""
+        name = ds.meta.storable_name
+        if name in self.unversioned:
+            return
+        self.unversioned.add(name)
+        warn("sticky=True cannot tell whether %s changed since its storage "
+             "medium has no version(); it is reloaded for every test" % name)
+    
     def wrap_in_transaction(self, routine, unloading=False):
         """call routine in a load transaction"""
         self.begin(unloading=unloading)
@@ -326,6 +525,8 @@ class EnvLoadableFixture(LoadableFixture):
     def __init__(self, env=None, **kw):
         LoadableFixture.__init__(self, **kw)
         self.env = env
+        # (id of env, name) -> (env, storable) found by find_storable()
+        self._storables = {}
     
     def attach_storage_medium(self, ds):
         """Lookup a storage medium in the ``env`` and attach it to a DataSet.
@@ -352,17 +553,10 @@ class EnvLoadableFixture(LoadableFixture):
         
         if not storable:
             if not ds.meta.storable_name:
-                ds.meta.storable_name = self.style.guess_storable_name(
-                                                        ds.__class__.__name__)
-        
-            if hasattr(self.env, 'get'):
-                storable = self.env.get(ds.meta.storable_name, None)
-            if not storable:
-                if hasattr(self.env, ds.meta.storable_name):
-                    try:
-                        storable = getattr(self.env, ds.meta.storable_name)
-                    except AttributeError:
-                        pass
+                ds.meta.storable_name = self.style.translator(
+                            'guess_storable_name')(ds.__class__.__name__)
+            
+            storable = self.find_storable(ds.meta.storable_name)
         
             if not storable:
                 repr_env = repr(type(self.env))
@@ -381,12 +575,161 @@ class EnvLoadableFixture(LoadableFixture):
                                         ds.__class__.__name__, ds.__class__))
         ds.meta.storage_medium = self.Medium(storable, ds)
         
+    def find_storable(self, name):
+        """Returns the object named name in the ``env``, or None.
+        
+        The method first tries ``env.get(name)`` then ``getattr(env, name)``.  
+        Objects found are remembered so that each name is only looked up once 
+        in an env.
+        """
+        key = (id(self.env), name)
+        if key in self._storables:
+            return self._storables[key][1]
+        storable = None
+        if hasattr(self.env, 'get'):
+            storable = self.env.get(name, None)
+        if not storable:
+            if hasattr(self.env, name):
+                try:
+                    storable = getattr(self.env, name)
+                except AttributeError:
+                    pass
+        if storable:
+            # keeping env makes sure its id isn't reused
+            self._storables[key] = (self.env, storable)
+        return storable
+    
     def resolve_stored_object(self, column_val):
         if type(column_val)==DeferredStoredObject:
             return column_val.get_stored_object_from_loader(self)
         else:
             return column_val
 
+class EnvIndex(object):
+    """An index of storable objects by name, built once from many sources, 
+    to use as the ``env`` of any number of :class:`EnvLoadableFixture` objects.
+    
+    Each source can be:
+    
+    - a module : classes declared in it and `SQLAlchemy`_ Table objects are 
+      indexed by the name they have in the module
+    - a SQLAlchemy MetaData object : its tables are indexed by table name
+    - a SQLAlchemy declarative base class : its mapped classes are indexed by 
+      class name
+    - a dict : its items are indexed as they are
+    
+    For example::
+    
+        >>> class Employee(object):
+        ...     pass
+        ...
+        >>> env = EnvIndex({'Employee': Employee}, {'Employee': Employee})
+        >>> env.get('Employee') is Employee
+        True
+    
+    A name found in several sources must name the same object; otherwise a 
+    ValueError is raised when the index is built, rather than when loading.
+    
+    Keyword Arguments:
+    
+    style
+        a :class:`Style <fixture.style.Style>` object.  If given, every 
+        object is also indexed under the alias 
+        ``style.guess_storable_name(name)``, the name that 
+        :meth:`attach_storage_medium() <EnvLoadableFixture.attach_storage_medium>` 
+        looks up for a DataSet named like the object, i.e. ``tbl_Employee`` 
+        for ``Employee`` with ``PaddedNameStyle(prefix='tbl_')``.  Names the 
+        style cannot translate (like ``Employee`` with ``NamedDataStyle``, 
+        which expects ``EmployeeData``) get no alias.  A name always takes 
+        precedence over an alias and an alias of two different objects 
+        raises a ValueError.
+    
+    .. _SQLAlchemy: http://www.sqlalchemy.org/
+    
+    """
+    def __init__(self, *sources, **kw):
+        self.style = kw.pop('style', None)
+        if kw:
+            raise TypeError(
+                "unexpected keyword arguments: %s" % ", ".join(kw.keys()))
+        # name -> (storable, source)
+        self.names = {}
+        # alias -> (storable, name)
+        self.aliases = {}
+        for source in sources:
+            for name, storable in self.scan(source):
+                if name in self.names and self.names[name][0] is not storable:
+                    raise ValueError("%r is ambiguous: found in %s and %s" % (
+                        name, _source_name(self.names[name][1]), 
+                        _source_name(source)))
+                self.names[name] = (storable, source)
+        if self.style is not None:
+            guess = self.style.translator('guess_storable_name')
+            for name, (storable, source) in self.names.items():
+                try:
+                    alias = guess(name)
+                except (AssertionError, ValueError):
+                    # i.e. TrimmedNameStyle asserting a suffix
+                    continue
+                if alias == name or alias in self.names:
+                    continue
+                if alias in self.aliases and \
+                                    self.aliases[alias][0] is not storable:
+                    raise ValueError(
+                        "alias %r is ambiguous: it names %r and %r" % (
+                                    alias, self.aliases[alias][1], name))
+                self.aliases[alias] = (storable, name)
+    
+    def __repr__(self):
+        return "<%s of %s objects at %s>" % (
+                self.__class__.__name__, len(self.names), hex(id(self)))
+    
+    def __contains__(self, name):
+        return self.get(name) is not None
+    
+    def get(self, name, default=None):
+        """returns the object indexed under name or alias name, or default"""
+        if name in self.names:
+            return self.names[name][0]
+        if name in self.aliases:
+            return self.aliases[name][0]
+        return default
+    
+    def scan(self, source):
+        """returns (name, storable) pairs found in source"""
+        if isinstance(source, dict):
+            return source.items()
+        if isinstance(source, types.ModuleType):
+            try:
+                from sqlalchemy.schema import Table
+            except ImportError:
+                Table = None
+            found = []
+            for name, obj in vars(source).items():
+                if name.startswith('_'):
+                    continue
+                if isinstance(obj, (type, types.ClassType)):
+                    if obj.__module__ != source.__name__:
+                        # imported from somewhere else
+                        continue
+                elif Table is None or not isinstance(obj, Table):
+                    continue
+                found.append((name, obj))
+            return found
+        tables = getattr(source, 'tables', None)
+        if hasattr(tables, 'values'):
+            # a MetaData
+            return [(table.name, table) for table in tables.values()]
+        registry = getattr(source, '_decl_class_registry', None)
+        if registry is not None:
+            return registry.items()
+        raise TypeError("cannot index storable objects found in %r" % source)
+
+def _source_name(source):
+    if isinstance(source, types.ModuleType):
+        return "module %s" % source.__name__
+    return repr(source)
+
 class DBLoadableFixture(EnvLoadableFixture):
     """
     An abstract fixture that can load a DataSet into a database like thing.
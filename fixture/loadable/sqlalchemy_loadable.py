@@ -7,9 +7,15 @@ See :ref:`Using LoadableFixture<using-loadable-fixture>` for examples.
 
 """
 
-import sys
+import os, sys
+try:
+    from hashlib import md5
+except ImportError:
+    # python 2.4
+    from md5 import new as md5
 from fixture.loadable import DBLoadableFixture
 from fixture.exc import UninitializedError
+from fixture.util import atomic_write
 import logging
 
 log = logging.getLogger('fixture.loadable.sqlalchemy_loadable')
@@ -97,10 +103,22 @@ class SQLAlchemyFixture(DBLoadableFixture):
         SQLAlchemy object so you should only set this if you know what you 
         doing.
     
+    ``script_cache``
+        A directory to keep compiled load scripts in.  If set, the DataSets 
+        being loaded (all of which must be stored in Table objects) are 
+        compiled into one SQL script per dialect by :meth:`compile_script` 
+        and the script is executed in the load transaction, in a single call 
+        where the database allows it (see :func:`execute_script`), instead 
+        of inserting row by row.  The script is compiled again only when the 
+        source of one of the DataSet modules (or the modules of their base 
+        classes) changes.  Requires an ``engine`` or ``connection``.  
+        Defaults to None.
+    
     """
     Medium = staticmethod(negotiated_medium)
     
-    def __init__(self, engine=None, connection=None, session=None, scoped_session=None, **kw):
+    def __init__(self, engine=None, connection=None, session=None, scoped_session=None, 
+                        script_cache=None, **kw):
         # ensure import error by simulating what would happen in the global module :
         from sqlalchemy.orm import sessionmaker, scoped_session as sa_scoped_session 
         
@@ -111,6 +129,13 @@ class SQLAlchemyFixture(DBLoadableFixture):
         if scoped_session is None:
             scoped_session = Session
         self.Session = scoped_session
+        if script_cache is not None:
+            if (engine is None and connection is None and 
+                    getattr(session, 'bind', None) is None):
+                raise ValueError(
+                    "script_cache requires an engine or a connection")
+        self.script_cache = script_cache
+        self.preloaded = False
     
     def begin(self, unloading=False):
         """Begin loading data
@@ -151,6 +176,72 @@ class SQLAlchemyFixture(DBLoadableFixture):
         log.debug("transaction.commit() <- %s", self.transaction)
         DBLoadableFixture.commit(self)
     
+    def compile_script(self, datasets, dialect=None):
+        """Returns a SQL script that inserts all rows of datasets.
+        
+        datasets can be DataSet classes or instances; every DataSet they 
+        reference is included in the script before them.  Primary keys must 
+        be declared explicitly and Refs are resolved to the referenced values 
+        when compiling.  dialect defaults to that of the fixture's connection 
+        or engine.
+        
+        If ``script_cache`` is set, the script is read from the cache when 
+        one was already compiled for this dialect from the same DataSet 
+        source (see :func:`script_cache_key`).
+        """
+        if dialect is None:
+            dialect = (self.connection or self.engine or self.session.bind).dialect
+        ordered = []
+        def visit(ds):
+            for ref_ds in ds.meta.references:
+                visit(ref_ds.shared_instance(default_refclass=self.dataclass))
+            if ds in ordered or (self.loaded is not None and ds in self.loaded):
+                return
+            self.attach_storage_medium(ds)
+            if not is_table(ds.meta.storage_medium.medium):
+                raise ValueError(
+                    "cannot compile %s: only DataSets stored in Table "
+                    "objects can be compiled (got %s)" % (
+                        ds, ds.meta.storage_medium.medium))
+            ordered.append(ds)
+        for ds in datasets:
+            if isinstance(ds, type):
+                ds = ds.shared_instance(default_refclass=self.dataclass)
+            visit(ds)
+        
+        path = None
+        if self.script_cache is not None:
+            key = script_cache_key(ordered, dialect)
+            if key is not None:
+                path = os.path.join(self.script_cache, "%s.sql" % key)
+                if os.path.exists(path):
+                    log.info("using compiled script %s", path)
+                    fp = open(path, 'rb')
+                    try:
+                        return fp.read().decode('utf-8')
+                    finally:
+                        fp.close()
+        
+        from fixture.dataset.converter import exported_rows
+        statements = []
+        for ds in ordered:
+            table = ds.meta.storage_medium.medium
+            for key, values in exported_rows(ds):
+                for k in table.primary_key:
+                    if values.get(k.key) is None:
+                        raise ValueError(
+                            "cannot compile %s.%s: primary key %s must be "
+                            "declared" % (ds.__class__.__name__, key, k.key))
+                statements.append(render_insert(table, values, dialect))
+        script = u"".join([u"%s;\n" % stmt for stmt in statements])
+        
+        if path is not None:
+            if not os.path.exists(self.script_cache):
+                os.makedirs(self.script_cache)
+            atomic_write(path, script.encode('utf-8'))
+            log.info("compiled %s statements to %s", len(statements), path)
+        return script
+    
     def create_transaction(self):
         """Create a session transaction or a connection transaction
         
@@ -188,9 +279,36 @@ class SQLAlchemyFixture(DBLoadableFixture):
         if self.engine:
             self.engine.dispose()
     
+    def load_datasets(self, data):
+        """Load each dataset in data
+        
+        - if ``script_cache`` is set, executes the compiled script for data 
+          then only registers the inserted rows
+        """
+        if self.script_cache is None:
+            return DBLoadableFixture.load_datasets(self, data)
+        execute_script(self.connection, self.compile_script(data))
+        self.preloaded = True
+        try:
+            for ds in data:
+                self.load_dataset(ds)
+        finally:
+            self.preloaded = False
+    
     def rollback(self):
         """Rollback load transaction"""
         DBLoadableFixture.rollback(self)
+    
+    def savepoint(self):
+        """Begin a nested transaction (a SAVEPOINT) on the fixture's 
+        connection, or on its session if there is no connection.
+        
+        Only what is written through the same connection or session is 
+        rolled back by ``savepoint.rollback()``.
+        """
+        if self.connection is not None:
+            return self.connection.begin_nested()
+        return self.session.begin_nested()
 
 ## this was used in an if branch of clear() ... but I think this is no longer necessary with scoped sessions
 ## does it need to exist for 0.4 ?  not sure
@@ -219,14 +337,24 @@ class MappedClassMedium(DBLoadableFixture.StorageMediumAdapter):
     """
     def __init__(self, *a,**kw):
         DBLoadableFixture.StorageMediumAdapter.__init__(self, *a,**kw)
+        self.conn = None
+        
+    def version(self):
+        """Returns the :func:`table_version` of the mapped table"""
+        from sqlalchemy.orm import class_mapper
+        table = class_mapper(self.medium).mapped_table
+        return table_version(table, self.conn or self.session)
         
     def clear(self, obj):
         """Delete this object from the session"""
         self.session.delete(obj)
     
     def visit_loader(self, loader):
-        """Visits the :class:`SQLAlchemyFixture` loader and stores a reference to its session"""
+        """Visits the :class:`SQLAlchemyFixture` loader and stores a reference to its session 
+        and to its connection if there is one.
+        """
         self.session = loader.session
+        self.conn = loader.connection
         
     def save(self, row, column_vals):
         """Save a new object to the session if it doesn't already exist in the session."""
@@ -242,30 +370,85 @@ class MappedClassMedium(DBLoadableFixture.StorageMediumAdapter):
         return obj
 
 
-class LoadedTableRow(object):
-    def __init__(self, table, inserted_key, conn):
+class LoadedTableRows(object):
+    """Fetches the rows inserted into a table, all at once.
+    
+    Each :class:`LoadedTableRow` of a DataSet shares one instance of this 
+    class.  The first time a column is accessed on any of the rows, all 
+    registered rows are selected with one ``WHERE pk IN (...)`` statement per 
+    ``chunk_size`` rows.  Composite primary keys are matched by 
+    OR'ing together one AND clause per row.
+    """
+    chunk_size = 500
+    
+    def __init__(self, table, conn):
         self.table = table
         self.conn = conn
-        self.inserted_key = [k for k in inserted_key]
-        self.row = None
+        self.pending = []
     
-    def __getattr__(self, col):
-        if not self.row:
-            if len(self.inserted_key) > 1:
-                raise NotImplementedError(
-                    "%s does not support making a select statement with a "
-                    "composite key, %s.  This is probably fixable" % (
-                                        self.__class__.__name__, 
-                                        self.table.primary_key))
-            
-            first_pk = [k for k in self.table.primary_key][0]
-            id = getattr(self.table.c, first_pk.key)
-            stmt = self.table.select(id==self.inserted_key[0])
+    def __repr__(self):
+        return "<%s for %s (%s pending)>" % (
+            self.__class__.__name__, self.table, len(self.pending))
+    
+    def add(self, loaded_row):
+        """register a :class:`LoadedTableRow` to fetch later"""
+        self.pending.append(loaded_row)
+    
+    def fetch(self):
+        """select all pending rows and attach them to their LoadedTableRow"""
+        from sqlalchemy import and_, or_
+        pending, self.pending = self.pending, []
+        key_cols = [getattr(self.table.c, k.key) 
+                                    for k in self.table.primary_key]
+        by_key = {}
+        for loaded_row in pending:
+            by_key[tuple(loaded_row.inserted_key)] = loaded_row
+        keys = by_key.keys()
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i+self.chunk_size]
+            if len(key_cols) == 1:
+                where = key_cols[0].in_([k[0] for k in chunk])
+            else:
+                where = or_(*[
+                    and_(*[c==v for c,v in zip(key_cols, key)]) 
+                                                for key in chunk])
+            stmt = self.table.select(where)
             if self.conn:
                 c = self.conn.execute(stmt)
             else:
                 c = stmt.execute()
-            self.row = c.fetchone()
+            for row in c.fetchall():
+                key = tuple([row[col] for col in key_cols])
+                if key in by_key:
+                    by_key[key].row = row
+
+class LoadedTableRow(object):
+    """A row inserted by :class:`TableMedium`.
+    
+    Accessing a column fetches the row from the table (along with 
+    all other rows in ``rows``, a :class:`LoadedTableRows`) unless the 
+    row was already returned by an INSERT ... RETURNING statement.
+    """
+    def __init__(self, table, inserted_key, conn, rows=None, row=None):
+        self.table = table
+        self.conn = conn
+        self.inserted_key = [k for k in inserted_key]
+        self.row = row
+        if rows is None:
+            rows = LoadedTableRows(table, conn)
+        self.rows = rows
+        if self.row is None:
+            self.rows.add(self)
+    
+    def __getattr__(self, col):
+        if col.startswith('__'):
+            raise AttributeError(col)
+        if self.row is None:
+            self.rows.fetch()
+            if self.row is None:
+                raise LookupError(
+                    "could not select row with key %s from %s" % (
+                                        self.inserted_key, self.table))
         return getattr(self.row, col)
              
 class TableMedium(DBLoadableFixture.StorageMediumAdapter):
@@ -277,6 +460,10 @@ class TableMedium(DBLoadableFixture.StorageMediumAdapter):
     to `implicit connection rules`_.  Otherwise, 
     the respective connection or engine will be used to execute statements.
     
+    When the dialect supports it (i.e. PostgreSQL) rows are inserted with 
+    INSERT ... RETURNING so that the primary key, default values and 
+    computed columns are known right away without selecting the row again.
+    
     .. _SQLAlchemy Table objects: http://www.sqlalchemy.org/docs/04/ormtutorial.html#datamapping_tables
     .. _implicit connection rules: http://www.sqlalchemy.org/docs/04/dbengine.html#dbengine_implicit
     
@@ -285,6 +472,13 @@ class TableMedium(DBLoadableFixture.StorageMediumAdapter):
     def __init__(self, *a,**kw):
         DBLoadableFixture.StorageMediumAdapter.__init__(self, *a,**kw)
         self.conn = None
+        self.loaded_rows = None
+        self.use_returning = False
+        self.preloaded = False
+    
+    def version(self):
+        """Returns the :func:`table_version` of the table"""
+        return table_version(self.medium, self.conn)
         
     def clear(self, obj):
         """Constructs a delete statement per each primary key and 
@@ -308,6 +502,26 @@ class TableMedium(DBLoadableFixture.StorageMediumAdapter):
             self.conn = loader.connection
         else:
             self.conn = None
+        self.loaded_rows = LoadedTableRows(self.medium, self.conn)
+        self.preloaded = getattr(loader, 'preloaded', False)
+        if self.conn:
+            bind = self.conn
+        else:
+            bind = getattr(self.medium, 'bind', None)
+        self.use_returning = (bind is not None and 
+                              supports_returning(bind.dialect))
+    
+    def insert_statement(self):
+        """returns an insert statement for the table, returning all of 
+        its columns if possible
+        """
+        if not self.use_returning:
+            return self.medium.insert()
+        columns = [c for c in self.medium.c]
+        if sa_major < 0.6:
+            return self.medium.insert(postgres_returning=columns)
+        else:
+            return self.medium.insert().returning(*columns)
         
     def save(self, row, column_vals):
         """Constructs an insert statement with the given values and 
@@ -317,16 +531,27 @@ class TableMedium(DBLoadableFixture.StorageMediumAdapter):
         if not isinstance(self.medium, Table):
             raise ValueError(
                 "medium %s must be a Table instance" % self.medium)
+        
+        if self.preloaded:
+            # the row was inserted by a compiled script
+            return LoadedTableRow(self.medium, 
+                    [getattr(row, k.key) for k in self.medium.primary_key], 
+                    self.conn, rows=self.loaded_rows)
                 
-        stmt = self.medium.insert()
+        stmt = self.insert_statement()
         params = dict(list(column_vals))
         if self.conn:
             c = self.conn.execute(stmt, params)
         else:
             c = stmt.execute(params)
-
+        
+        inserted_row = None
+        if self.use_returning:
+            inserted_row = c.fetchone()
+            c.close()
+            primary_key = [inserted_row[k] for k in self.medium.primary_key]
         # In SQLAlchemy 0.8 this changed to a property with another name
-        if hasattr(c, "primary_key"):
+        elif hasattr(c, "primary_key"):
             primary_key = c.primary_key
         else:
             primary_key = c.last_inserted_ids()
@@ -341,7 +566,155 @@ class TableMedium(DBLoadableFixture.StorageMediumAdapter):
                 "expected primary_key %s, got %s (using table %s)" % (
                                 table_keys, inserted_keys, self.medium))
         
-        return LoadedTableRow(self.medium, primary_key, self.conn)
+        return LoadedTableRow(self.medium, primary_key, self.conn, 
+                              rows=self.loaded_rows, row=inserted_row)
+
+def bind_value(value, type_, dialect):
+    """Returns value as the DB-API module expects it for a column of 
+    SQLAlchemy type type_"""
+    process = type_.dialect_impl(dialect).bind_processor(dialect)
+    if process is not None:
+        value = process(value)
+    return value
+
+def sql_literal(value, type_, dialect):
+    """Returns value of SQLAlchemy type type_ as a SQL literal for dialect.
+    
+    See :func:`fixture.dataset.converter.sql_literal`.
+    """
+    from fixture.dataset.converter import sql_literal
+    return sql_literal(bind_value(value, type_, dialect), dialect.name)
+
+def render_insert(table, values, dialect):
+    """Returns an INSERT statement for table with a dict of column values.
+    
+    See :func:`fixture.dataset.converter.render_insert`; names are quoted 
+    by the dialect's identifier preparer.
+    """
+    from fixture.dataset.converter import render_insert
+    preparer = dialect.identifier_preparer
+    def quote(name):
+        if name is table:
+            return preparer.format_table(table)
+        return preparer.format_column(table.c[name])
+    processed = {}
+    for name in values.keys():
+        if name not in table.c:
+            raise ValueError("table %s has no column %r" % (table, name))
+        processed[name] = bind_value(values[name], table.c[name].type, dialect)
+    return render_insert(table, processed, dialect.name, quote=quote)
+
+def script_cache_key(datasets, dialect):
+    """Returns the key of a compiled script for datasets and dialect.
+    
+    The key is a digest of the source files of the modules the DataSets 
+    (and their DataSet base classes) are declared in and of the columns 
+    (name, type and nullability) of their tables, so editing any of them 
+    invalidates the script.  None is returned if a module has no source file 
+    (the script is not cached).
+    """
+    from fixture.dataset.cache import source_files
+    digest = md5()
+    digest.update(dialect.name)
+    seen = set()
+    for ds in datasets:
+        files = source_files(ds.__class__)
+        if files is None:
+            return None
+        for filename in files:
+            if filename in seen:
+                continue
+            seen.add(filename)
+            fp = open(filename, 'rb')
+            try:
+                digest.update(fp.read())
+            finally:
+                fp.close()
+        table = ds.meta.storage_medium.medium
+        digest.update("%s.%s:%s" % (ds.__class__.__module__, 
+                        ds.__class__.__name__, table.fullname))
+        for col in table.columns:
+            digest.update("%s %r %s" % (col.name, col.type, col.nullable))
+    return digest.hexdigest()
+
+def execute_script(connection, script):
+    """Executes a SQL script on connection, in its current transaction.
+    
+    With PostgreSQL, whose driver runs several statements at once, the 
+    script is sent to the DB-API cursor in a single call.  Other drivers 
+    run one statement per call (MySQLdb unless connected with the 
+    MULTI_STATEMENTS client flag, and sqlite, whose executescript() would 
+    commit the transaction first) so the statements are split by 
+    :func:`split_sql <fixture.dataset.converter.split_sql>` and executed 
+    one at a time.
+    """
+    from fixture.dataset.converter import split_sql
+    name = connection.dialect.name
+    cursor = connection.connection.cursor()
+    try:
+        if name in ('postgres', 'postgresql'):
+            cursor.execute(script)
+        else:
+            for stmt in split_sql(script, name):
+                cursor.execute(stmt)
+    finally:
+        cursor.close()
+
+def table_checksum(table, executor=None):
+    """Returns a digest of all rows in table, ordered by primary key.
+    
+    The select is executed with executor (a connection or session) or 
+    implicitly if there isn't one.  Since it reads every row, it is not 
+    used by sticky mode; a medium may still return it from ``version()`` 
+    for tables small enough, i.e.::
+    
+        class ChecksummedMedium(TableMedium):
+            def version(self):
+                return table_checksum(self.medium, self.conn)
+    """
+    stmt = table.select(order_by=[c for c in table.primary_key])
+    if executor is not None:
+        result = executor.execute(stmt)
+    else:
+        result = stmt.execute()
+    digest = md5()
+    for row in result:
+        digest.update(repr(tuple(row)))
+    return digest.hexdigest()
+
+def table_version(table, executor=None):
+    """Returns a value the database keeps that changes whenever a row of 
+    table changes, or None if it keeps none.
+    
+    Reading it does not depend on the number of rows, unlike 
+    :func:`table_checksum`.  Only MySQL tables that keep a live checksum 
+    (created with ``CHECKSUM=1``) have one, read with 
+    ``CHECKSUM TABLE ... QUICK``; sticky mode reloads the other tables 
+    for every test.
+    """
+    if executor is None:
+        executor = table.bind
+    dialect = getattr(executor, 'dialect', None)
+    if dialect is None:
+        # a session
+        dialect = getattr(getattr(executor, 'bind', None), 'dialect', None)
+    if dialect is None or dialect.name != 'mysql':
+        return None
+    row = executor.execute("CHECKSUM TABLE %s QUICK" % (
+                    dialect.identifier_preparer.format_table(table))).fetchone()
+    if row is None:
+        return None
+    return row[1]
+
+def supports_returning(dialect):
+    """True if INSERT ... RETURNING can be used with this dialect."""
+    if sa_major < 0.6:
+        # only 0.5's postgres dialect knows the postgres_returning keyword
+        return dialect.name in ('postgres', 'postgresql')
+    if hasattr(dialect, 'insert_returning'):
+        # sqlalchemy 2.0+ (includes sqlite 3.35+)
+        return bool(dialect.insert_returning)
+    return bool(getattr(dialect, 'implicit_returning', False))
 
 def is_assigned_mapper(obj):
     import sqlalchemy
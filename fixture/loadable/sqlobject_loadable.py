@@ -7,32 +7,215 @@ See :ref:`Using LoadableFixture<using-loadable-fixture>` for examples.
 
 """
 
+import sys
 from fixture.loadable import DBLoadableFixture
+from fixture.exc import UnloadError
+
+class LoadedSQLObject(object):
+    """A row inserted by :class:`SQLObjectMedium` without instantiating 
+    its SQLObject class.
+    
+    The ``id`` is known at insert time; the SQLObject instance is only 
+    fetched (once) when any other attribute is accessed.
+    """
+    def __init__(self, so_class, id, connection):
+        self.so_class = so_class
+        self.id = id
+        self.connection = connection
+        self.obj = None
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self.obj is None:
+            self.obj = self.so_class.get(self.id, connection=self.connection)
+        return getattr(self.obj, name)
+    
+    def __repr__(self):
+        return "<%s %s id=%s>" % (
+                self.__class__.__name__, self.so_class.__name__, self.id)
     
 class SQLObjectMedium(DBLoadableFixture.StorageMediumAdapter):
     """
     Adapter for storing data using `SQLObject`_ classes
+    
+    When the loader was configured with ``use_bulk_insert=True`` then rows 
+    that declare an id and a value for every column are buffered and stored 
+    with multi-row INSERT statements.  Each of these rows is stored as a 
+    :class:`LoadedSQLObject`.  All other rows are stored by instantiating 
+    the SQLObject class.
     """
+    def __init__(self, *a,**kw):
+        DBLoadableFixture.StorageMediumAdapter.__init__(self, *a,**kw)
+        self.connection = None
+        self.use_bulk_insert = False
+        self.bulk_insert_size = 500
+        self.so_style = None
+        self._attr_names = {}
+        self._db_columns = {}
+        self._pending = []
+        self._pending_cols = None
+        self._pending_delete = []
+    
     def clear(self, obj):
-        """Delete this object from the DB"""
-        obj.destroySelf()
+        """Delete this object from the DB
+        
+        A :class:`LoadedSQLObject` is deleted later on by :meth:`clearall` 
+        along with all other bulk inserted rows.
+        """
+        if isinstance(obj, LoadedSQLObject):
+            self._pending_delete.append(obj.id)
+        else:
+            obj.destroySelf()
+    
+    def clearall(self):
+        """Delete all stored objects.
+        
+        Rows that were bulk inserted are deleted with one statement per 
+        ``bulk_insert_size`` rows.
+        """
+        DBLoadableFixture.StorageMediumAdapter.clearall(self)
+        ids, self._pending_delete = self._pending_delete, []
+        if not ids:
+            return
+        from sqlobject import sqlbuilder
+        meta = self.medium.sqlmeta
+        try:
+            for i in range(0, len(ids), self.bulk_insert_size):
+                stmt = sqlbuilder.Delete(meta.table, 
+                            where=sqlbuilder.IN(
+                                sqlbuilder.SQLConstant(meta.idName), 
+                                ids[i:i+self.bulk_insert_size]))
+                self.transaction.query(self.transaction.sqlrepr(stmt))
+        except Exception, e:
+            etype, val, tb = sys.exc_info()
+            raise UnloadError(etype, val, self.dataset), None, tb
+        cache = getattr(self.transaction, 'cache', None)
+        if cache is not None:
+            for id in ids:
+                cache.expire(id, self.medium)
+    
+    def attr_name(self, name):
+        """translates a DataSet column name into a SQLObject attribute name 
+        (once per DataSet)
+        """
+        if name not in self._attr_names:
+            self._attr_names[name] = self.so_style.dbColumnToPythonAttr(name)
+        return self._attr_names[name]
+    
+    def db_column(self, name):
+        """returns (db column name, to_db) for a DataSet column.
         
+        to_db is a callable that converts a value into one suitable for an 
+        INSERT statement, or None if the column is the id.  Returns None if 
+        the column is not known to the SQLObject class.  Columns are 
+        translated once per DataSet.
+        """
+        if name in self._db_columns:
+            return self._db_columns[name]
+        from sqlobject.col import SOForeignKey
+        from sqlobject import sqlbuilder
+        meta = self.medium.sqlmeta
+        attr = self.attr_name(name)
+        
+        col = None
+        if attr in meta.columns:
+            col = meta.columns[attr]
+        else:
+            for c in meta.columnList:
+                if getattr(c, 'origName', None) == attr:
+                    col = c
+                    break
+        
+        if attr == 'id':
+            found = (meta.idName, None)
+        elif col is None:
+            found = None
+        elif isinstance(col, SOForeignKey):
+            def to_db(value):
+                if value is None or isinstance(value, (int, long)):
+                    return value
+                return value.id
+            found = (col.dbName, to_db)
+        elif getattr(col, 'from_python', None):
+            state = sqlbuilder.SQLObjectState(
+                                self.medium, connection=self.transaction)
+            def to_db(value, from_python=col.from_python):
+                if value is None:
+                    return value
+                return from_python(value, state)
+            found = (col.dbName, to_db)
+        else:
+            found = (col.dbName, lambda value: value)
+        self._db_columns[name] = found
+        return found
+    
+    def flush(self):
+        """Insert all buffered rows."""
+        from sqlobject import sqlbuilder
+        pending, self._pending = self._pending, []
+        self._pending_cols = None
+        for i in range(0, len(pending), self.bulk_insert_size):
+            stmt = sqlbuilder.Insert(self.medium.sqlmeta.table, 
+                                valueList=pending[i:i+self.bulk_insert_size])
+            self.transaction.query(self.transaction.sqlrepr(stmt))
+    
     def save(self, row, column_vals):
         """Save this row to the DB"""
-        from sqlobject.styles import getStyle
-        so_style = getStyle(self.medium)
-
         if hasattr(row, 'connection'):
             raise ValueError(
                     "cannot name a key 'connection' in row %s" % row)
-        dbvals = dict([(so_style.dbColumnToPythonAttr(k), v) 
-                                                    for k,v in column_vals])
+        column_vals = list(column_vals)
+        
+        if self.use_bulk_insert:
+            obj = self._buffer(column_vals)
+            if obj is not None:
+                return obj
+            # this row might reference rows that are still buffered :
+            self.flush()
+        
+        dbvals = dict([(self.attr_name(k), v) for k,v in column_vals])
         dbvals['connection'] = self.transaction
         return self.medium(**dbvals)
     
+    def _buffer(self, column_vals):
+        """buffers a row for flush() and returns a LoadedSQLObject or 
+        returns None if the row must be saved by the SQLObject class.
+        """
+        dbvals = {}
+        id = None
+        for k, v in column_vals:
+            dbcol = self.db_column(k)
+            if dbcol is None:
+                return None
+            db_name, to_db = dbcol
+            if to_db is None:
+                id = v
+            else:
+                v = to_db(v)
+            dbvals[db_name] = v
+        if id is None or len(dbvals) != len(self.medium.sqlmeta.columnList)+1:
+            # let SQLObject generate the id or fill in default values
+            return None
+        
+        cols = sorted(dbvals.keys())
+        if cols != self._pending_cols:
+            # keep the insert order, one statement per run of 
+            # rows having the same columns :
+            self.flush()
+            self._pending_cols = cols
+        self._pending.append(dbvals)
+        return LoadedSQLObject(self.medium, id, self.connection)
+    
     def visit_loader(self, loader):
         """Visit the loader and store a reference to the transaction connection"""
+        from sqlobject.styles import getStyle
         self.transaction = loader.transaction
+        self.connection = loader.connection
+        self.use_bulk_insert = loader.use_bulk_insert
+        self.bulk_insert_size = loader.bulk_insert_size
+        if self.so_style is None:
+            self.so_style = getStyle(self.medium)
 
 class SQLObjectFixture(DBLoadableFixture):
     """
@@ -70,14 +253,24 @@ class SQLObjectFixture(DBLoadableFixture):
         True if the connection can be closed, helpful for releasing connections.  
         If you are passing in a connection object this will be False by default.
     
+    ``use_bulk_insert``
+        If this is true, rows that declare an id are inserted with multi-row 
+        INSERT statements (``bulk_insert_size`` rows at a time) instead of 
+        instantiating the SQLObject class for each row.  Loaded rows are 
+        then stored as :class:`LoadedSQLObject` objects which only fetch the 
+        SQLObject instance when it is accessed.  Defaults to False.
+    
     """
             
     def __init__(self,  connection=None, use_transaction=True, 
-                        close_conn=False, **kw ):
+                        close_conn=False, use_bulk_insert=False, 
+                        bulk_insert_size=500, **kw ):
         DBLoadableFixture.__init__(self, **kw)
         self.connection = connection
         self.close_conn = close_conn
         self.use_transaction = use_transaction
+        self.use_bulk_insert = use_bulk_insert
+        self.bulk_insert_size = bulk_insert_size
     
     SQLObjectMedium = SQLObjectMedium
     Medium = SQLObjectMedium
@@ -0,0 +1,277 @@
+"""Running tests that load data in several processes at once.
+
+When tests run in parallel worker processes (i.e. ``nosetests --processes=4``)
+each worker must load data into its own database or the workers will collide
+on the same rows.  :class:`WorkerDatabases` gives each worker a copy of a
+template database that was prepared once, with any DataSets common to all
+tests already loaded::
+
+    from sqlalchemy import create_engine
+    from fixture import SQLAlchemyFixture
+    from fixture.parallel import WorkerDatabases
+
+    def populate(url):
+        engine = create_engine(url)
+        metadata.create_all(bind=engine)
+        SQLAlchemyFixture(engine=engine, env=models).data(CountryData).setup()
+        engine.dispose()
+
+    databases = WorkerDatabases('sqlite:////tmp/template.db', populate)
+    fixture = SQLAlchemyFixture(
+                engine=create_engine(databases.url()), env=models)
+
+A SQLite template is copied to one file per worker.  A PostgreSQL template is
+cloned with ``CREATE DATABASE ... TEMPLATE``.
+
+The current worker is found by :func:`current_worker`.  Workers started by
+the `multiprocessing`_ module (which is how nose runs them) are numbered
+automatically.  When starting worker processes yourself, i.e. to run plain
+unittest suites, set the ``FIXTURE_WORKER`` environment variable of each
+process to a different name.
+
+With nose, the :class:`FixtureWorkers` plugin prepares the template before
+the workers start::
+
+    nosetests --processes=4 --with-fixture-workers \\
+        --fixture-template=sqlite:////tmp/template.db \\
+        --fixture-populate=myapp.tests:populate
+
+and :func:`worker_url` then returns the URL of the worker's database.
+
+.. _multiprocessing: http://docs.python.org/library/multiprocessing.html
+
+"""
+
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import logging
+try:
+    from nose.plugins import Plugin
+except ImportError:
+    # the plugin is only usable with nose
+    Plugin = object
+
+log = logging.getLogger('fixture.parallel')
+
+__all__ = ['WorkerDatabases', 'current_worker', 'worker_url']
+
+def current_worker():
+    """returns the name of the current worker process or None.
+
+    This is the value of the ``FIXTURE_WORKER`` environment variable if
+    set, otherwise the number of the `multiprocessing`_ process the
+    code is running in.
+    """
+    worker = os.environ.get('FIXTURE_WORKER')
+    if worker:
+        return worker
+    try:
+        import multiprocessing
+    except ImportError:
+        # python 2.5
+        return None
+    identity = getattr(multiprocessing.current_process(), '_identity', ())
+    if not identity:
+        # the main process
+        return None
+    return "_".join([str(i) for i in identity])
+
+def worker_url(default=None):
+    """returns the URL of the current worker's database.
+
+    The template is the one prepared by the :class:`FixtureWorkers` nose
+    plugin (set in the ``FIXTURE_TEMPLATE_DSN`` environment variable).  If
+    there isn't one, default is returned.
+    """
+    template = os.environ.get('FIXTURE_TEMPLATE_DSN')
+    if not template:
+        return default
+    return _databases_for(template).url()
+
+_databases = {}
+
+def _databases_for(template):
+    if template not in _databases:
+        _databases[template] = WorkerDatabases(template)
+    return _databases[template]
+
+class WorkerDatabases(object):
+    """Databases cloned from a template, one per worker process.
+
+    ``template``
+        URL of the template database, i.e. ``sqlite:////tmp/template.db`` or
+        ``postgres://user@localhost/template``
+
+    ``populate``
+        a callable that receives a database URL and creates the tables and
+        common data in it.  It is called by :meth:`prepare`.
+    """
+    def __init__(self, template, populate=None):
+        from sqlalchemy.engine.url import make_url
+        self.template = make_url(template)
+        self.populate = populate
+        self.is_sqlite = self.template.drivername.startswith('sqlite')
+        if self.is_sqlite and self.template.database in (None, '', ':memory:'):
+            raise ValueError(
+                "an in-memory database cannot be a template (%s)" % template)
+        # worker -> URL of the database cloned in this process
+        self._clones = {}
+
+    def __repr__(self):
+        return "<%s from %s>" % (self.__class__.__name__, self.template)
+
+    def prepare(self):
+        """(re)creates the template database with populate()"""
+        if self.populate is None:
+            raise ValueError("%s has nothing to populate the template with" %
+                                                                    self)
+        if self.is_sqlite:
+            path = self.template.database
+            fd, building = tempfile.mkstemp(
+                            dir=os.path.dirname(path) or os.curdir,
+                            suffix='.db')
+            os.close(fd)
+            os.remove(building)
+            self.populate(self._url_with_database(building))
+            # replace the template in one step since workers may copy it :
+            os.rename(building, path)
+        else:
+            self._execute_on_server(
+                'DROP DATABASE IF EXISTS "%s"' % self.template.database,
+                'CREATE DATABASE "%s"' % self.template.database)
+            self.populate(str(self.template))
+        log.info("prepared template %s", self.template)
+
+    def database_name(self, worker):
+        """returns the name of worker's database"""
+        name = self.template.database
+        if self.is_sqlite:
+            base, ext = os.path.splitext(name)
+            return "%s_worker%s%s" % (base, worker, ext)
+        return "%s_worker%s" % (name, worker)
+
+    def url(self, worker=None):
+        """returns the URL of worker's database (the current worker by
+        default), cloning the template the first time it is asked for.
+
+        The main process counts as worker 0.
+        """
+        if worker is None:
+            worker = current_worker() or '0'
+        if worker not in self._clones:
+            self._clones[worker] = self.clone(worker)
+        return self._clones[worker]
+
+    def clone(self, worker):
+        """copies the template to a fresh database for worker and returns
+        its URL.
+        """
+        name = self.database_name(worker)
+        if self.is_sqlite:
+            if not os.path.exists(self.template.database):
+                self.prepare()
+            fd, copying = tempfile.mkstemp(
+                            dir=os.path.dirname(name) or os.curdir,
+                            suffix='.db')
+            os.close(fd)
+            shutil.copyfile(self.template.database, copying)
+            os.rename(copying, name)
+        else:
+            self._execute_on_server(
+                'DROP DATABASE IF EXISTS "%s"' % name,
+                'CREATE DATABASE "%s" TEMPLATE "%s"' % (
+                                            name, self.template.database))
+        log.info("cloned %s for worker %s", name, worker)
+        return self._url_with_database(name)
+
+    def dispose(self):
+        """drops all databases cloned from the template, by any worker"""
+        if self.is_sqlite:
+            base, ext = os.path.splitext(self.template.database)
+            for path in glob.glob("%s_worker*%s" % (base, ext)):
+                os.remove(path)
+        else:
+            from sqlalchemy import create_engine
+            engine = create_engine(self._url_with_database('postgres'))
+            try:
+                names = [row[0] for row in engine.execute(
+                    "SELECT datname FROM pg_database WHERE datname LIKE %s",
+                    self.database_name('%'))]
+            finally:
+                engine.dispose()
+            self._execute_on_server(*[
+                'DROP DATABASE IF EXISTS "%s"' % n for n in names])
+        self._clones = {}
+
+    def _url_with_database(self, database):
+        if self.is_sqlite:
+            return "sqlite:///%s" % database
+        url = self.template.__class__(
+                self.template.drivername, username=self.template.username,
+                password=self.template.password, host=self.template.host,
+                port=self.template.port, database=database,
+                query=self.template.query)
+        return str(url)
+
+    def _execute_on_server(self, *statements):
+        # CREATE DATABASE cannot run in a transaction nor in the template
+        from sqlalchemy import create_engine
+        engine = create_engine(self._url_with_database('postgres'))
+        conn = engine.connect()
+        try:
+            conn.connection.connection.set_isolation_level(0)
+            for stmt in statements:
+                conn.execute(stmt)
+        finally:
+            conn.close()
+            engine.dispose()
+
+class FixtureWorkers(Plugin):
+    """A nose plugin that prepares a template database for worker
+    processes.
+
+    The template is created with the ``--fixture-populate`` callable before
+    any test runs and the databases cloned by workers are dropped when all
+    tests have run.  Use :func:`worker_url` in tests to find the database
+    of the current worker.
+    """
+    name = 'fixture-workers'
+
+    def options(self, parser, env=os.environ):
+        Plugin.options(self, parser, env)
+        parser.add_option('--fixture-template',
+            default=env.get('FIXTURE_TEMPLATE_DSN'),
+            help=("URL of the template database to clone for each worker "
+                  "[FIXTURE_TEMPLATE_DSN]"))
+        parser.add_option('--fixture-populate',
+            default=env.get('FIXTURE_POPULATE'),
+            help=("module:callable that creates the tables and common data "
+                  "in the template, given its URL [FIXTURE_POPULATE]"))
+
+    def configure(self, options, conf):
+        Plugin.configure(self, options, conf)
+        if not self.enabled:
+            return
+        if not options.fixture_template:
+            raise ValueError("--fixture-template is required")
+        self.template = options.fixture_template
+        self.populate = options.fixture_populate
+
+    def begin(self):
+        populate = None
+        if self.populate:
+            module, callable_name = self.populate.split(':')
+            __import__(module)
+            populate = getattr(sys.modules[module], callable_name)
+        # worker processes find the template in the environment :
+        os.environ['FIXTURE_TEMPLATE_DSN'] = self.template
+        databases = _databases_for(self.template)
+        if populate is not None:
+            databases.populate = populate
+            databases.prepare()
+
+    def finalize(self, result):
+        _databases_for(self.template).dispose()
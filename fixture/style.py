@@ -4,6 +4,8 @@
 Style objects are used to customize how :ref:`storable objects are found for DataSet objects <using-loadable-fixture-style>`
 """
 
+import re
+
 __all__ = [
     'CamelAndUndersStyle', 'TrimmedNameStyle', 'NamedDataStyle', 
     'PaddedNameStyle', 'ChainedStyle']
@@ -16,6 +18,34 @@ class Style(object):
     """
     def __add__(self, newstyle):
         return ChainedStyle(self, newstyle)
+    
+    def translator(self, method):
+        """returns a function that translates a name like the method named 
+        method does, remembering each translation.
+        
+        For example::
+        
+            >>> style = NamedDataStyle() + CamelAndUndersStyle()
+            >>> to_attr = style.translator('to_attr')
+            >>> to_attr('EmployeeData')
+            'employee'
+            >>> style.translator('to_attr') is to_attr
+            True
+        
+        A style must not be changed once it has translated names this way.
+        """
+        translators = self.__dict__.setdefault('_translators', {})
+        if method not in translators:
+            translate = getattr(self, method)
+            translated = {}
+            def translator(name):
+                try:
+                    return translated[name]
+                except KeyError:
+                    translated[name] = translate(name)
+                    return translated[name]
+            translators[method] = translator
+        return translators[method]
         
     def to_attr(self, name):
         """converts name to a new name suitable for an attribute."""
@@ -32,26 +62,42 @@ class ChainedStyle(Style):
     """
     Combination of two styles, piping first translation 
     into second translation.
+    
+    Nested chains are flattened into one list of styles when the chain is 
+    created.
     """
     def __init__(self, first_style, next_style):
         self.first_style = first_style
         self.next_style = next_style
+        self.styles = []
+        for style in (first_style, next_style):
+            if isinstance(style, ChainedStyle):
+                self.styles.extend(style.styles)
+            else:
+                self.styles.append(style)
+        self.to_attr = self._chain('to_attr')
+        self.guess_storable_name = self._chain('guess_storable_name')
+    
+    def __getattr__(self, c):
+        # chains any other method the styles have 
+        if c.startswith('_') or c == 'styles':
+            raise AttributeError(c)
+        chained_call = self._chain(c)
+        setattr(self, c, chained_call)
+        return chained_call
     
-    def __getattribute__(self, c):
-        def assert_callable(attr):
-            if not callable(attr):
+    def _chain(self, c):
+        calls = []
+        for style in self.styles:
+            call = getattr(style, c)
+            if not callable(call):
                 raise AttributeError(
-                    "%s cannot chain %s" % (self.__class__, attr))
+                    "%s cannot chain %s" % (self.__class__, call))
+            calls.append(call)
         def chained_call(name):
-            f = object.__getattribute__(self, 'first_style')
-            first_call = getattr(f, c)
-            assert_callable(first_call)
-            
-            n = object.__getattribute__(self, 'next_style')
-            next_call = getattr(n, c)
-            assert_callable(next_call)
-            
-            return next_call(first_call(name))
+            for call in calls:
+                name = call(name)
+            return name
         return chained_call
     
     def __repr__(self):
@@ -159,21 +205,18 @@ class NamedDataStyle(TrimmedNameStyle):
     def __init__(self):
         TrimmedNameStyle.__init__(self, suffix='Data')
 
+# any character below "a" starts a new word :
+_word_start = re.compile(r'(?!^)([\x00-\x60])')
+
 def camel_to_under(s):
-    chunks = []
-    chkid = None
-    def newchunk():
-        chunks.append('')
-        return len(chunks)-1
-    for ltr in s:
-        if ord(ltr) < 97:
-            # capital letter :
-            chkid = newchunk()
-        if chkid is None:
-            chkid = newchunk()
-            
-        chunks[chkid] = chunks[chkid] + ltr
-    return '_'.join([c.lower() for c in chunks])
+    """
+    Derives a lower case, underscored name from a camel case name::
+    
+        >>> camel_to_under('EmployeeData')
+        'employee_data'
+    
+    """
+    return _word_start.sub(r'_\1', s).lower()
 
 if __name__ == '__main__':
     import doctest
@@ -0,0 +1,81 @@
+"""times an end-to-end run of the generate command for a growing number of
+rows.
+
+Each run queries a table of products that link to a few categories, then
+caches, resolves, renders and writes the DataSet classes to a module.  The
+rows come from a handler declared here so that only fixture's own code is
+timed, not a database.  Ten times the rows should take about ten times as
+long.  Run it like::
+
+    python fixture/test/profile/bench_generate_cache.py [rows] [rows] ...
+
+"""
+
+import sys, time
+from fixture import TempIO
+from fixture.command.generate import (
+    DataHandler, FixtureSet, dataset_generator, handler_registry,
+    register_handler)
+
+class RowSet(FixtureSet):
+    def __init__(self, data, name, category=None):
+        FixtureSet.__init__(self, data)
+        self.name = name
+        self.data_dict = dict(data)
+        if category is not None:
+            self.data_dict['category_id'] = category
+    def get_id_attr(self):
+        return 'id'
+    def obj_id(self):
+        return self.name
+    def set_id(self):
+        return self.data['id']
+
+class Products(object):
+    num_rows = 0
+
+products = Products()
+
+class ProductHandler(DataHandler):
+    @staticmethod
+    def recognizes(obj_path, obj=None):
+        return isinstance(obj, Products)
+    def add_fixture_set(self, fset):
+        pass
+    def findall(self, query):
+        pass
+    def linked_obj_ids(self):
+        return set(['products', 'categories'])
+    def sets(self):
+        categories = [RowSet({'id': i, 'name': 'category %s' % i},
+                             'categories') for i in range(10)]
+        for i in range(self.obj.num_rows):
+            yield RowSet({'id': i, 'name': 'product %s' % i,
+                          'price': i * 1.5}, 'products',
+                         category=categories[i % len(categories)])
+
+def bench(num_rows):
+    products.num_rows = num_rows
+    tmp = TempIO()
+    start = time.time()
+    dataset_generator(["%s.products" % __name__,
+                       '--output', tmp.join('products.py')])
+    return time.time() - start
+
+def main(argv=sys.argv[1:]):
+    sizes = [int(a) for a in argv] or [2000, 20000, 200000]
+    handlers = [h for h in handler_registry]
+    register_handler(ProductHandler)
+    try:
+        # warm up :
+        bench(sizes[0])
+        print "%10s %10s %14s" % ('rows', 'generate', 'per 1000 rows')
+        for rows in sizes:
+            elapsed = bench(rows)
+            print "%10s %9.3fs %13.4fs" % (
+                                    rows, elapsed, elapsed / rows * 1000)
+    finally:
+        handler_registry[:] = handlers
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""times putfile() and rmtree() of TempIO directories on disk, in RAM and 
+pooled.
+
+Run it like::
+
+    python fixture/test/profile/bench_tempio.py [trees] [files per tree]
+
+"""
+
+import sys, time
+from fixture import TempIO
+from fixture.io import ram_root
+
+def bench(trees, files, **kw):
+    putting = removing = 0.0
+    for i in range(trees):
+        tmp = TempIO(**kw)
+        start = time.time()
+        for f in range(files):
+            tmp.putfile('dir%s/file%s.txt' % (f % 10, f), 'x' * 1024)
+        putting += time.time() - start
+        start = time.time()
+        tmp.rmtree()
+        removing += time.time() - start
+    return putting, removing
+
+def main(argv=sys.argv[1:]):
+    trees, files = 200, 50
+    if argv:
+        trees = int(argv[0])
+    if argv[1:]:
+        files = int(argv[1])
+    modes = [('disk', {}), ('disk, pooled', {'pooled': True})]
+    if ram_root() is not None:
+        modes.extend([
+            ('ram (%s)' % ram_root(), {'ram': True}),
+            ('ram, pooled', {'ram': True, 'pooled': True})])
+    else:
+        print "no RAM-backed directory found, set FIXTURE_TEMPIO_RAM_ROOT"
+    print "%s trees of %s files" % (trees, files)
+    print "%-30s %10s %10s" % ('mode', 'putfile', 'rmtree')
+    for name, kw in modes:
+        putting, removing = bench(trees, files, **kw)
+        print "%-30s %9.3fs %9.3fs" % (name, putting, removing)
+
+if __name__ == '__main__':
+    main()
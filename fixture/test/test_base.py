@@ -1,6 +1,6 @@
 
 from cStringIO import StringIO
-import sys
+import sys, atexit
 import nose.tools, nose.case, nose.loader
 from nose.tools import eq_, raises
 from fixture.test import attr, SilentTestRunner
@@ -17,6 +17,15 @@ class MockLoader(object):
     def unload(self):
         mock_call_log.append((self.__class__, 'unload'))
         
+class MockSavepoint(object):
+    def rollback(self):
+        mock_call_log.append((self.__class__, 'rollback'))
+
+class SavepointMockLoader(MockLoader):
+    def savepoint(self):
+        mock_call_log.append((self.__class__, 'savepoint'))
+        return MockSavepoint()
+        
 class AbusiveMockLoader(object):
     def load(self, data):
         mock_call_log.append((self.__class__, 'load', data.__class__))
@@ -243,4 +252,137 @@ class TestFixture:
         eq_(mock_call_log[-3], ('some_callable', Fixture.Data))
         eq_(mock_call_log[-2], (MockLoader, 'unload'))
         eq_(mock_call_log[-1], 'my_custom_teardown')
-        
\ No newline at end of file
+        
+    
+    @attr(unit=True)
+    def test_scoped_data_is_loaded_once(self):
+        data = self.fxt.scoped_data([StubDataset1], 'module', 'some_module')
+        eq_(self.fxt.scoped_data([StubDataset1], 'module', 'some_module'), 
+            data)
+        eq_(mock_call_log, [(MockLoader, 'load', StubSuperSet)])
+        
+        # other data replaces it :
+        self.fxt.scoped_data([StubDataset1], 'class', StubDataset1)
+        eq_(mock_call_log[1:], [
+            (MockLoader, 'unload'), (MockLoader, 'load', StubSuperSet)])
+        self.fxt.scoped_data([StubDataset2], 'class', StubDataset1)
+        eq_(mock_call_log[3:], [
+            (MockLoader, 'unload'), (MockLoader, 'load', StubSuperSet)])
+        
+        self.fxt.teardown_scoped_data('module')
+        eq_(len(mock_call_log), 5)
+        self.fxt.teardown_scoped_data('class', StubDataset1)
+        eq_(mock_call_log[5:], [(MockLoader, 'unload')])
+    
+    @attr(unit=True)
+    def test_scoped_data_is_kept_per_fixture(self):
+        other = Fixture(loader=MockLoader(), dataclass=StubSuperSet)
+        data = self.fxt.scoped_data([StubDataset1], 'module', 'some_module')
+        other.scoped_data([StubDataset1], 'module', 'some_module')
+        other.teardown_scoped_data()
+        eq_(len(mock_call_log), 3)
+        eq_(self.fxt.scoped_data([StubDataset1], 'module', 'some_module'), 
+            data)
+        self.fxt.teardown_scoped_data()
+        eq_(len(mock_call_log), 4)
+    
+    @attr(unit=True)
+    def test_scoped_data_is_torn_down_at_exit(self):
+        registered = []
+        register = atexit.register
+        atexit.register = registered.append
+        try:
+            self.fxt.scoped_data([StubDataset1], 'module', 'some_module')
+            self.fxt.scoped_data([StubDataset2], 'module', 'some_module')
+        finally:
+            atexit.register = register
+        eq_(len(registered), 1)
+        registered[0]()
+        eq_(mock_call_log[-1], (MockLoader, 'unload'))
+        eq_(len(mock_call_log), 4)
+    
+    @attr(unit=True)
+    @raises(ValueError)
+    def test_scope_must_be_known(self):
+        self.fxt.with_data(StubDataset1, scope='session')
+        
+    @attr(unit=True)
+    def test_with_data_in_module_scope(self):
+        self.fxt.loader = SavepointMockLoader()
+        @self.fxt.with_data(StubDataset1, StubDataset2, scope='module')
+        def first(data):
+            mock_call_log.append(('first', data.__class__))
+        @self.fxt.with_data(StubDataset1, StubDataset2, scope='module')
+        def second(data):
+            mock_call_log.append(('second', data.__class__))
+        try:
+            first()
+            second()
+        finally:
+            self.fxt.teardown_scoped_data()
+        eq_(mock_call_log, [
+            (SavepointMockLoader, 'load', StubSuperSet),
+            (SavepointMockLoader, 'savepoint'),
+            ('first', Fixture.Data),
+            (MockSavepoint, 'rollback'),
+            (SavepointMockLoader, 'savepoint'),
+            ('second', Fixture.Data),
+            (MockSavepoint, 'rollback'),
+            (SavepointMockLoader, 'unload')])
+    
+    @attr(unit=True)
+    def test_DataTestCase_in_class_scope(self):
+        import unittest
+        from fixture import DataTestCase
+        self.fxt.loader = SavepointMockLoader()
+        class SomeDataTestCase(DataTestCase, unittest.TestCase):
+            fixture = self.fxt
+            datasets = [StubDataset1]
+            scope = 'class'
+            def test_one(self):
+                mock_call_log.append('test_one')
+            def test_two(self):
+                mock_call_log.append('test_two')
+        suite = unittest.TestLoader().loadTestsFromTestCase(SomeDataTestCase)
+        result = unittest.TestResult()
+        suite.run(result)
+        # python < 2.7 doesn't call tearDownClass :
+        SomeDataTestCase.tearDownClass()
+        eq_(result.errors, [])
+        eq_(mock_call_log, [
+            (SavepointMockLoader, 'load', StubSuperSet),
+            (SavepointMockLoader, 'savepoint'),
+            'test_one',
+            (MockSavepoint, 'rollback'),
+            (SavepointMockLoader, 'savepoint'),
+            'test_two',
+            (MockSavepoint, 'rollback'),
+            (SavepointMockLoader, 'unload')])
+    
+    @attr(unit=True)
+    def test_DataTestCase_runs_setUpClass_once(self):
+        import unittest
+        from fixture import DataTestCase
+        self.fxt.loader = SavepointMockLoader()
+        class SomeDataTestCase(DataTestCase, unittest.TestCase):
+            fixture = self.fxt
+            datasets = [StubDataset1]
+            scope = 'class'
+            def setUpClass(cls):
+                mock_call_log.append('setUpClass')
+                super(SomeDataTestCase, cls).setUpClass()
+            setUpClass = classmethod(setUpClass)
+            def test_one(self):
+                pass
+            def test_two(self):
+                pass
+            def test_three(self):
+                pass
+        suite = unittest.TestLoader().loadTestsFromTestCase(SomeDataTestCase)
+        result = unittest.TestResult()
+        suite.run(result)
+        SomeDataTestCase.tearDownClass()
+        eq_(result.errors, [])
+        eq_(mock_call_log.count('setUpClass'), 1)
+        eq_(mock_call_log.count((SavepointMockLoader, 'load', StubSuperSet)), 
+            1)
@@ -1,5 +1,5 @@
 
-import sys
+import sys, os
 from nose.tools import eq_, raises, with_setup
 from fixture.test import attr
 from fixture.command.generate import *
@@ -86,4 +86,280 @@ def test_resolve_path_to_module():
 @raises(ImportError)
 def test_resolve_bad_path():
     resolve_function_path("nomoduleshouldbenamedthis.nowhere:Babu")
-    
\ No newline at end of file
+    
+class RowSet(FixtureSet):
+    def __init__(self, data, name, parent=None):
+        FixtureSet.__init__(self, data)
+        self.name = name
+        self.data_dict = dict(data)
+        if parent is not None:
+            self.data_dict['parent_id'] = parent
+    def get_id_attr(self):
+        return 'id'
+    def obj_id(self):
+        return self.name
+    def set_id(self):
+        return self.data['id']
+
+class Rows(object):
+    def __init__(self, name, ids, parent='parents'):
+        self.name = name
+        self.ids = ids
+        self.parent = parent
+
+pets = Rows('pets', (1, 2, 3))
+toys = Rows('toys', (1,))
+nothing = Rows('nothing', ())
+
+class RowHandler(DataHandler):
+    @staticmethod
+    def recognizes(obj_path, obj=None):
+        if obj_path == "rowhandler.object_path" or isinstance(obj, Rows):
+            return True
+    def add_fixture_set(self, fset):
+        self.template.add_import("from rows import %s" % fset.obj_id())
+    def findall(self, query):
+        if self.obj is None:
+            self.obj = Rows('children', (1, 2))
+        if not self.obj.ids:
+            raise NoData("no rows in %s" % self.obj.name)
+    def linked_obj_ids(self):
+        return set([self.obj.name, self.obj.parent])
+    def sets(self):
+        parent = RowSet({'id': 1, 'name': 'parent'}, self.obj.parent)
+        for id in self.obj.ids:
+            yield RowSet({'id': id, 'name': 'child'}, self.obj.name, 
+                            parent=parent)
+
+def register_rowhandler():
+    register_handler(RowHandler)
+
+def reset_rowhandler():
+    from fixture.command.generate.template import templates
+    reset_handlers()
+    # templates are shared so forget the imports of rows :
+    for tpl in templates:
+        tpl.import_header[:] = [i for i in tpl.import_header 
+                                    if not i.startswith('from rows ')]
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_output_is_written_to_file():
+    from fixture.io import TempIO
+    tmp = TempIO()
+    outfile = tmp.join('datasets.py')
+    eq_(dataset_generator(['rowhandler.object_path', '--output', outfile]), 
+        None)
+    code = open(outfile).read()
+    assert code.startswith('import datetime\n'), code
+    assert 'from rows import parents' in code, code
+    assert code.index('class parentsData') < code.index('class childrenData'), (
+        code)
+    assert "parentsData.parents_1.ref('id')" in code, code
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_sets_are_released_as_code_is_written():
+    from fixture.command.generate.template import templates
+    class options:
+        where = None
+        prefix = ''
+        suffix = 'Data'
+    generate = DataSetGenerator(options, template=templates.find('fixture'))
+    code = generate("rowhandler.object_path")
+    eq_(generate.cache.registry, {})
+    assert 'class childrenData' in code, code
+    
+    hnd = RowHandler("rowhandler.object_path", options)
+    hnd.findall(None)
+    sets = [s for s in hnd.sets()]
+    generate.cache.add(sets[0])
+    eq_(sets[0].data, None)
+    eq_(sets[0].mk_key(), 'children_1')
+
+@attr(unit=True)
+def test_sets_are_cached_as_they_are_yielded():
+    class options:
+        where = None
+    generate = DataSetGenerator(options)
+    cached = []
+    class CheckedRowHandler(RowHandler):
+        def sets(self):
+            for fset in RowHandler.sets(self):
+                yield fset
+                cached.append(fset.data is None)
+    hnd = CheckedRowHandler("rowhandler.object_path", options)
+    eq_(generate.extract(hnd), None)
+    eq_(cached, [True, True])
+    eq_(sorted(generate.cache.registry['children'].keys()), [1, 2])
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_many_object_paths():
+    code = dataset_generator(['--workers', '2', 
+                                "%s.pets" % __name__, "%s.toys" % __name__])
+    eq_(code.count('class parentsData'), 1)
+    assert code.index('class parentsData') < code.index('class petsData'), (
+        code)
+    assert code.index('class parentsData') < code.index('class toysData'), (
+        code)
+    eq_(code.count("parentsData.parents_1.ref('id')"), 4)
+
+dogs = Rows('dogs', (1, 2), parent='owners')
+cats = Rows('cats', (1,), parent='owners')
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_classes_are_written_once_complete():
+    from StringIO import StringIO
+    from fixture.command.generate.template import templates
+    class options:
+        where = None
+        prefix = ''
+        suffix = 'Data'
+    stream = StringIO()
+    generate = DataSetGenerator(options, template=templates.find('fixture'))
+    written = {}
+    class CheckedRowHandler(RowHandler):
+        def findall(self, query):
+            written[self.obj.name] = stream.getvalue()
+            RowHandler.findall(self, query)
+    # ahead of RowHandler :
+    handler_registry.insert(0, CheckedRowHandler)
+    eq_(generate(["%s.toys" % __name__, "%s.dogs" % __name__, 
+                  "%s.cats" % __name__], stream=stream), None)
+    eq_(written['toys'], '')
+    # nothing else links to toys and parents :
+    assert 'class toysData' in written['dogs'], written['dogs']
+    assert 'class parentsData' in written['dogs'], written['dogs']
+    # but cats link to owners, so dogs must wait :
+    assert 'class ownersData' not in written['cats'], written['cats']
+    assert 'class dogsData' not in written['cats'], written['cats']
+    assert 'toys' not in generate.cache.registry
+    code = stream.getvalue()
+    # each class comes after the classes and the imports it needs :
+    assert (code.index('class toysData') < code.index('from rows import dogs') 
+            < code.index('class dogsData')), code
+    assert code.index('class ownersData') < code.index('class catsData'), code
+    eq_(generate.cache.registry, {})
+
+class Records(Rows):
+    pass
+
+class RecordHandler(RowHandler):
+    @staticmethod
+    def recognizes(obj_path, obj=None):
+        return isinstance(obj, Records)
+    def fxt_type(self):
+        return 'RecordFixture'
+
+records = Records('records', (1,))
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_mixed_fixture_types_are_rejected():
+    from fixture.command.generate.template import templates
+    class options:
+        where = None
+        prefix = ''
+        suffix = 'Data'
+    handler_registry.insert(0, RecordHandler)
+    generate = DataSetGenerator(options, template=templates.find('fixture'))
+    try:
+        generate(["%s.pets" % __name__, "%s.records" % __name__])
+    except HandlerException, e:
+        assert 'RecordFixture' in str(e), str(e)
+    else:
+        assert False, "expected HandlerException"
+    # alone, records are rendered with their own type :
+    generate = DataSetGenerator(options, template=templates.find('testtools'))
+    code = generate("%s.records" % __name__)
+    assert 'class recordsData(RecordFixture)' in code, code
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_all_objects_in_env():
+    code = dataset_generator(['--env', __name__])
+    assert 'class petsData' in code, code
+    assert 'class toysData' in code, code
+    assert 'class nothingData' not in code, code
+
+@attr(unit=True)
+@raises(NoData)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_no_data_in_any_object_path():
+    from fixture.command.generate.template import templates
+    class options:
+        where = None
+        workers = 2
+    generate = DataSetGenerator(options, template=templates.find('fixture'))
+    generate(["%s.nothing" % __name__, "%s.nothing" % __name__])
+
+@attr(unit=True)
+def test_ordered_set():
+    o = OrderedSet(['a', 'b', 'c'])
+    o.push('a')
+    o.push('d')
+    eq_(list(o), ['b', 'c', 'a', 'd'])
+    o.remove('c')
+    eq_(list(o), ['b', 'a', 'd'])
+    eq_(len(o), 3)
+    assert 'a' in o
+    assert 'c' not in o
+
+@attr(unit=True)
+@raises(KeyError)
+def test_ordered_set_remove_unknown_key():
+    OrderedSet(['a']).remove('b')
+
+@attr(unit=True)
+@with_setup(setup=register_rowhandler, teardown=reset_rowhandler)
+def test_datafile_template():
+    import imp
+    from fixture.io import TempIO
+    from fixture.dataset import Ref
+    from fixture.dataset.datafile import read_rows, RowRef
+    tmp = TempIO()
+    outfile = tmp.join('rowdata.py')
+    dataset_generator(['rowhandler.object_path', '--template=datafile', 
+                        '--output', outfile])
+    eq_(sorted(os.listdir(tmp)), 
+        ['rowdata.py', 'rowdata_childrenData.pkl', 'rowdata_parentsData.pkl'])
+    
+    rows = [r for r in read_rows(open(tmp.join('rowdata_childrenData.pkl')))]
+    eq_(rows[0][1]['parent_id'], RowRef('parentsData', 'parents_1', 'id'))
+    
+    source = open(outfile).read()
+    # skip the import of the fake rows module :
+    source = source.replace('from rows import', '# from rows import')
+    open(outfile, 'w').write(source)
+    mod = imp.load_source('rowdata', outfile)
+    try:
+        children = mod.childrenData()
+        eq_(children.meta.references, [mod.parentsData])
+        keys = [k for k, row in children]
+        eq_(sorted(keys), ['children_1', 'children_2'])
+        child = [row for k, row in children][0]
+        assert isinstance(child.parent_id, Ref.Value), child.parent_id
+        eq_(child.parent_id.ref.dataset_class, mod.parentsData)
+    finally:
+        del sys.modules['rowdata']
+
+@attr(unit=True)
+def test_datafile_is_written_apart_from_render():
+    from fixture.io import TempIO
+    from fixture.command.generate.template import templates
+    from fixture.dataset.datafile import read_rows
+    tmp = TempIO()
+    template = templates.find('datafile')
+    template.datadir = tmp
+    template.file_prefix = ''
+    tpl = {'fxt_class': 'thingsData', 'meta': '',
+           'data': template.data([('things_1', {'id': 1})])}
+    code = template.render(tpl)
+    assert "datafile = 'thingsData.pkl'" in code, code
+    eq_(os.listdir(tmp), [])
+    template.write_data(tpl)
+    eq_(os.listdir(tmp), ['thingsData.pkl'])
+    eq_([r for r in read_rows(open(tmp.join('thingsData.pkl'), 'rb'))], 
+        [('things_1', {'id': 1})])
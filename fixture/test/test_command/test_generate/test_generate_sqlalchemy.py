@@ -6,7 +6,7 @@ from nose.exc import SkipTest
 from fixture import DataSet
 from fixture.dataset import MergedSuperSet
 from fixture.style import NamedDataStyle
-from fixture.command.generate import DataSetGenerator
+from fixture.command.generate import DataSetGenerator, FixtureCache
 from fixture.command.generate.template import Template
 from fixture.command.generate.generate_sqlalchemy import *
 
@@ -106,6 +106,134 @@ class TestHandlerRecognition(object):
         eq_(type(hnd), SQLAlchemyTableHandler)
         
 
+class TestForeignKeyLoader(object):
+    
+    def setUp(self):
+        from sqlalchemy import create_engine
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.create_all(bind=self.engine)
+        e = self.engine
+        e.execute(categories.insert(), [
+                    {'id': 1, 'name': 'parkas'}, {'id': 2, 'name': 'rebates'}])
+        e.execute(products.insert(), [
+                    {'id': 1, 'name': 'jersey', 'category_id': 1},
+                    {'id': 2, 'name': 'vest', 'category_id': 1}])
+        e.execute(offers.insert(), [
+                    {'id': 1, 'name': 'cash back', 
+                        'category_id': 2, 'product_id': 1},
+                    {'id': 2, 'name': 'free vest', 
+                        'category_id': 2, 'product_id': 2},
+                    {'id': 3, 'name': 'free jersey', 
+                        'category_id': 2, 'product_id': 1}])
+        
+        engine = self.engine
+        self.statements = statements = []
+        class CountingConnection(object):
+            def execute(self, stmt, *a, **kw):
+                statements.append(stmt)
+                return engine.execute(stmt, *a, **kw)
+        self.connection = CountingConnection()
+        self.env = TableEnv('fixture.examples.db.sqlalchemy_examples')
+        
+    def tearDown(self):
+        metadata.drop_all(bind=self.engine)
+    
+    def sets(self):
+        fk_loader = ForeignKeyLoader(self.connection, self.env)
+        rows = self.engine.execute(offers.select()).fetchall()
+        for row in rows:
+            fk_loader.add(row, offers.columns)
+        fk_loader.fetch()
+        return [SQLAlchemyFixtureSet(row, offers, self.connection, self.env,
+                            adapter=SQLAlchemyTableHandler.RecordSetAdapter,
+                            fk_loader=fk_loader) for row in rows]
+    
+    @attr(unit=True)
+    def test_one_query_per_referenced_table(self):
+        fsets = self.sets()
+        # categories and products, then the categories of products :
+        eq_(len(self.statements), 3)
+        eq_([f.data_dict['product_id'].data_dict['name'] for f in fsets],
+            ['jersey', 'vest', 'jersey'])
+        eq_([f.data_dict['category_id'].data_dict['name'] for f in fsets],
+            ['rebates', 'rebates', 'rebates'])
+        eq_(fsets[1].data_dict['product_id'].data_dict['category_id'
+                                                ].data_dict['name'], 'parkas')
+    
+    @attr(unit=True)
+    def test_linked_sets_are_shared(self):
+        fsets = self.sets()
+        assert (fsets[0].data_dict['product_id'] is 
+                fsets[2].data_dict['product_id'])
+        assert (fsets[0].data_dict['category_id'] is 
+                fsets[2].data_dict['category_id'])
+    
+    @attr(unit=True)
+    def test_cached_set_drops_loader(self):
+        fsets = self.sets()
+        cache = FixtureCache()
+        cache.add(fsets[0])
+        eq_(fsets[0].data, None)
+        eq_(fsets[0].fk_loader, None)
+        eq_(fsets[0].mk_key(), 'offers_1')
+        assert fsets[1].fk_loader is not None
+    
+    @attr(unit=True)
+    def test_chunks_large_lookups(self):
+        fk_loader = ForeignKeyLoader(self.connection, self.env)
+        fk_loader.chunk_size = 1
+        for row in self.engine.execute(offers.select()).fetchall():
+            fk_loader.add(row, offers.columns)
+        fk_loader.fetch()
+        # 1 category, 2 products, then the category of both products :
+        eq_(len(self.statements), 4)
+    
+    @attr(unit=True)
+    def test_unfetched_key_is_looked_up(self):
+        fk_loader = ForeignKeyLoader(self.connection, self.env)
+        [fk] = [fk for fk in offers.c.category_id.foreign_keys]
+        fset = fk_loader.get_set(fk, 2)
+        eq_(fset.data_dict['name'], 'rebates')
+        eq_(len(self.statements), 1)
+        assert fk_loader.get_set(fk, 2) is fset
+        eq_(len(self.statements), 1)
+
+    def handler(self):
+        class options:
+            dsn = None
+            env = []
+        hnd = SQLAlchemyTableHandler('offers', options, 
+                                     connection=self.connection, obj=offers)
+        hnd.env = self.env
+        hnd.rs = self.engine.execute(offers.select()).fetchall()
+        return hnd
+    
+    @attr(unit=True)
+    def test_loader_forgets_rows_after_each_chunk(self):
+        hnd = self.handler()
+        fetched = []
+        chunk_size = ForeignKeyLoader.chunk_size
+        ForeignKeyLoader.chunk_size = 2
+        try:
+            for fset in hnd.sets():
+                fk_loader = fset.fk_loader
+                fetched.append(len(fk_loader.rows[(products, 'id')]))
+                eq_(fset.data_dict['category_id'].data_dict['name'], 
+                    'rebates')
+        finally:
+            ForeignKeyLoader.chunk_size = chunk_size
+        # both products in the first chunk, only the jersey in the second :
+        eq_(fetched, [2, 2, 1])
+        eq_(fk_loader.rows, {})
+        eq_(fk_loader.fixture_sets, {})
+        # categories and products then the categories of products, per chunk :
+        eq_(len(self.statements), 6)
+    
+    @attr(unit=True)
+    def test_linked_obj_ids(self):
+        eq_(sorted(self.handler().linked_obj_ids()), 
+            ['categories', 'offers', 'products'])
+
 class HandlerQueryTest(object):
     class CategoryData(DataSet):
         class bumpy:
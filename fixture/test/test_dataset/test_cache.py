@@ -0,0 +1,152 @@
+
+import os
+import sys
+import time
+from nose.tools import eq_
+from fixture import DataSet, TempIO
+from fixture.dataset import Ref
+from fixture.dataset.cache import *
+from fixture.test import attr
+from fixture.util import atomic_write
+
+cached_source = """
+from fixture import DataSet
+
+class CategoryData(DataSet):
+    class cars:
+        id = 1
+        name = 'cars'
+    class trucks(cars):
+        name = 'trucks'
+
+class ProductData(DataSet):
+    class truck:
+        name = %(name)r
+        category_id = CategoryData.trucks.ref('id')
+        category = CategoryData.trucks
+        tags = ['big', 'red']
+"""
+
+class TestDataSetCache(object):
+
+    def setUp(self):
+        self.tmp = TempIO()
+        self.tmp.src = 'src'
+        sys.path.insert(0, self.tmp.src)
+        self.cache = enable_cache(self.tmp.join('cache'))
+
+    def tearDown(self):
+        disable_cache()
+        sys.path.remove(self.tmp.src)
+        sys.modules.pop('cached_data', None)
+
+    def import_data(self, name='truck', mtime=None):
+        path = os.path.join(self.tmp.src, 'cached_data.py')
+        fp = open(path, 'w')
+        fp.write(cached_source % dict(name=name))
+        fp.close()
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        sys.modules.pop('cached_data', None)
+        for compiled in (path + 'c', path + 'o'):
+            if os.path.exists(compiled):
+                os.remove(compiled)
+        return __import__('cached_data')
+
+    def cached_files(self):
+        return [f for f in os.listdir(self.tmp.join('cache'))
+                    if f.endswith('.pkl')]
+
+    @attr(unit=1)
+    def test_built_dataset_is_cached(self):
+        mod = self.import_data()
+        first = mod.ProductData()
+        eq_((self.cache.hits, self.cache.misses), (0, 2))
+        eq_(len(self.cached_files()), 2)
+
+        # CategoryData is referenced through its shared instance :
+        products = mod.ProductData()
+        eq_((self.cache.hits, self.cache.misses), (1, 2))
+        eq_(products.meta.keys, ['truck'])
+        eq_(products.meta.references, [mod.CategoryData])
+        eq_(products.truck.name, 'truck')
+        eq_(products.truck.tags, ['big', 'red'])
+        assert products.truck.category is mod.CategoryData.trucks
+        ref = products.truck.category_id
+        assert isinstance(ref, Ref.Value), ref
+        eq_(ref.ref.dataset_class, mod.CategoryData)
+        eq_(ref.ref.key, 'trucks')
+        eq_(ref.attr_name, 'id')
+        eq_(products.ref.CategoryData.trucks.name, 'trucks')
+        eq_(hasattr(products.ref.CategoryData.trucks, 'id'), False)
+
+    @attr(unit=1)
+    def test_changed_source_is_not_read_from_cache(self):
+        mod = self.import_data(mtime=time.time() - 10)
+        mod.ProductData()
+        mod = self.import_data(name='fire truck')
+        products = mod.ProductData()
+        eq_(products.truck.name, 'fire truck')
+        eq_((self.cache.hits, self.cache.misses), (0, 4))
+        eq_(len(self.cached_files()), 4)
+
+    @attr(unit=1)
+    def test_missing_row_is_not_read_from_cache(self):
+        mod = self.import_data()
+        mod.ProductData()
+        del mod.CategoryData.trucks
+        eq_(self.cache.load(mod.ProductData), None)
+
+    @attr(unit=1)
+    def test_local_dataset_is_not_cached(self):
+        class LocalData(DataSet):
+            class local:
+                name = 'local'
+        eq_(LocalData().local.name, 'local')
+        eq_(self.cache.path_for(LocalData), None)
+        assert not os.path.exists(self.tmp.join('cache'))
+
+    @attr(unit=1)
+    def test_unpicklable_rows_are_not_cached(self):
+        mod = self.import_data()
+        eq_(self.cache.save(mod.CategoryData, [],
+                            [('cars', {'name': lambda: 'cars'})]), False)
+
+    @attr(unit=1)
+    def test_atomic_write(self):
+        path = self.tmp.join('atomic.txt')
+        atomic_write(path, 'one')
+        atomic_write(path, 'two')
+        eq_(open(path).read(), 'two')
+        eq_(sorted(os.listdir(self.tmp)), ['atomic.txt', 'src'])
+
+    @attr(unit=1)
+    def test_atomic_write_writes_everything(self):
+        path = self.tmp.join('atomic.txt')
+        write = os.write
+        def write_one_byte(fd, data):
+            return write(fd, data[:1])
+        os.write = write_one_byte
+        try:
+            atomic_write(path, 'partial')
+        finally:
+            os.write = write
+        eq_(open(path).read(), 'partial')
+
+    @attr(unit=1)
+    def test_atomic_write_removes_its_temp_file(self):
+        path = self.tmp.join('atomic.txt')
+        write = os.write
+        def fail(fd, data):
+            raise OSError(28, 'No space left on device')
+        os.write = fail
+        try:
+            try:
+                atomic_write(path, 'one')
+            except OSError:
+                pass
+            else:
+                assert False, "expected OSError"
+        finally:
+            os.write = write
+        eq_(sorted(os.listdir(self.tmp)), ['src'])
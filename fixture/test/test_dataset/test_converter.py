@@ -1,5 +1,7 @@
+import os
 
-from fixture.test import attr
+from fixture.test import attr, env_supports
+from nose.exc import SkipTest
 from decimal import Decimal
 import datetime
 from fixture import DataSet
@@ -103,4 +105,303 @@ class TestDatasetToJson(object):
                      {'name': "name's foo",
                       'is_alive': True}]
                 }))
-                
\ No newline at end of file
+                
+class ArtistData(DataSet):
+    class joan_jett:
+        name = "Joan Jett"
+    class ramones:
+        name = "The Ramones"
+
+class AlbumData(DataSet):
+    class bad_reputation:
+        title = "Bad Reputation"
+        artist_id = ArtistData.joan_jett.ref('name')
+        artist = ArtistData.joan_jett
+        released = datetime.date(1981, 1, 1)
+
+class TestDatasetToJsonLines(object):
+    
+    @attr(unit=1)
+    def test_one_line_per_row(self):
+        lines = [l for l in dataset_to_json_lines(ArtistData)]
+        eq_([json.loads(l) for l in lines],
+            [{'key': 'joan_jett', 'data': {'name': 'Joan Jett'}},
+             {'key': 'ramones', 'data': {'name': 'The Ramones'}}])
+        for l in lines:
+            assert l.endswith("\n") and l.count("\n") == 1, repr(l)
+    
+    @attr(unit=1)
+    def test_references_are_written_as_keys(self):
+        fp = StringIO()
+        dataset_to_json_lines(AlbumData, fp=fp)
+        eq_(json.loads(fp.getvalue()),
+            {'key': 'bad_reputation',
+             'data': {
+                'title': 'Bad Reputation',
+                'artist_id': {'__ref__': ['ArtistData', 'joan_jett', 'name']},
+                'artist': {'__ref__': ['ArtistData', 'joan_jett']},
+                'released': '1981-01-01'}})
+    
+    @attr(unit=1)
+    @raises(TypeError)
+    def test_must_be_dataset(self):
+        dataset_to_json_lines(object)
+
+class TestJsonToDataset(object):
+    
+    def setUp(self):
+        from fixture import TempIO
+        self.tmp = TempIO()
+    
+    @attr(unit=1)
+    def test_roundtrip(self):
+        from fixture.dataset import Ref, is_rowlike
+        path = self.tmp.join('AlbumData.json')
+        fp = open(path, 'w')
+        dataset_to_json_lines(AlbumData, fp=fp)
+        fp.close()
+        
+        Albums = json_to_dataset(path, references=[ArtistData])
+        eq_(Albums.__name__, 'AlbumData')
+        albums = Albums()
+        eq_(albums.meta.keys, [])
+        rows = [r for r in albums]
+        eq_([k for k, row in rows], ['bad_reputation'])
+        row = rows[0][1]
+        eq_(row.title, 'Bad Reputation')
+        eq_(row.released, '1981-01-01')
+        assert isinstance(row.artist_id, Ref.Value), row.artist_id
+        eq_(row.artist_id.ref.dataset_class, ArtistData)
+        eq_(row.artist_id.ref.key, 'joan_jett')
+        eq_(row.artist_id.attr_name, 'name')
+        assert is_rowlike(row.artist), row.artist
+        eq_(row.artist._dataset, ArtistData)
+        eq_(row.artist.__name__, 'joan_jett')
+
+class CategoryData(DataSet):
+    class cars:
+        id = 1
+        name = "cars"
+    class free_stuff:
+        id = 2
+        name = "it's free"
+
+class ProductData(DataSet):
+    class truck:
+        id = 1
+        name = "truck"
+        category_id = CategoryData.cars.ref('id')
+
+class OfferData(DataSet):
+    class free_truck:
+        id = 1
+        name = None
+        product = ProductData.truck
+        category_id = CategoryData.free_stuff.ref('id')
+
+def create_tables(conn):
+    conn.execute("CREATE TABLE category (id INTEGER, name TEXT)")
+    conn.execute("CREATE TABLE product (id INTEGER, name TEXT, "
+                 "category_id INTEGER)")
+    conn.execute("CREATE TABLE offer (id INTEGER, name TEXT, "
+                 "product INTEGER, category_id INTEGER)")
+
+class TestExportDatasets(object):
+    
+    def setUp(self):
+        from fixture import TempIO
+        from fixture.style import NamedDataStyle
+        self.tmp = TempIO()
+        self.style = NamedDataStyle()
+        try:
+            import sqlite3
+        except ImportError:
+            from nose.exc import SkipTest
+            raise SkipTest
+        self.conn = sqlite3.connect(':memory:')
+        create_tables(self.conn)
+    
+    def tearDown(self):
+        self.conn.close()
+    
+    def assert_loaded(self):
+        eq_(self.conn.execute(
+                "SELECT id, name FROM category ORDER BY id").fetchall(), 
+            [(1, "cars"), (2, "it's free")])
+        eq_(self.conn.execute(
+                "SELECT id, name, category_id FROM product").fetchall(), 
+            [(1, "truck", 1)])
+        eq_(self.conn.execute(
+                "SELECT id, name, product, category_id FROM offer").fetchall(),
+            [(1, None, 1, 2)])
+    
+    @attr(unit=1)
+    def test_datasets_in_order(self):
+        ordered = datasets_in_order([OfferData, CategoryData])
+        eq_([d.__class__ for d in ordered], 
+            [CategoryData, ProductData, OfferData])
+        assert isinstance(ordered[0], CategoryData)
+    
+    @attr(unit=1)
+    def test_superset_in_order(self):
+        from fixture.dataset import SuperSet
+        ordered = datasets_in_order(SuperSet(ProductData()))
+        eq_([d.__class__ for d in ordered], [CategoryData, ProductData])
+    
+    @attr(unit=1)
+    def test_json_lines(self):
+        lines = [json.loads(l) for l in datasets_to_json_lines(ProductData)]
+        eq_([(l['dataset'], l['key']) for l in lines],
+            [('CategoryData', 'cars'), ('CategoryData', 'free_stuff'),
+             ('ProductData', 'truck')])
+        eq_(lines[-1]['data']['category_id'], 
+            {'__ref__': ['CategoryData', 'cars', 'id']})
+    
+    @attr(unit=1)
+    def test_sql(self):
+        sql = datasets_to_sql(OfferData, style=self.style)
+        eq_(sql.splitlines()[0], 
+            'INSERT INTO "Category" ("id", "name") VALUES (1, \'cars\');')
+        load_sql(self.conn, sql)
+        self.assert_loaded()
+    
+    @attr(unit=1)
+    def test_sql_to_file(self):
+        path = self.tmp.join('offers.sql')
+        fp = open(path, 'w')
+        datasets_to_sql(OfferData, fp=fp, style=self.style)
+        fp.close()
+        load_sql(self.conn, open(path))
+        self.assert_loaded()
+    
+    @attr(unit=1)
+    def test_csv(self):
+        paths = datasets_to_csv(OfferData, self.tmp, style=self.style)
+        eq_([os.path.basename(p) for p in paths], 
+            ['1_Category.csv', '2_Product.csv', '3_Offer.csv'])
+        load_csv(self.conn, self.tmp)
+        self.assert_loaded()
+    
+    @attr(unit=1)
+    def test_csv_rows_are_inserted_in_batches(self):
+        from fixture.dataset import converter
+        calls = []
+        class Connection(object):
+            # a DB-API connection of the sqlite3 module
+            __module__ = 'sqlite3'
+            def __init__(self, conn):
+                self.conn = conn
+            def cursor(self):
+                cursor = self.conn.cursor()
+                class Cursor(object):
+                    def executemany(self, stmt, rows):
+                        rows = list(rows)
+                        calls.append((stmt, len(rows)))
+                        cursor.executemany(stmt, rows)
+                    def close(self):
+                        cursor.close()
+                return Cursor()
+        class CategoryData(DataSet):
+            class cars:
+                id = 1
+                name = 'cars'
+            class free_stuff:
+                id = 2
+                name = "it's free"
+            class trucks:
+                id = 3
+                name = None
+        datasets_to_csv(CategoryData, self.tmp, style=self.style)
+        batch_size = converter.BATCH_SIZE
+        converter.BATCH_SIZE = 2
+        try:
+            load_csv(Connection(self.conn), self.tmp)
+        finally:
+            converter.BATCH_SIZE = batch_size
+        eq_(calls, [
+            ('INSERT INTO "Category" ("id", "name") VALUES (?, ?)', 2),
+            ('INSERT INTO "Category" ("id", "name") VALUES (?, ?)', 1)])
+        eq_(self.conn.execute(
+                "SELECT id, name FROM category ORDER BY id").fetchall(), 
+            [(1, "cars"), (2, "it's free"), (3, None)])
+    
+    @attr(unit=1)
+    def test_csv_through_sqlalchemy(self):
+        if not env_supports.sqlalchemy:
+            raise SkipTest
+        from sqlalchemy import create_engine
+        sqlite_conn = self.conn
+        self.conn = create_engine('sqlite:///:memory:').connect()
+        try:
+            create_tables(self.conn)
+            datasets_to_csv(OfferData, self.tmp, style=self.style)
+            load_csv(self.conn, self.tmp)
+            self.assert_loaded()
+        finally:
+            self.conn.close()
+            self.conn = sqlite_conn
+    
+    @attr(unit=1)
+    def test_sql_with_multi_row_inserts(self):
+        sql = datasets_to_sql(CategoryData, style=self.style, 
+                              dialect='postgres')
+        eq_(sql, 'INSERT INTO "Category" ("id", "name") VALUES '
+                 '(1, \'cars\'), (2, \'it\'\'s free\');\n')
+    
+    @attr(unit=1)
+    def test_booleans_round_trip(self):
+        class FlagData(DataSet):
+            class on:
+                id = 1
+                active = True
+            class off:
+                id = 2
+                active = False
+        self.conn.execute("CREATE TABLE flag (id INTEGER, active BOOLEAN)")
+        select = "SELECT id, active FROM flag ORDER BY id"
+        load_sql(self.conn, datasets_to_sql(FlagData, style=self.style))
+        eq_(self.conn.execute(select).fetchall(), [(1, 1), (2, 0)])
+        self.conn.execute("DELETE FROM flag")
+        
+        datasets_to_csv(FlagData, self.tmp, style=self.style)
+        load_csv(self.conn, self.tmp)
+        eq_(self.conn.execute(select).fetchall(), [(1, 1), (2, 0)])
+    
+    @attr(unit=1)
+    def test_sql_literal(self):
+        eq_(sql_literal(True, 'postgresql'), 'true')
+        eq_(sql_literal(False, 'postgres'), 'false')
+        eq_(sql_literal(True, 'sqlite'), '1')
+        eq_(sql_literal("it's", 'sqlite'), "'it''s'")
+        eq_(sql_literal("c:\\", 'mysql'), "'c:\\\\'")
+        eq_(sql_literal(None), 'NULL')
+    
+    @attr(unit=1)
+    def test_render_insert_quotes_names(self):
+        eq_(render_insert('order', {'from': 1, 'to': u'caf\xe9'}), 
+            u'INSERT INTO "order" ("from", "to") VALUES (1, \'caf\xe9\')')
+        eq_(render_insert('order', {'from': 1}, dialect='mysql'), 
+            u'INSERT INTO `order` (`from`) VALUES (1)')
+    
+    @attr(unit=1)
+    @raises(ValueError)
+    def test_references_need_values(self):
+        class AutoIdData(DataSet):
+            class auto:
+                name = "auto"
+        class RefData(DataSet):
+            class referencing:
+                auto_id = AutoIdData.auto.ref('id')
+        datasets_to_sql(RefData)
+
+@attr(unit=1)
+def test_split_sql():
+    eq_([s for s in split_sql(
+            "INSERT INTO t VALUES ('a;b');\nINSERT INTO t VALUES ('it''s');")],
+        ["INSERT INTO t VALUES ('a;b')", "INSERT INTO t VALUES ('it''s')"])
+    eq_([s for s in split_sql('INSERT INTO "a;b" VALUES (1);')], 
+        ['INSERT INTO "a;b" VALUES (1)'])
+    # an escaped quote, then a semi-colon in a string with MySQL :
+    eq_([s for s in split_sql(
+            r"INSERT INTO `t` VALUES ('it\'s;');SELECT 1", dialect='mysql')],
+        [r"INSERT INTO `t` VALUES ('it\'s;')", "SELECT 1"])
@@ -0,0 +1,114 @@
+
+import os
+from nose.tools import eq_
+from nose.exc import SkipTest
+from fixture import DataSet, TempIO
+from fixture.dataset import Ref
+from fixture.dataset.datafile import *
+from fixture.test import attr, conf, env_supports
+
+class TestRows(object):
+
+    def setUp(self):
+        self.tmp = TempIO()
+        self.path = self.tmp.join('rows.pkl')
+
+    @attr(unit=1)
+    def test_rows_roundtrip(self):
+        import datetime
+        from decimal import Decimal
+        rows = [
+            ('one', {'id': 1, 'created': datetime.date(2008, 1, 1)}),
+            ('two', {'id': 2, 'price': Decimal("1.45"),
+                        'parent_id': RowRef('ParentData', 'p1', 'id')})]
+        fp = open(self.path, 'wb')
+        write_rows(fp, rows)
+        fp.close()
+        eq_([r for r in read_rows(open(self.path, 'rb'))], rows)
+
+    @attr(unit=1)
+    def test_rows_are_read_when_iterated(self):
+        class ParentData(DataSet):
+            class p1:
+                id = 1
+        class ChildData(DataFileSet):
+            class Meta:
+                datafile = self.path
+                references = (ParentData,)
+        fp = open(self.path, 'wb')
+        write_rows(fp, [
+            ('c1', {'name': 'first',
+                    'parent_id': RowRef('ParentData', 'p1', 'id')}),
+            ('c2', {'name': 'second', 'parent_id': None})])
+        fp.close()
+
+        child = ChildData()
+        eq_(child.meta.keys, [])
+        rows = [r for r in child]
+        eq_([k for k, row in rows], ['c1', 'c2'])
+        c1 = rows[0][1]
+        eq_(c1.name, 'first')
+        assert isinstance(c1.parent_id, Ref.Value), c1.parent_id
+        eq_(c1.parent_id.ref.dataset_class, ParentData)
+        eq_(c1.parent_id.ref.key, 'p1')
+        eq_(c1.parent_id.attr_name, 'id')
+
+    @attr(unit=1)
+    def test_relative_datafile_is_next_to_module(self):
+        class ChildData(DataFileSet):
+            class Meta:
+                datafile = 'rows.pkl'
+        eq_(ChildData().datafile_path(),
+            os.path.join(os.path.dirname(__file__), 'rows.pkl'))
+
+class TestLoadDataFileSet(object):
+
+    def setUp(self):
+        if not env_supports.sqlalchemy:
+            raise SkipTest
+        from sqlalchemy import create_engine
+        from fixture import SQLAlchemyFixture, NamedDataStyle
+        from fixture.examples.db import sqlalchemy_examples
+        from fixture.examples.db.sqlalchemy_examples import metadata
+        self.tmp = TempIO()
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.create_all(bind=self.engine)
+        self.fixture = SQLAlchemyFixture(
+                            env=sqlalchemy_examples,
+                            style=NamedDataStyle(),
+                            engine=self.engine)
+
+    def tearDown(self):
+        from fixture.examples.db.sqlalchemy_examples import metadata
+        metadata.drop_all(bind=self.engine)
+
+    @attr(functional=1)
+    def test_load(self):
+        from fixture.examples.db.sqlalchemy_examples import products
+        categories_path = self.tmp.join('categories.pkl')
+        products_path = self.tmp.join('products.pkl')
+        class categoriesData(DataFileSet):
+            class Meta:
+                datafile = categories_path
+        class productsData(DataFileSet):
+            class Meta:
+                datafile = products_path
+                references = (categoriesData,)
+        fp = open(categories_path, 'wb')
+        write_rows(fp, [('categories_1', {'id': 1, 'name': 'parkas'})])
+        fp.close()
+        fp = open(products_path, 'wb')
+        write_rows(fp, [
+            ('products_1', {'id': 1, 'name': 'jersey',
+                'category_id': RowRef('categoriesData', 'categories_1', 'id')})])
+        fp.close()
+
+        data = self.fixture.data(productsData)
+        data.setup()
+        try:
+            eq_(data.productsData.products_1.name, 'jersey')
+            row = self.engine.execute(products.select()).fetchone()
+            eq_(row['name'], 'jersey')
+            eq_(row['category_id'], 1)
+        finally:
+            data.teardown()
@@ -7,7 +7,8 @@ from os import path
 from copy import copy
 from nose.tools import eq_, raises
 from fixture import TempIO
-from fixture.io import mkdirall, putfile
+from fixture.io import (
+    mkdirall, putfile, _tmpdirs, _join_trash, clonetree, ram_root, free_space)
 from fixture.test import attr
 
 french = "tu pense qu'on peut m'utiliser comme ça?"
@@ -186,6 +187,44 @@ class TestTempIO(object):
     def test_putfile_accepts_only_relative_paths(self):
         self.tmp.putfile('/petite/grenouille/ribbit/frenchy.txt', "franch")
 
+    @attr(unit=True)
+    def test_put_tree(self):
+        from StringIO import StringIO
+        import mmap
+        self.tmp.putfile('big.bin', 'x' * 10000, 'wb')
+        big = open(self.tmp.join('big.bin'), 'rb')
+        mapped = mmap.mmap(big.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            files = self.tmp.put_tree({
+                'petite': {
+                    'grenouille/frenchy.txt': french,
+                    'stream.txt': StringIO('ribbit'),
+                    'empty': {}},
+                'copy.bin': big,
+                'mapped.bin': mapped,
+                'petite/pond.txt': ''})
+        finally:
+            mapped.close()
+            big.close()
+        eq_(sorted([f[len(self.tmp)+1:] for f in files]), [
+            'copy.bin', 'mapped.bin', 'petite/grenouille/frenchy.txt', 
+            'petite/pond.txt', 'petite/stream.txt'])
+        def read(name):
+            return open(self.tmp.join(name), 'rb').read()
+        eq_(read('petite/grenouille/frenchy.txt'), french)
+        eq_(read('petite/stream.txt'), 'ribbit')
+        eq_(read('copy.bin'), 'x' * 10000)
+        eq_(read('mapped.bin'), 'x' * 10000)
+        assert isdir(self.tmp.join('petite/empty'))
+        # existing directories are fine :
+        self.tmp.put_tree({'petite': {'pond.txt': 'frogs'}})
+        eq_(read('petite/pond.txt'), 'frogs')
+    
+    @attr(unit=True)
+    @raises(TypeError)
+    def test_put_tree_accepts_only_relative_paths(self):
+        self.tmp.put_tree({'petite': {'/grenouille': ''}})
+
     @attr(unit=True)
     def test_rmtree(self):
         root = str(self.tmp)
@@ -195,4 +234,118 @@ class TestTempIO(object):
     @attr(unit=True)
     def test_root(self):
         assert isdir(self.tmp)
-    
\ No newline at end of file
+    
+
+class TestPooledTempIO(object):
+    def setUp(self):
+        self.parent = TempIO()
+    
+    def pooled(self):
+        return TempIO(pooled=True, dir=self.parent)
+    
+    @attr(unit=True)
+    def test_directory_is_reused(self):
+        tmp = self.pooled()
+        root = str(tmp)
+        tmp.putfile('pond/frog.txt', french)
+        del tmp
+        assert isdir(root)
+        eq_(os.listdir(root), [])
+        
+        tmp = self.pooled()
+        eq_(str(tmp), root)
+        other = self.pooled()
+        assert str(other) != root
+        tmp.rmtree()
+        # only once :
+        tmp.rmtree()
+        del tmp
+        eq_(str(self.pooled()), root)
+    
+    @attr(unit=True)
+    def test_contents_are_deleted_in_background(self):
+        tmp = self.pooled()
+        tmp.putfile('pond/frog.txt', french)
+        tmp.rmtree()
+        _join_trash()
+        eq_(os.listdir(self.parent), [basename(tmp)])
+    
+    @attr(unit=True)
+    def test_deleted_directories_are_forgotten(self):
+        tmp = TempIO()
+        root = str(tmp)
+        assert root in _tmpdirs
+        tmp.rmtree()
+        assert root not in _tmpdirs
+
+class TestTemplateTempIO(object):
+    
+    def read(self, tmp, name):
+        return open(tmp.join(name), 'rb').read()
+    
+    @attr(unit=True)
+    def test_tree_template(self):
+        template = {'pond': {'frog.txt': french, 'lily': {}}, 'README': 'hi'}
+        first = TempIO(template=template)
+        eq_(self.read(first, 'pond/frog.txt'), french)
+        assert isdir(first.join('pond/lily'))
+        first.putfile('pond/frog.txt', 'changed')
+        
+        second = TempIO(template=dict(template))
+        eq_(self.read(second, 'pond/frog.txt'), french)
+        eq_(sorted(os.listdir(second)), ['README', 'pond'])
+    
+    @attr(unit=True)
+    def test_directory_template(self):
+        source = TempIO()
+        source.putfile('pond/frog.txt', french)
+        os.symlink('frog.txt', source.join('pond/toad.txt'))
+        tmp = TempIO(template=source)
+        eq_(self.read(tmp, 'pond/frog.txt'), french)
+        eq_(os.readlink(tmp.join('pond/toad.txt')), 'frog.txt')
+    
+    @attr(unit=True)
+    def test_clonetree_into_existing_directory(self):
+        source = TempIO()
+        source.putfile('a/b/c.txt', 'c')
+        dest = TempIO()
+        clonetree(source, dest)
+        clonetree(source, dest.join('a'))
+        eq_(self.read(dest, 'a/b/c.txt'), 'c')
+        eq_(self.read(dest, 'a/a/b/c.txt'), 'c')
+
+class TestRamTempIO(object):
+    
+    def setUp(self):
+        self.environ = os.environ.get('FIXTURE_TEMPIO_RAM_ROOT')
+        self.root = TempIO()
+        os.environ['FIXTURE_TEMPIO_RAM_ROOT'] = self.root
+    
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ['FIXTURE_TEMPIO_RAM_ROOT']
+        else:
+            os.environ['FIXTURE_TEMPIO_RAM_ROOT'] = self.environ
+    
+    @attr(unit=True)
+    def test_configured_root(self):
+        eq_(ram_root(), self.root)
+        tmp = TempIO(ram=True, size_hint=1)
+        eq_(tmp.dirname(), self.root)
+    
+    @attr(unit=True)
+    def test_falls_back_to_disk_when_too_big(self):
+        tmp = TempIO(ram=True, size_hint=free_space(self.root) + 1)
+        assert tmp.dirname() != self.root
+        
+    @attr(unit=True)
+    def test_template_counts_against_size(self):
+        tmp = TempIO(ram=True, size_hint=free_space(self.root) - 10,
+                     template={'big.txt': 'x' * (1024 * 1024)})
+        assert tmp.dirname() != self.root
+        
+    @attr(unit=True)
+    def test_missing_root(self):
+        os.environ['FIXTURE_TEMPIO_RAM_ROOT'] = self.root.join('missing')
+        eq_(ram_root(), None)
+        assert TempIO(ram=True).exists()
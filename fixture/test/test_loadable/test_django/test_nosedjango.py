@@ -0,0 +1,119 @@
+import os
+import sys
+import subprocess
+from nose.tools import eq_
+from nose.exc import SkipTest
+from fixture import TempIO
+from fixture.test import attr
+import fixture.examples.django_example
+
+example_dir = os.path.dirname(fixture.examples.django_example.__file__)
+
+run_nose = """
+import os
+from nose.core import main
+from nose.plugins import multiprocess
+from nosedjango.nosedjango import NoseDjango
+
+class CheckedNoseDjango(NoseDjango):
+    def begin(self):
+        NoseDjango.begin(self)
+        from django.db import connection
+        # workers clone the template once this returns (and the main 
+        # process forks them) : 
+        if 'CHECK_CONNECTION' in os.environ:
+            f = open(os.environ['CHECK_CONNECTION'], 'a')
+            f.write(connection.connection is None and 'closed' or 'open')
+            f.close()
+
+# plugins handed to main() are not sent to --processes workers :
+multiprocess._instantiate_plugins = [CheckedNoseDjango]
+main(addplugins=[CheckedNoseDjango()])
+"""
+
+settings = """
+import sys
+sys.path.insert(0, %(example_dir)r)
+execfile(%(settings)r)
+TEST_DATABASE_NAME = %(test_db)r
+"""
+
+authors_test = """
+from app.models import Author
+
+def test_1_write():
+    assert Author.objects.count() == 2, Author.objects.count()
+    Author.objects.create(first_name='Jules', last_name='Verne')
+    assert Author.objects.count() == 3
+
+def test_2_reset():
+    assert Author.objects.count() == 2, Author.objects.count()
+"""
+
+class TestTemplateData(object):
+
+    def setUp(self):
+        try:
+            import nosedjango.nosedjango
+            import sqlalchemy
+        except ImportError:
+            raise SkipTest
+        self.tmp = TempIO()
+        self.test_db = self.tmp.join('test.db')
+        self.tmp.putfile('settings.py', settings % dict(
+                            example_dir=example_dir, test_db=self.test_db,
+                            settings=os.path.join(example_dir, 'settings.py')))
+        self.tmp.putfile('test_authors.py', authors_test)
+
+    def nosetests(self, *args, **extra_env):
+        env = dict(os.environ)
+        env.pop('NOSE_DJANGO_TEMPLATE_DB', None)
+        env.update(extra_env)
+        env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p])
+        proc = subprocess.Popen([sys.executable, '-c', run_nose,
+                    '--with-django', '--django-settings-path=%s' % self.tmp,
+                    '--django-template-data=fixture.test.test_loadable.'
+                                        'test_django.fixtures.AuthorData'] +
+                    list(args) + [self.tmp.join('test_authors.py')],
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    env=env, cwd=self.tmp)
+        output = proc.communicate()[0]
+        return proc.returncode, output
+
+    @attr(functional=1)
+    def test_reset_per_test(self):
+        returncode, output = self.nosetests('--django-reset-per-test')
+        eq_(returncode, 0, output)
+        # the test database and the clones made from it are dropped :
+        eq_(sorted([f for f in os.listdir(self.tmp) if f.endswith('.db')]),
+            [])
+
+    @attr(functional=1)
+    def test_without_reset_per_test(self):
+        returncode, output = self.nosetests()
+        eq_(returncode, 1, output)
+        assert 'FAILED (failures=1)' in output, output
+        eq_(sorted([f for f in os.listdir(self.tmp) if f.endswith('.db')]),
+            [])
+
+    @attr(functional=1)
+    def test_parallel_workers(self):
+        returncode, output = self.nosetests('--django-reset-per-test',
+                                            '--processes=2')
+        eq_(returncode, 0, output)
+        eq_(sorted([f for f in os.listdir(self.tmp) if f.endswith('.db')]),
+            [])
+    
+    @attr(functional=1)
+    def test_template_connection_is_closed(self):
+        # with PostgreSQL, a clone of a template that the main process is 
+        # still connected to would fail with "source database is being 
+        # accessed by other users"; SQLite does not mind so the connection 
+        # is checked instead :
+        check = self.tmp.join('connection.txt')
+        returncode, output = self.nosetests('--django-reset-per-test',
+                                            '--processes=2',
+                                            CHECK_CONNECTION=check)
+        eq_(returncode, 0, output)
+        # the main process then each worker :
+        eq_(open(check).read(), 'closed' * 3)
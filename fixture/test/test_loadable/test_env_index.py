@@ -0,0 +1,118 @@
+
+import sys
+import types
+from nose.tools import eq_, raises
+from nose.exc import SkipTest
+from fixture import EnvIndex, DataSet
+from fixture.style import (
+    OriginalStyle, NamedDataStyle, CamelAndUndersStyle, PaddedNameStyle)
+from fixture.loadable.loadable import EnvLoadableFixture
+from fixture.test import attr, env_supports
+
+def make_module(name, **objects):
+    module = types.ModuleType(name)
+    for obj_name, obj in objects.items():
+        setattr(module, obj_name, obj)
+    return module
+
+def model(name, module='people'):
+    return type(name, (object,), {'__module__': module})
+
+Employee = model('Employee')
+EmployeeRole = model('EmployeeRole')
+
+def make_employee_data():
+    class Employee(DataSet):
+        class joe:
+            name = 'Joe'
+    return Employee
+# a DataSet named like the model it loads :
+EmployeeDataSet = make_employee_data()
+
+class LowerCaseStyle(OriginalStyle):
+    def guess_storable_name(self, name):
+        return name.lower()
+
+@attr(unit=1)
+def test_modules_are_indexed():
+    Department = model('Department', module='places')
+    people = make_module('people', Employee=Employee, 
+                                   EmployeeRole=EmployeeRole)
+    # imported classes are only indexed in the module declaring them :
+    people.Imported = EnvIndex
+    places = make_module('places', Department=Department)
+    places.Employee = Employee
+    env = EnvIndex(people, places)
+    eq_(env.get('Employee'), Employee)
+    eq_(env.get('Department'), Department)
+    eq_(env.get('Imported'), None)
+    eq_(env.get('_private', 'default'), 'default')
+    assert 'EmployeeRole' in env
+
+@attr(unit=1)
+@raises(ValueError)
+def test_ambiguous_names_are_reported_when_indexing():
+    EnvIndex(make_module('people', Employee=Employee),
+             {'Employee': model('Employee')})
+
+@attr(unit=1)
+def test_style_aliases():
+    env = EnvIndex({'Employee': Employee, 'EmployeeRole': EmployeeRole},
+                   style=PaddedNameStyle(prefix='tbl_'))
+    eq_(env.get('tbl_EmployeeRole'), EmployeeRole)
+    eq_(env.get('EmployeeRole'), EmployeeRole)
+
+@attr(unit=1)
+def test_aliases_are_what_datasets_look_up():
+    style = PaddedNameStyle(prefix='tbl_')
+    env = EnvIndex({'Employee': Employee}, style=style)
+    fixture = EnvLoadableFixture(env=env, style=style)
+    ds = EmployeeDataSet()
+    fixture.attach_storage_medium(ds)
+    eq_(ds.meta.storable_name, 'tbl_Employee')
+    eq_(ds.meta.storage_medium.medium, Employee)
+
+@attr(unit=1)
+def test_untranslatable_names_get_no_alias():
+    # NamedDataStyle expects names ending with Data :
+    env = EnvIndex({'Employee': Employee, 'EmployeeRole': EmployeeRole},
+                   style=NamedDataStyle() + CamelAndUndersStyle())
+    eq_(env.get('Employee'), Employee)
+    eq_(env.aliases, {})
+
+@attr(unit=1)
+def test_names_take_precedence_over_aliases():
+    employee_role = model('employee_role')
+    env = EnvIndex({'EmployeeRole': EmployeeRole, 
+                    'employee_role': employee_role},
+                   style=LowerCaseStyle())
+    eq_(env.get('employee_role'), employee_role)
+
+@attr(unit=1)
+@raises(ValueError)
+def test_ambiguous_aliases_are_reported_when_indexing():
+    EnvIndex({'Employee': Employee, 'EMPLOYEE': model('EMPLOYEE')},
+             style=LowerCaseStyle())
+
+@attr(unit=1)
+def test_sqlalchemy_sources():
+    if not env_supports.sqlalchemy:
+        raise SkipTest
+    from sqlalchemy import MetaData, Table, Column, INT
+    from sqlalchemy.ext.declarative import declarative_base
+    metadata = MetaData()
+    employees = Table('employees', metadata, Column('id', INT, primary_key=True))
+    Base = declarative_base()
+    class Department(Base):
+        __tablename__ = 'departments'
+        id = Column(INT, primary_key=True)
+    module = make_module('tables', employee_table=employees)
+    env = EnvIndex(metadata, Base, module)
+    eq_(env.get('employees'), employees)
+    eq_(env.get('employee_table'), employees)
+    eq_(env.get('Department'), Department)
+
+@attr(unit=1)
+@raises(TypeError)
+def test_unknown_source():
+    EnvIndex(object())
@@ -289,6 +289,22 @@ class TestEnvLoadableFixture(object):
         data = efixture.data(MyDataSet)
         data.setup()
         
+    def test_storables_are_looked_up_once(self):
+        class CountingEnv(dict):
+            lookups = 0
+            def get(self, name, default=None):
+                self.lookups += 1
+                return dict.get(self, name, default)
+        storable = object()
+        env = CountingEnv(Product=storable)
+        efixture = EnvLoadableFixture(env=env)
+        eq_(efixture.find_storable('Product'), storable)
+        eq_(efixture.find_storable('Product'), storable)
+        eq_(env.lookups, 1)
+        eq_(efixture.find_storable('Category'), None)
+        efixture.env = {'Product': 'other'}
+        eq_(efixture.find_storable('Product'), 'other')
+        
 class StubLoadableFixture(DBLoadableFixture):
     def create_transaction(self):
         class NoTrans:
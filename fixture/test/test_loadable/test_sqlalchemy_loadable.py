@@ -1,4 +1,5 @@
 
+import os
 import unittest
 from nose.tools import eq_, raises
 from nose.exc import SkipTest
@@ -493,6 +494,568 @@ class TestTableObjects(unittest.TestCase):
         clear_session(self.session)
         eq_(self.session.execute(categories.select()).fetchall(), [])
 
+class TestLoadedTableRows(unittest.TestCase):
+    class CategoryData(DataSet):
+        class cars:
+            name = 'cars'
+        class free_stuff:
+            name = 'get free stuff'
+        class gadgets:
+            name = 'gadgets'
+            
+    def setUp(self):
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.bind = self.engine
+        metadata.create_all()
+        self.fixture = SQLAlchemyFixture(
+            env={'CategoryData':categories},
+            engine=metadata.bind
+        )
+    
+    def tearDown(self):
+        metadata.drop_all()
+    
+    @attr(functional=1)
+    def test_first_access_fetches_all_rows(self):
+        data = self.fixture.data(self.CategoryData)
+        data.setup()
+        try:
+            stored = data.CategoryData.meta._stored_objects
+            eq_([r.row for r in stored], [None, None, None])
+            eq_(data.CategoryData.cars.id, stored[0].inserted_key[0])
+            eq_(stored[0].name, 'cars')
+            eq_([r.row is None for r in stored], [False, False, False])
+            eq_(stored[2].name, 'gadgets')
+        finally:
+            data.teardown()
+    
+    @attr(functional=1)
+    def test_composite_primary_key(self):
+        scores = Table('fixture_sqlalchemy_score', metadata,
+            Column('player', String(30), primary_key=True),
+            Column('game', INT, primary_key=True),
+            Column('points', INT, default=0))
+        scores.create()
+        try:
+            class ScoreData(DataSet):
+                class Meta:
+                    primary_key = ['player', 'game']
+                class bob_1:
+                    player = 'bob'
+                    game = 1
+                class bob_2:
+                    player = 'bob'
+                    game = 2
+                    points = 10
+            fixture = SQLAlchemyFixture(
+                env={'ScoreData':scores}, engine=metadata.bind)
+            data = fixture.data(ScoreData)
+            data.setup()
+            try:
+                stored = data.ScoreData.meta._stored_objects
+                eq_(stored[1].points, 10)
+                eq_(stored[0].row is None, False)
+                eq_(stored[0].points, 0)
+            finally:
+                data.teardown()
+        finally:
+            scores.drop()
+            metadata.remove(scores)
+
+class TestConnectionIsKept(unittest.TestCase):
+    class CategoryData(DataSet):
+        class cars:
+            name = 'cars'
+        class free_stuff:
+            name = 'get free stuff'
+            
+    def setUp(self):
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.bind = self.engine
+        metadata.create_all()
+        self.fixture = SQLAlchemyFixture(
+            env={'CategoryData':Category},
+            engine=metadata.bind
+        )
+        clear_mappers()
+        mapper(Category, categories)
+    
+    def tearDown(self):
+        self.fixture.dispose()
+        metadata.drop_all()
+        clear_mappers()
+    
+    @attr(functional=1)
+    def test_connection_is_kept_between_setups(self):
+        session = None
+        for i in range(3):
+            data = self.fixture.data(self.CategoryData)
+            data.setup()
+            eq_(data.CategoryData.cars.name, 'cars')
+            if session is None:
+                session = self.fixture.session
+                conn = self.fixture.connection
+            assert self.fixture.session is session
+            assert self.fixture.connection is conn
+            eq_(len(conn.execute(categories.select()).fetchall()), 2)
+            data.teardown()
+            eq_(conn.closed, False)
+            eq_(conn.execute(categories.select()).fetchall(), [])
+        
+        self.fixture.dispose()
+        eq_(conn.closed, True)
+
+class CategoryTableData(DataSet):
+    class cars:
+        id = 1
+        name = 'cars'
+    class free_stuff:
+        id = 2
+        name = "it's free"
+
+class ProductTableData(DataSet):
+    class truck:
+        id = 1
+        name = 'truck'
+        category_id = CategoryTableData.cars.ref('id')
+
+class OfferTableData(DataSet):
+    class free_offer:
+        id = 1
+        name = 'free offer'
+        category_id = CategoryTableData.free_stuff.ref('id')
+
+class TestCompiledScript(unittest.TestCase):
+    ProductData = ProductTableData
+    
+    def setUp(self):
+        from fixture import TempIO
+        self.tmp = TempIO()
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.bind = self.engine
+        metadata.create_all()
+        self.fixture = SQLAlchemyFixture(
+            env={'CategoryTableData':categories, 'ProductTableData':products},
+            engine=metadata.bind,
+            script_cache=self.tmp.join('scripts')
+        )
+    
+    def tearDown(self):
+        metadata.drop_all()
+    
+    @attr(unit=1)
+    def test_compile_script(self):
+        script = self.fixture.compile_script([self.ProductData])
+        eq_(script.splitlines(), [
+            "INSERT INTO fixture_sqlalchemy_category (id, name) "
+                                        "VALUES (1, 'cars');",
+            "INSERT INTO fixture_sqlalchemy_category (id, name) "
+                                        "VALUES (2, 'it''s free');",
+            "INSERT INTO fixture_sqlalchemy_product (category_id, id, name) "
+                                        "VALUES (1, 1, 'truck');"])
+    
+    @attr(unit=1)
+    @raises(ValueError)
+    def test_primary_key_is_required(self):
+        class CategoryTableData(DataSet):
+            class cars:
+                name = 'cars'
+        self.fixture.compile_script([CategoryTableData])
+    
+    @attr(unit=1)
+    def test_cache_key_changes_with_source(self):
+        import imp
+        dialect = self.engine.dialect
+        modpath = self.tmp.join('compiled_data.py')
+        def key_for(source):
+            fp = open(modpath, 'w')
+            fp.write(source)
+            fp.close()
+            mod = imp.load_source('compiled_data', modpath)
+            ds = mod.CategoryTableData()
+            self.fixture.attach_storage_medium(ds)
+            return script_cache_key([ds], dialect)
+        source = (
+            "from fixture import DataSet\n"
+            "class CategoryTableData(DataSet):\n"
+            "    class cars:\n"
+            "        id = 1\n"
+            "        name = 'cars'\n")
+        key = key_for(source)
+        eq_(key_for(source), key)
+        assert key_for(source.replace('cars', 'trucks')) != key
+    
+    @attr(unit=1)
+    def test_cache_key_changes_with_base_class_source(self):
+        import imp, sys
+        dialect = self.engine.dialect
+        basepath = self.tmp.join('compiled_base.py')
+        fp = open(self.tmp.join('compiled_child.py'), 'w')
+        fp.write(
+            "from compiled_base import BaseData\n"
+            "class CategoryTableData(BaseData):\n"
+            "    class cars:\n"
+            "        id = 1\n"
+            "        name = 'cars'\n")
+        fp.close()
+        def key_for(base_source):
+            fp = open(basepath, 'w')
+            fp.write(base_source)
+            fp.close()
+            imp.load_source('compiled_base', basepath)
+            mod = imp.load_source('compiled_child', 
+                                  self.tmp.join('compiled_child.py'))
+            ds = mod.CategoryTableData()
+            self.fixture.attach_storage_medium(ds)
+            return script_cache_key([ds], dialect)
+        source = (
+            "from fixture import DataSet\n"
+            "class BaseData(DataSet):\n"
+            "    pass\n")
+        try:
+            key = key_for(source)
+            eq_(key_for(source), key)
+            assert key_for(source + "# changed\n") != key
+        finally:
+            for name in ('compiled_base', 'compiled_child'):
+                sys.modules.pop(name, None)
+    
+    @attr(unit=1)
+    def test_cache_key_changes_with_columns(self):
+        from sqlalchemy import MetaData, Table, Column, INT, String
+        dialect = self.engine.dialect
+        def key_for(*columns):
+            table = Table('fixture_sqlalchemy_category', MetaData(), 
+                          Column('id', INT, primary_key=True), *columns)
+            class CategoryTableData(DataSet):
+                class cars:
+                    id = 1
+                    name = 'cars'
+            fixture = SQLAlchemyFixture(
+                env={'CategoryTableData': table}, engine=self.engine)
+            ds = CategoryTableData()
+            fixture.attach_storage_medium(ds)
+            return script_cache_key([ds], dialect)
+        key = key_for(Column('name', String(100)))
+        eq_(key_for(Column('name', String(100))), key)
+        assert key_for(Column('name', String(200))) != key
+        assert key_for(Column('name', String(100), nullable=False)) != key
+        assert key_for(Column('title', String(100))) != key
+    
+    @attr(unit=1)
+    def test_script_is_split_unless_postgres(self):
+        executed = []
+        class cursor:
+            def execute(self, stmt):
+                executed.append(stmt)
+            def close(self):
+                pass
+        class raw:
+            def cursor(self):
+                return cursor()
+        class connection:
+            class dialect:
+                name = 'mysql'
+        connection.connection = raw()
+        script = u"INSERT INTO t VALUES ('a;b');\nINSERT INTO t VALUES (1);\n"
+        execute_script(connection, script)
+        eq_(executed, [u"INSERT INTO t VALUES ('a;b')", 
+                       u"INSERT INTO t VALUES (1)"])
+        executed[:] = []
+        connection.dialect.name = 'postgres'
+        execute_script(connection, script)
+        eq_(executed, [script])
+    
+    @attr(functional=1)
+    def test_script_is_rolled_back(self):
+        script = self.fixture.compile_script([self.ProductData])
+        conn = self.engine.connect()
+        try:
+            transaction = conn.begin()
+            execute_script(conn, script)
+            eq_(len(conn.execute(categories.select()).fetchall()), 2)
+            transaction.rollback()
+            eq_(conn.execute(categories.select()).fetchall(), [])
+            eq_(conn.execute(products.select()).fetchall(), [])
+        finally:
+            conn.close()
+    
+    @attr(functional=1)
+    def test_setup_then_teardown(self):
+        data = self.fixture.data(self.ProductData)
+        data.setup()
+        try:
+            eq_(data.ProductTableData.truck.category_id, 1)
+            stored = data.CategoryTableData.meta._stored_objects
+            eq_(stored[1].name, "it's free")
+            rows = self.engine.execute(products.select()).fetchall()
+            eq_([(r['name'], r['category_id']) for r in rows], [('truck', 1)])
+        finally:
+            data.teardown()
+        eq_(self.engine.execute(categories.select()).fetchall(), [])
+        eq_(self.engine.execute(products.select()).fetchall(), [])
+    
+    @attr(functional=1)
+    def test_compiled_script_is_cached(self):
+        data = self.fixture.data(self.ProductData)
+        data.setup()
+        data.teardown()
+        scripts = os.listdir(self.tmp.join('scripts'))
+        eq_(len(scripts), 1)
+        path = os.path.join(self.tmp.join('scripts'), scripts[0])
+        script = open(path).read().replace('truck', 'fire truck')
+        open(path, 'w').write(script)
+        
+        data = self.fixture.data(self.ProductData)
+        data.setup()
+        try:
+            row = self.engine.execute(products.select()).fetchone()
+            eq_(row['name'], 'fire truck')
+        finally:
+            data.teardown()
+    
+    @attr(unit=1)
+    @raises(ValueError)
+    def test_requires_engine(self):
+        SQLAlchemyFixture(env={}, script_cache=self.tmp.join('scripts'))
+
+class TestClassScope(unittest.TestCase):
+    
+    def setUp(self):
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.bind = self.engine
+        metadata.create_all()
+        self.fixture = SQLAlchemyFixture(
+            env={'CategoryTableData':categories},
+            engine=metadata.bind
+        )
+    
+    def tearDown(self):
+        metadata.drop_all()
+    
+    @attr(functional=1)
+    def test_tests_run_in_savepoints(self):
+        from fixture import DataTestCase
+        fixture = self.fixture
+        counts = []
+        class CategoryTest(DataTestCase, unittest.TestCase):
+            datasets = [CategoryTableData]
+            scope = 'class'
+            def count(self):
+                return fixture.connection.execute(
+                    categories.count()).scalar()
+            def test_1_write(self):
+                counts.append(self.count())
+                fixture.connection.execute(categories.insert(), name='new')
+                counts.append(self.count())
+            def test_2_read(self):
+                counts.append(self.count())
+                eq_(self.data.CategoryTableData.cars.name, 'cars')
+        CategoryTest.fixture = fixture
+        suite = unittest.TestLoader().loadTestsFromTestCase(CategoryTest)
+        result = unittest.TestResult()
+        suite.run(result)
+        CategoryTest.tearDownClass()
+        eq_(result.errors, [])
+        eq_(result.failures, [])
+        eq_(counts, [2, 3, 2])
+        eq_(self.engine.execute(categories.select()).fetchall(), [])
+
+class ChecksummedMedium(TableMedium):
+    def version(self):
+        return table_checksum(self.medium, self.conn)
+
+class TestStickyData(unittest.TestCase):
+    
+    def setUp(self):
+        self.engine = create_engine(conf.LITE_DSN)
+        metadata.bind = self.engine
+        metadata.create_all()
+        self.fixture = SQLAlchemyFixture(
+            env={'CategoryTableData':categories, 'ProductTableData':products,
+                 'OfferTableData':offers},
+            engine=metadata.bind,
+            medium=ChecksummedMedium,
+            sticky=True
+        )
+    
+    def tearDown(self):
+        self.fixture.unload(force=True)
+        metadata.drop_all()
+    
+    def setup_products(self):
+        data = self.fixture.data(ProductTableData)
+        data.setup()
+        eq_(data.ProductTableData.truck.category_id, 1)
+        data.teardown()
+        return data
+    
+    def rows(self, table):
+        return self.engine.execute(table.select().order_by(table.c.id)).fetchall()
+    
+    @attr(functional=1)
+    def test_same_data_is_not_reloaded(self):
+        first = self.setup_products()
+        eq_(len(self.rows(products)), 1)
+        second = self.setup_products()
+        assert second.ProductTableData is first.ProductTableData
+        eq_(len(self.rows(categories)), 2)
+        self.fixture.unload(force=True)
+        eq_(self.rows(categories), [])
+        eq_(self.rows(products), [])
+    
+    @attr(functional=1)
+    def test_changed_data_is_reloaded(self):
+        first = self.setup_products()
+        self.engine.execute(products.update(), name='changed')
+        second = self.setup_products()
+        # categories did not change so only products were reloaded :
+        assert second.ProductTableData is not first.ProductTableData
+        assert second.CategoryTableData is first.CategoryTableData
+        eq_([r.name for r in self.rows(products)], ['truck'])
+        
+        self.engine.execute(categories.insert(), id=3, name='new')
+        third = self.setup_products()
+        assert third.CategoryTableData is not second.CategoryTableData
+        assert third.ProductTableData is not second.ProductTableData
+        eq_([r.name for r in self.rows(categories)], ['cars', "it's free", 'new'])
+    
+    @attr(functional=1)
+    def test_only_datasets_no_longer_needed_are_unloaded(self):
+        first = self.setup_products()
+        data = self.fixture.data(CategoryTableData)
+        data.setup()
+        data.teardown()
+        assert data.CategoryTableData is first.CategoryTableData
+        eq_(self.rows(products), [])
+        eq_(len(self.rows(categories)), 2)
+    
+    @attr(functional=1)
+    def test_only_new_datasets_are_loaded(self):
+        first = self.setup_products()
+        data = self.fixture.data(OfferTableData)
+        data.setup()
+        assert data.CategoryTableData is first.CategoryTableData
+        eq_(data.OfferTableData.free_offer.category_id, 2)
+        eq_([(r.name, r.category_id) for r in self.rows(offers)], 
+            [('free offer', 2)])
+        eq_(self.rows(products), [])
+        data.teardown()
+        
+        # references to kept rows still resolve after reloading :
+        self.engine.execute(offers.delete())
+        data = self.fixture.data(OfferTableData)
+        data.setup()
+        eq_(data.OfferTableData.free_offer.category_id, 2)
+        eq_(len(self.rows(offers)), 1)
+        data.teardown()
+
+    @attr(functional=1)
+    def test_version_tells_what_changed(self):
+        class VersionedMedium(TableMedium):
+            current = 1
+            def version(self):
+                return VersionedMedium.current
+        self.fixture.Medium = VersionedMedium
+        first = self.setup_products()
+        second = self.setup_products()
+        assert second.ProductTableData is first.ProductTableData
+        VersionedMedium.current = 2
+        third = self.setup_products()
+        assert third.ProductTableData is not second.ProductTableData
+    
+    @attr(functional=1)
+    def test_unversioned_data_is_reloaded_with_a_warning(self):
+        import warnings
+        self.fixture.Medium = TableMedium
+        warned = []
+        showwarning, filters = warnings.showwarning, warnings.filters[:]
+        def record(message, *a, **kw):
+            warned.append(str(message))
+        warnings.showwarning = record
+        warnings.simplefilter('always')
+        try:
+            first = self.setup_products()
+            second = self.setup_products()
+        finally:
+            warnings.showwarning = showwarning
+            warnings.filters[:] = filters
+        assert second.ProductTableData is not first.ProductTableData
+        assert second.CategoryTableData is not first.CategoryTableData
+        eq_(len(self.rows(products)), 1)
+        # once per table :
+        eq_(len(warned), 2)
+        warned.sort()
+        assert 'CategoryTableData' in warned[0], warned
+        assert 'ProductTableData' in warned[1], warned
+
+@attr(unit=True)
+def test_table_version():
+    class StubDialect:
+        name = 'mysql'
+        class identifier_preparer:
+            def format_table(table):
+                return table.name
+            format_table = staticmethod(format_table)
+    class StubResult:
+        def __init__(self, row):
+            self.row = row
+        def fetchone(self):
+            return self.row
+    class StubConnection:
+        dialect = StubDialect()
+        def __init__(self, checksum):
+            self.checksum = checksum
+            self.statements = []
+        def execute(self, stmt):
+            self.statements.append(stmt)
+            return StubResult(('db.%s' % categories.name, self.checksum))
+    conn = StubConnection(1234)
+    eq_(table_version(categories, conn), 1234)
+    eq_(conn.statements, ['CHECKSUM TABLE %s QUICK' % categories.name])
+    # no live checksum :
+    eq_(table_version(categories, StubConnection(None)), None)
+    eq_(table_version(categories, create_engine(conf.LITE_DSN)), None)
+
+@attr(unit=True)
+def test_TableMedium_uses_returning():
+    class StubDialect:
+        name = 'postgres'
+        insert_returning = True
+        implicit_returning = True
+    class StubResult:
+        def __init__(self, row):
+            self.row = row
+        def fetchone(self):
+            return self.row
+        def close(self):
+            pass
+    class StubConnection:
+        dialect = StubDialect()
+        def __init__(self):
+            self.statements = []
+        def execute(self, stmt, params):
+            self.statements.append(stmt)
+            row = dict(params)
+            row[categories.c.id] = 7
+            row[categories.c.name] = params['name']
+            return StubResult(row)
+    class StubLoader:
+        connection = StubConnection()
+    
+    class CategoryData(DataSet):
+        class cars:
+            name = 'cars'
+    
+    eq_(supports_returning(StubDialect()), True)
+    medium = TableMedium(categories, CategoryData())
+    medium.visit_loader(StubLoader())
+    eq_(medium.use_returning, True)
+    obj = medium.save(None, [('name', 'cars')])
+    eq_(obj.inserted_key, [7])
+    eq_(obj.row[categories.c.name], 'cars')
+    eq_(medium.loaded_rows.pending, [])
+
 class TestTableObjectsExplicitConn(object):
     class CategoryData(DataSet):
         class cars:
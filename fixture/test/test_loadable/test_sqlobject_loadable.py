@@ -138,4 +138,82 @@ class TestSQLObjectFixtureCascadeAsRefInheritWithHeavyDB(
         HavingRefInheritedOfferProduct, SQLObjectFixtureCascadeTestWithHeavyDB, 
         LoadableTest):
     pass
-            
\ No newline at end of file
+            
+class SQLObjectBulkInsertTest(SQLObjectFixtureTest):
+    fixture = SQLObjectFixture(
+                        style=( NamedDataStyle() + CamelAndUndersStyle()),
+                        dsn=conf.LITE_DSN, env=globals(), 
+                        use_transaction=False, use_bulk_insert=True,
+                        dataclass=MergedSuperSet )
+
+class SQLObjectBulkCategoryTest(SQLObjectBulkInsertTest, SQLObjectCategoryTest):
+    pass
+
+class SQLObjectBulkCascadeTest(
+        SQLObjectBulkInsertTest, SQLObjectFixtureCascadeTest):
+    pass
+
+class TestSQLObjectBulkCategory(
+        HavingCategoryData, SQLObjectBulkCategoryTest, LoadableTest):
+    pass
+class TestSQLObjectBulkCategoryAsDataType(
+        HavingCategoryAsDataType, SQLObjectBulkCategoryTest, LoadableTest):
+    pass
+class TestSQLObjectBulkCascade(
+        HavingOfferProductData, SQLObjectBulkCascadeTest, LoadableTest):
+    pass
+class TestSQLObjectBulkCascadeAsType(
+        HavingOfferProductAsDataType, SQLObjectBulkCascadeTest, LoadableTest):
+    pass
+class TestSQLObjectBulkCascadeAsRef(
+        HavingReferencedOfferProduct, SQLObjectBulkCascadeTest, LoadableTest):
+    pass
+class TestSQLObjectBulkCascadeAsRefInherit(
+        HavingRefInheritedOfferProduct, SQLObjectBulkCascadeTest, 
+        LoadableTest):
+    pass
+
+class TestSQLObjectBulkInsert(SQLObjectBulkInsertTest):
+    
+    def test_rows_are_loaded_lazily(self):
+        from fixture.loadable.sqlobject_loadable import LoadedSQLObject
+        class CategoryData(DataSet):
+            class gray_stuff:
+                id = 1
+                name = 'gray'
+            class yellow_stuff:
+                id = 2
+                name = 'yellow'
+        class ProductData(DataSet):
+            class truck:
+                id = 1
+                name = 'truck'
+                category = CategoryData.yellow_stuff
+        data = self.fixture.data(ProductData)
+        data.setup()
+        try:
+            stored = self.fixture.loaded[CategoryData].meta._stored_objects
+            eq_([type(o) for o in stored], [LoadedSQLObject, LoadedSQLObject])
+            eq_([o.obj for o in stored], [None, None])
+            
+            truck = self.fixture.loaded[ProductData].meta._stored_objects.get_object('truck')
+            eq_(truck.category.name, 'yellow')
+            eq_(Product.get(1).category.id, 2)
+        finally:
+            data.teardown()
+        eq_(Category.select().count(), 0)
+        eq_(Product.select().count(), 0)
+    
+    def test_rows_without_id_are_not_bulk_inserted(self):
+        class CategoryData(DataSet):
+            class gray_stuff:
+                name = 'gray'
+        data = self.fixture.data(CategoryData)
+        data.setup()
+        try:
+            obj = self.fixture.loaded[CategoryData].meta._stored_objects.get_object(
+                                                            'gray_stuff')
+            assert isinstance(obj, Category), obj
+        finally:
+            data.teardown()
+        eq_(Category.select().count(), 0)
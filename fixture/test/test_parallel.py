@@ -0,0 +1,144 @@
+
+import os
+from nose.tools import eq_, raises
+from nose.exc import SkipTest
+from fixture import DataSet, TempIO
+from fixture.base import Fixture
+from fixture.parallel import *
+from fixture.parallel import FixtureWorkers
+from fixture.test import attr, env_supports
+
+class CountryData(DataSet):
+    class canada:
+        id = 1
+        name = 'Canada'
+
+def populate(url):
+    from sqlalchemy import create_engine, MetaData, Table, Column, INT, String
+    from fixture import SQLAlchemyFixture
+    engine = create_engine(url)
+    metadata = MetaData(bind=engine)
+    countries = Table('countries', metadata,
+        Column('id', INT, primary_key=True),
+        Column('name', String(30)))
+    metadata.create_all()
+    SQLAlchemyFixture(env={'CountryData': countries},
+                      engine=engine).data(CountryData).setup()
+    engine.dispose()
+
+def country_names(url):
+    from sqlalchemy import create_engine
+    engine = create_engine(url)
+    try:
+        return [r[0] for r in engine.execute(
+                        "SELECT name FROM countries ORDER BY id")]
+    finally:
+        engine.dispose()
+
+class WorkerEnvironment(object):
+
+    def setUp(self):
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+class TestCurrentWorker(WorkerEnvironment):
+
+    @attr(unit=1)
+    def test_worker_from_environment(self):
+        os.environ['FIXTURE_WORKER'] = '3'
+        eq_(current_worker(), '3')
+
+    @attr(unit=1)
+    def test_main_process(self):
+        os.environ.pop('FIXTURE_WORKER', None)
+        eq_(current_worker(), None)
+
+    @attr(unit=1)
+    def test_multiprocessing_worker(self):
+        try:
+            import multiprocessing
+        except ImportError:
+            raise SkipTest
+        os.environ.pop('FIXTURE_WORKER', None)
+        queue = multiprocessing.Queue()
+        def report():
+            queue.put(current_worker())
+        process = multiprocessing.Process(target=report)
+        process.start()
+        worker = queue.get(timeout=10)
+        process.join()
+        assert worker is not None
+        assert worker == str(process._identity[0]), worker
+
+    @attr(unit=1)
+    def test_fixture_data_knows_its_worker(self):
+        os.environ['FIXTURE_WORKER'] = '2'
+        eq_(Fixture().data(CountryData).worker, '2')
+
+class TestWorkerDatabases(WorkerEnvironment):
+
+    def setUp(self):
+        if not env_supports.sqlalchemy:
+            raise SkipTest
+        WorkerEnvironment.setUp(self)
+        self.tmp = TempIO()
+        self.template = 'sqlite:///%s' % self.tmp.join('template.db')
+        self.databases = WorkerDatabases(self.template, populate)
+
+    @attr(functional=1)
+    def test_clones_have_common_data(self):
+        self.databases.prepare()
+        url_1 = self.databases.url('1')
+        url_2 = self.databases.url('2')
+        eq_(url_1, 'sqlite:///%s' % self.tmp.join('template_worker1.db'))
+        eq_(self.databases.url('1'), url_1)
+        assert url_1 != url_2
+        eq_(country_names(url_1), ['Canada'])
+
+        from sqlalchemy import create_engine
+        engine = create_engine(url_1)
+        engine.execute("DELETE FROM countries")
+        engine.dispose()
+        eq_(country_names(url_1), [])
+        eq_(country_names(url_2), ['Canada'])
+
+        self.databases.dispose()
+        eq_(sorted(os.listdir(self.tmp)), ['template.db'])
+
+    @attr(functional=1)
+    def test_template_is_prepared_for_first_clone(self):
+        os.environ['FIXTURE_WORKER'] = '5'
+        url = self.databases.url()
+        eq_(url, 'sqlite:///%s' % self.tmp.join('template_worker5.db'))
+        eq_(country_names(url), ['Canada'])
+
+    @attr(unit=1)
+    @raises(ValueError)
+    def test_memory_database_cannot_be_a_template(self):
+        WorkerDatabases('sqlite:///:memory:')
+
+    @attr(functional=1)
+    def test_plugin(self):
+        from optparse import OptionParser
+        plugin = FixtureWorkers()
+        parser = OptionParser()
+        plugin.addOptions(parser, env={})
+        options, args = parser.parse_args([
+            '--with-fixture-workers',
+            '--fixture-template=%s' % self.template,
+            '--fixture-populate=fixture.test.test_parallel:populate'])
+        plugin.configure(options, None)
+        plugin.begin()
+        os.environ['FIXTURE_WORKER'] = '1'
+        url = worker_url()
+        eq_(country_names(url), ['Canada'])
+        plugin.finalize(None)
+        eq_(sorted(os.listdir(self.tmp)), ['template.db'])
+
+    @attr(unit=1)
+    def test_worker_url_without_template(self):
+        os.environ.pop('FIXTURE_TEMPLATE_DSN', None)
+        eq_(worker_url(default='sqlite:///:memory:'), 'sqlite:///:memory:')
@@ -0,0 +1,46 @@
+
+from nose.tools import eq_, raises
+from fixture.style import *
+from fixture.style import OriginalStyle, camel_to_under
+from fixture.test import attr
+
+class ShoutingStyle(OriginalStyle):
+    def shout(self, name):
+        return name.upper()
+
+@attr(unit=1)
+def test_chained_styles_are_flattened():
+    style = (PaddedNameStyle(prefix='tbl') + NamedDataStyle()) + \
+                                            CamelAndUndersStyle()
+    eq_(len(style.styles), 3)
+    eq_(style.guess_storable_name('EmployeeData'), 'tblEmployee')
+    eq_(style.to_attr('EmployeeData'), 'tbl_employee')
+
+@attr(unit=1)
+def test_chained_style_chains_any_method():
+    style = ShoutingStyle() + ShoutingStyle()
+    eq_(style.shout('hey'), 'HEY')
+
+@attr(unit=1)
+@raises(AttributeError)
+def test_chained_style_cannot_chain_missing_method():
+    (OriginalStyle() + ShoutingStyle()).shout
+
+@attr(unit=1)
+def test_translator_remembers_translations():
+    calls = []
+    class CountingStyle(OriginalStyle):
+        def guess_storable_name(self, name):
+            calls.append(name)
+            return name
+    translate = (CountingStyle() + NamedDataStyle()).translator(
+                                                    'guess_storable_name')
+    eq_(translate('EmployeeData'), 'Employee')
+    eq_(translate('EmployeeData'), 'Employee')
+    eq_(calls, ['EmployeeData'])
+
+@attr(unit=1)
+def test_camel_to_under():
+    eq_(camel_to_under('EmployeeData'), 'employee_data')
+    eq_(camel_to_under('employee2Data'), 'employee_2_data')
+    eq_(camel_to_under(''), '')
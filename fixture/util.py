@@ -1,7 +1,9 @@
 
 """Fixture utilties."""
 
+import os
 import sys
+import tempfile
 import unittest
 import types
 import logging
@@ -28,20 +30,69 @@ class DataTestCase(object):
     ``data``
         ``self.data``, a :class:`Fixture.Data <fixture.base.FixtureData>` instance populated for you after ``setUp()``
     
+    ``scope``
+        None (the default) to load and unload the datasets around each test.  
+        ``'class'`` to load them once in ``setUpClass()`` and unload them in 
+        ``tearDownClass()``, or ``'module'`` to load them once for all 
+        DataTestCase classes of the module that use the same fixture and 
+        datasets (see :meth:`Fixture.scoped_data <fixture.base.Fixture.scoped_data>`; 
+        module data is torn down when other data is loaded, by calling 
+        ``fixture.teardown_scoped_data()``, i.e. in ``tearDownModule()``, or 
+        else when the interpreter exits).  
+        With a scope, ``self.data`` is shared by all tests and each test runs 
+        in a savepoint that is rolled back in ``tearDown()`` if the fixture 
+        supports savepoints.
+    
     """
     fixture = None
     data = None
     datasets = []
+    scope = None
+    _savepoint = None
+    
+    def setUpClass(cls):
+        if cls.scope is None:
+            return
+        DataTestCase._load_scoped_data(cls)
+    setUpClass = classmethod(setUpClass)
+    
+    def _load_scoped_data(cls):
+        if cls.fixture is None:
+            raise NotImplementedError("no concrete fixture to load data with")
+        if not cls.datasets:
+            raise ValueError("there are no datasets to load")
+        if cls.scope == 'class':
+            key = cls
+        else:
+            key = cls.__module__
+        cls.data = cls.fixture.scoped_data(cls.datasets, cls.scope, key)
+    _load_scoped_data = staticmethod(_load_scoped_data)
+    
+    def tearDownClass(cls):
+        if cls.scope == 'class':
+            cls.fixture.teardown_scoped_data('class', cls)
+            cls.data = None
+    tearDownClass = classmethod(tearDownClass)
+    
     def setUp(self):
         if self.fixture is None:
             raise NotImplementedError("no concrete fixture to load data with")
         if not self.datasets:
             raise ValueError("there are no datasets to load")
-        self.data = self.fixture.data(*self.datasets)
-        self.data.setup()
+        if self.scope is None:
+            self.data = self.fixture.data(*self.datasets)
+            self.data.setup()
+            return
+        # without a test runner that calls setUpClass (python < 2.7) 
+        # the data is loaded for the first test :
+        DataTestCase._load_scoped_data(self.__class__)
+        self._savepoint = self.data.savepoint()
     
     def tearDown(self):
-        self.data.teardown()
+        if self.scope is None:
+            self.data.teardown()
+        elif self._savepoint is not None:
+            self._savepoint.rollback()
 
 class ObjRegistry:
     """registers objects by class.
@@ -91,6 +142,11 @@ class ObjRegistry:
         id = self.id(object)
         self.registry[id] = object
         return id
+    
+    def remove(self, object):
+        id = self.id(object)
+        del self.registry[id]
+        return id
 
 def with_debug(*channels, **kw):
     """
@@ -202,6 +258,32 @@ def _mklog(channel, default_level=logging.CRITICAL, default_stream=None):
     log.addHandler(default_stream)
     return log
 
+def atomic_write(path, data):
+    """writes data (a str) to path so that readers never see a partial file.
+    
+    The data goes to a temporary file in the same directory which is then 
+    renamed over path.  The last of several concurrent writers wins.
+    """
+    dirname = os.path.dirname(path) or os.curdir
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        try:
+            written = 0
+            while written < len(data):
+                # os.write() may write less than it was given
+                written += os.write(fd, data[written:])
+        finally:
+            os.close(fd)
+        if sys.platform == 'win32' and os.path.exists(path):
+            # rename cannot replace a file on windows
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except:
+        etype, val, tb = sys.exc_info()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise etype, val, tb
+
 try:
     any = any
 except NameError:
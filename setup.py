@@ -69,7 +69,9 @@ setup(
     
     test_suite="fixture.setup_test_not_supported",
     entry_points = { 
-        'console_scripts': [ 'fixture = fixture.command.generate:main' ] 
+        'console_scripts': [ 'fixture = fixture.command.generate:main' ],
+        'nose.plugins.0.10': [ 
+            'fixture-workers = fixture.parallel:FixtureWorkers' ],
         },
     # the following allows e.g. easy_install fixture[django]
     extras_require = {
@@ -2,6 +2,11 @@
 nose plugin for easy testing of django projects and apps. Sets up a test
 database (or schema) and installs apps from test settings file before tests
 are run, and tears the test database (or schema) down after all tests are run.
+
+With --django-template-data, DataSets common to all tests are loaded once 
+into the test database, which then serves as the template that 
+fixture.parallel.WorkerDatabases clones a database from for each worker 
+process.  With --django-reset-per-test every test starts from a fresh clone.
 """
 
 import os, sys
@@ -15,6 +20,52 @@ os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
 
 SETTINGS_PATH = None
 
+def import_datasets(names):
+    """imports DataSet classes named like "myapp.tests.fixtures.UserData", 
+    separated by commas.
+    """
+    datasets = []
+    for name in names.split(','):
+        module, class_name = name.strip().rsplit('.', 1)
+        __import__(module)
+        datasets.append(getattr(sys.modules[module], class_name))
+    return datasets
+
+def database_url(name):
+    """returns the SQLAlchemy URL of the Django database called name, to 
+    clone with fixture.parallel.WorkerDatabases.
+    """
+    from django.conf import settings
+    from sqlalchemy.engine.url import URL
+    if settings.DATABASE_ENGINE == 'sqlite3':
+        if name in ('', ':memory:'):
+            raise ValueError(
+                "an in-memory database cannot be a template "
+                "(set TEST_DATABASE_NAME in your settings)")
+        return "sqlite:///%s" % name
+    if settings.DATABASE_ENGINE.startswith('postgresql'):
+        return str(URL('postgres', 
+                       username=settings.DATABASE_USER or None,
+                       password=settings.DATABASE_PASSWORD or None, 
+                       host=settings.DATABASE_HOST or None,
+                       port=settings.DATABASE_PORT or None, 
+                       database=name))
+    raise ValueError(
+        "cannot clone %s databases, only sqlite3 and postgresql ones" % (
+                                                    settings.DATABASE_ENGINE))
+
+def use_database(name):
+    """closes the connection so that the next query connects to the 
+    database called name
+    """
+    from django.conf import settings
+    from django.db import connection
+    connection.close()
+    settings.DATABASE_NAME = name
+    if hasattr(connection, 'settings_dict'):
+        # django 1.1 keeps its own copy
+        connection.settings_dict['DATABASE_NAME'] = name
+
 class NoseDjango(Plugin):
     """
     Enable to set up django test environment before running all tests, and
@@ -77,7 +128,27 @@ class NoseDjango(Plugin):
 
         # setup the test env for each test case
         setup_test_environment()
-        connection.creation.create_test_db(verbosity=self.verbosity)
+        
+        self.databases = None
+        self.test_db = None
+        if self.options.django_template_data:
+            from fixture.parallel import WorkerDatabases
+            self.test_db = os.environ.get('NOSE_DJANGO_TEMPLATE_DB')
+            if self.test_db is None:
+                # the main process, where worker processes started by 
+                # --processes inherit the environment from :
+                self.test_db = connection.creation.create_test_db(
+                                                    verbosity=self.verbosity)
+                from fixture import DjangoFixture
+                DjangoFixture().data(
+                    *import_datasets(self.options.django_template_data)).setup()
+                # PostgreSQL refuses CREATE DATABASE ... TEMPLATE while 
+                # anyone, like this process, is connected to the template :
+                connection.close()
+                os.environ['NOSE_DJANGO_TEMPLATE_DB'] = self.test_db
+            self.databases = WorkerDatabases(database_url(self.test_db))
+        else:
+            connection.creation.create_test_db(verbosity=self.verbosity)
 
         # exit the setup phase and let nose do it's thing
     
@@ -86,12 +157,35 @@ class NoseDjango(Plugin):
         parser.add_option('--django-settings-path', action="store", help=(
             "Path to where your app's settings.py is stored.  I.E. the directory settings.py lives in."
         ))
+        parser.add_option('--django-template-data', action="store", 
+            default=env.get('NOSE_DJANGO_TEMPLATE_DATA'), help=(
+            "DataSet classes to load once into a template of the test database, "
+            "comma separated.  I.E. myapp.tests.fixtures.UserData "
+            "[NOSE_DJANGO_TEMPLATE_DATA]"
+        ))
+        parser.add_option('--django-reset-per-test', action="store_true", 
+            default=False, help=(
+            "Restore the test database from the template before each test"
+        ))
             
     def beforeTest(self, test):
 
         if not SETTINGS_PATH:
             # short circuit if no settings file can be found
             return
+        
+        if self.databases is not None:
+            # tests never run in the template, each worker process 
+            # (the main process is worker 0) gets a clone of its own :
+            from fixture.parallel import current_worker
+            from django.conf import settings
+            worker = current_worker() or '0'
+            name = self.databases.database_name(worker)
+            if (self.options.django_reset_per_test or 
+                                        settings.DATABASE_NAME != name):
+                use_database(self.test_db)
+                self.databases.clone(worker)
+                use_database(name)
 
         # This is a distinctive difference between the NoseDjango
         # test runner compared to the plain Django test runner.
@@ -139,6 +233,11 @@ class NoseDjango(Plugin):
         from django.test.utils import teardown_test_environment
         from django.db import connection
         from django.conf import settings
+        if self.databases is not None:
+            # drops the clones of all workers :
+            use_database(self.test_db)
+            self.databases.dispose()
+            del os.environ['NOSE_DJANGO_TEMPLATE_DB']
         connection.creation.destroy_test_db(self.old_db, verbosity=self.verbosity)   
         teardown_test_environment()
 